@@ -1,4 +1,5 @@
 #include <WiFi.h>
+#include <WiFiUdp.h>
 #include <ArduinoJson.h>
 
 // Configuración de WiFi - ¡ACTUALIZA ESTOS VALORES!
@@ -16,6 +17,36 @@ bool ledState = false;
 float currentFrequency = 1.0;
 unsigned long previousMillis = 0;
 
+// Protocolo binario (ver esp32_protocol.py), negociado con "PROTO:BIN1"
+const uint8_t FRAME_MAGIC = 0xA5;
+const int MAX_BATCH = 32;
+enum Opcode : uint8_t { OP_UNKNOWN, OP_LED_ON, OP_LED_OFF, OP_FREQ, OP_FREQ_UP, OP_FREQ_DOWN,
+                        OP_FREQ_FAST, OP_FREQ_SLOW, OP_STATUS };
+enum Status : uint8_t { STATUS_OK, STATUS_UNKNOWN, STATUS_RANGE };
+struct __attribute__((packed)) CommandRecord { uint8_t op; uint16_t seq; float arg; };
+struct __attribute__((packed)) ResponseRecord { uint8_t status; uint16_t seq; uint8_t flags; float value; };
+bool binaryMode = false;
+
+// Canal UDP (ver esp32_udp.py): mismos registros, datagrama con sesión del cliente
+WiFiUDP udp;
+const uint8_t UDP_MAGIC = 0xA6;
+const int UDP_WINDOW = 32;
+uint16_t udpSession = 0;
+IPAddress udpPeer;
+bool udpSessionValid = false;
+// Últimas secuencias aplicadas: un reenvío recibe la respuesta guardada
+ResponseRecord udpApplied[UDP_WINDOW];
+int udpAppliedCount = 0;
+int udpAppliedNext = 0;
+// Última secuencia aplicada sobre el LED y sobre la frecuencia
+uint16_t ledSeq = 0, freqSeq = 0;
+bool ledSeqValid = false, freqSeqValid = false;
+
+// Anuncio por difusión para discovery.py: "ESP32 listo id=<MAC> port=1234"
+const int beaconPort = 1235;
+const unsigned long BEACON_INTERVAL = 2000;
+unsigned long lastBeacon = 0;
+
 void setup() {
   Serial.begin(115200);
   
@@ -59,7 +90,8 @@ void setup() {
   
   // Iniciar servidor
   server.begin();
-  Serial.println("✅ Servidor iniciado");
+  udp.begin(serverPort);
+  Serial.println("✅ Servidor iniciado (TCP y UDP)");
   Serial.println("📋 Esperando comandos...");
   Serial.println("Comandos disponibles: LED_ON, LED_OFF, FREQ:X.X");
 }
@@ -82,13 +114,18 @@ void loop() {
   if (!client || !client.connected()) {
     client = server.available();
     if (client) {
+      binaryMode = false;
       Serial.println("✅ Cliente conectado");
-      client.println("ESP32 listo - Envía JSON con comando 'command'");
+      // La MAC al final identifica a la placa aunque cambie su IP
+      client.print("ESP32 listo - Envía JSON con comando 'command' id=");
+      client.println(WiFi.macAddress());
     }
   }
   
   // Procesar datos recibidos
-  if (client && client.available()) {
+  if (binaryMode) {
+    processBinary();
+  } else if (client && client.available()) {
     String message = client.readStringUntil('\n');
     message.trim();
     
@@ -97,6 +134,13 @@ void loop() {
     
     processMessage(message);
   }
+
+  processUdp();
+
+  if (currentMillis - lastBeacon >= BEACON_INTERVAL) {
+    lastBeacon = currentMillis;
+    sendBeacon();
+  }
   
   // Pequeño delay para evitar sobrecarga
   delay(10);
@@ -118,7 +162,12 @@ void processMessage(String jsonMessage) {
   Serial.println(command);
   
   // Procesar comandos
-  if (strcmp(command, "LED_ON") == 0) {
+  if (strcmp(command, "PROTO:BIN1") == 0) {
+    binaryMode = true;
+    Serial.println("📦 Protocolo binario activado");
+    client.println("OK: PROTO BIN1");
+  }
+  else if (strcmp(command, "LED_ON") == 0) {
     digitalWrite(ledPin, HIGH);
     Serial.println("💡 LED encendido");
     client.println("OK: LED encendido");
@@ -183,4 +232,169 @@ void processMessage(String jsonMessage) {
     Serial.println("❌ Comando desconocido");
     client.println("ERROR: Comando desconocido");
   }
-}
\ No newline at end of file
+}
+
+// Aplica un comando binario; mismo efecto que su equivalente JSON
+uint8_t applyOp(uint8_t op, float arg) {
+  switch (op) {
+    case OP_LED_ON:
+      digitalWrite(ledPin, HIGH);
+      return STATUS_OK;
+    case OP_LED_OFF:
+      digitalWrite(ledPin, LOW);
+      return STATUS_OK;
+    case OP_FREQ:
+      if (arg >= 0 && arg <= 10) {
+        currentFrequency = arg;
+        return STATUS_OK;
+      }
+      return STATUS_RANGE;
+    case OP_FREQ_UP:
+      currentFrequency = min(10.0, currentFrequency + 0.5);
+      return STATUS_OK;
+    case OP_FREQ_DOWN:
+      currentFrequency = max(0.0, currentFrequency - 0.5);
+      return STATUS_OK;
+    case OP_FREQ_FAST:
+      currentFrequency = 5.0;
+      return STATUS_OK;
+    case OP_FREQ_SLOW:
+      currentFrequency = 1.0;
+      return STATUS_OK;
+    case OP_STATUS:
+      return STATUS_OK;
+    default:
+      return STATUS_UNKNOWN;
+  }
+}
+
+// Lee una trama de peticiones y responde con una trama con el estado de cada una
+void processBinary() {
+  if (!client || client.available() < 3) {
+    return;
+  }
+  uint8_t header[3];
+  client.readBytes(header, 3);
+  uint16_t length = header[1] | (header[2] << 8);
+  if (header[0] != FRAME_MAGIC || length % sizeof(CommandRecord) != 0
+      || length / sizeof(CommandRecord) > MAX_BATCH) {
+    Serial.println("❌ Trama inválida, se cierra la conexión");
+    client.stop();
+    return;
+  }
+
+  CommandRecord requests[MAX_BATCH];
+  ResponseRecord responses[MAX_BATCH];
+  int count = length / sizeof(CommandRecord);
+  if (client.readBytes((uint8_t*)requests, length) != length) {
+    client.stop();
+    return;
+  }
+  for (int i = 0; i < count; i++) {
+    responses[i].status = applyOp(requests[i].op, requests[i].arg);
+    responses[i].seq = requests[i].seq;
+    responses[i].flags = ledState ? 1 : 0;
+    responses[i].value = currentFrequency;
+  }
+
+  uint16_t replyLength = count * sizeof(ResponseRecord);
+  uint8_t replyHeader[3] = {FRAME_MAGIC, (uint8_t)(replyLength & 0xFF), (uint8_t)(replyLength >> 8)};
+  client.write(replyHeader, 3);
+  client.write((uint8_t*)responses, replyLength);
+  Serial.print("📦 Trama con ");
+  Serial.print(count);
+  Serial.println(" comandos");
+}
+
+// Anuncia la placa a toda la red local (discovery.py la encuentra sin barrer la red)
+void sendBeacon() {
+  udp.beginPacket(WiFi.broadcastIP(), beaconPort);
+  udp.print("ESP32 listo id=");
+  udp.print(WiFi.macAddress());
+  udp.print(" port=");
+  udp.print(serverPort);
+  udp.endPacket();
+}
+
+// True si la secuencia a es posterior a b (módulo 2^16)
+bool seqNewer(uint16_t a, uint16_t b) {
+  return a != b && (uint16_t)(a - b) < 0x8000;
+}
+
+// Aplica una petición UDP una sola vez: un reenvío devuelve la respuesta
+// guardada y un comando absoluto más viejo que el último aplicado sobre lo mismo
+// (llegó desordenado) se confirma sin aplicarlo
+ResponseRecord applyUdp(const CommandRecord& request) {
+  for (int i = 0; i < udpAppliedCount; i++) {
+    if (udpApplied[i].seq == request.seq) {
+      return udpApplied[i];
+    }
+  }
+  ResponseRecord response;
+  response.seq = request.seq;
+  bool isLed = request.op == OP_LED_ON || request.op == OP_LED_OFF;
+  // Solo los absolutos; FREQ_UP/FREQ_DOWN se aplican siempre (una vez)
+  bool isFreq = request.op == OP_FREQ || request.op == OP_FREQ_FAST || request.op == OP_FREQ_SLOW;
+  if ((isLed && ledSeqValid && seqNewer(ledSeq, request.seq))
+      || (isFreq && freqSeqValid && seqNewer(freqSeq, request.seq))) {
+    response.status = STATUS_OK;
+  } else {
+    response.status = applyOp(request.op, request.arg);
+    if (isLed) {
+      ledSeq = request.seq;
+      ledSeqValid = true;
+    } else if (isFreq) {
+      freqSeq = request.seq;
+      freqSeqValid = true;
+    }
+  }
+  response.flags = ledState ? 1 : 0;
+  response.value = currentFrequency;
+  udpApplied[udpAppliedNext] = response;
+  udpAppliedNext = (udpAppliedNext + 1) % UDP_WINDOW;
+  if (udpAppliedCount < UDP_WINDOW) {
+    udpAppliedCount++;
+  }
+  return response;
+}
+
+// Lee un datagrama de peticiones y responde con un registro por petición
+void processUdp() {
+  int size = udp.parsePacket();
+  if (size <= 0) {
+    return;
+  }
+  uint8_t packet[3 + MAX_BATCH * sizeof(CommandRecord)];
+  if (size > (int)sizeof(packet)) {
+    udp.flush();
+    return;
+  }
+  int length = udp.read(packet, sizeof(packet));
+  if (length < 3 || packet[0] != UDP_MAGIC || (length - 3) % sizeof(CommandRecord) != 0) {
+    return;
+  }
+  uint16_t session = packet[1] | (packet[2] << 8);
+  if (!udpSessionValid || session != udpSession || udp.remoteIP() != udpPeer) {
+    // Cliente o sesión nueva: se olvidan las secuencias de la anterior
+    udpSession = session;
+    udpPeer = udp.remoteIP();
+    udpSessionValid = true;
+    udpAppliedCount = udpAppliedNext = 0;
+    ledSeqValid = freqSeqValid = false;
+    Serial.println("✅ Sesión UDP nueva");
+  }
+
+  int count = (length - 3) / sizeof(CommandRecord);
+  CommandRecord requests[MAX_BATCH];
+  ResponseRecord responses[MAX_BATCH];
+  memcpy(requests, packet + 3, count * sizeof(CommandRecord));
+  for (int i = 0; i < count; i++) {
+    responses[i] = applyUdp(requests[i]);
+  }
+
+  // Un datagrama sin peticiones es un saludo: se responde igual (keepalive)
+  udp.beginPacket(udp.remoteIP(), udp.remotePort());
+  udp.write(packet, 3);
+  udp.write((uint8_t*)responses, count * sizeof(ResponseRecord));
+  udp.endPacket();
+}
@@ -0,0 +1,65 @@
+"""Benchmark de la cola con estado (command_queue.py) ante ráfagas de comandos.
+
+Envía a una placa emulada ráfagas como las que produce la voz ("subir
+frecuencia" varias veces, "encender" repetido...) con la cola y sin ella
+(coalesce=False) y compara los comandos que llegan a la placa y el tiempo
+hasta tener todas las respuestas.
+
+Uso:
+    python benchmarks/bench_command_queue.py --bursts 20 --latency 0.02
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from devices import DevicePool, DeviceRegistry
+from esp32_emulator import ESP32Emulator
+from recognizers import percentile
+
+BURSTS = [["FREQ_UP"] * 4, ["FREQ_DOWN"] * 3, ["LED_ON", "LED_ON"], ["LED_OFF"],
+          ["FREQ_UP", "FREQ_UP", "FREQ_DOWN"], ["FREQ:2", "FREQ_UP"], ["FREQ_FAST", "FREQ_SLOW"]]
+
+
+def run(coalesce, bursts, latency, seed):
+    emulator = ESP32Emulator(port=0, latency=latency)
+    host, port = emulator.start_in_thread()
+    with tempfile.TemporaryDirectory() as directory:
+        registry = DeviceRegistry(os.path.join(directory, "dispositivos.json"))
+        registry.add("placa", host, port)
+        pool = DevicePool(registry, timeout=5, coalesce=coalesce)
+        pool.broadcast("placa", "STATUS")
+        messages = emulator.stats["messages"]
+        rng = random.Random(seed)
+        samples, failures = [], 0
+        for _ in range(bursts):
+            burst = rng.choice(BURSTS)
+            started = time.perf_counter()
+            futures = [pool.send("placa", command)["placa"] for command in burst]
+            failures += sum(1 for future in futures if not future.result().ok)
+            samples.append(time.perf_counter() - started)
+        sent = emulator.stats["messages"] - messages
+        pool.close()
+    emulator.stop()
+    return samples, sent, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ráfagas de comandos con y sin la cola con estado")
+    parser.add_argument("--bursts", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.02, help="Latencia del emulador (s)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    for label, coalesce in (("con cola", True), ("directo", False)):
+        samples, sent, failures = run(coalesce, args.bursts, args.latency, args.seed)
+        print(f"{label:<9} comandos a la placa {sent:4d}   ráfaga p50 {percentile(samples, 0.50) * 1000:7.1f} ms"
+              f"   p95 {percentile(samples, 0.95) * 1000:7.1f} ms   fallos {failures}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""Benchmark de la búsqueda de placas (discovery.py): barrido en paralelo contra secuencial.
+
+Levanta N emuladores en direcciones de loopback (127.0.0.x, todas en el
+mismo puerto) y, para imitar los equipos de la red que no contestan,
+--silent sockets que aceptan la conexión pero nunca saludan (cada uno
+agota el plazo de la prueba). Barre la /24 entera con todas las pruebas a
+la vez y de a una (--concurrency 1 en discovery.scan), y mide la
+revalidación de las direcciones ya guardadas.
+
+Uso:
+    python benchmarks/bench_discovery.py --devices 8 --silent 20 --timeout 0.5
+"""
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from discovery import network_hosts, scan
+from esp32_emulator import ESP32Emulator
+
+
+def measure(hosts, port, timeout, concurrency):
+    started = time.perf_counter()
+    found = asyncio.run(scan(hosts, port, timeout, concurrency))
+    return time.perf_counter() - started, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Búsqueda de placas ESP32 en una red /24")
+    parser.add_argument("--devices", type=int, default=8)
+    parser.add_argument("--silent", type=int, default=20, help="Equipos que no saludan")
+    parser.add_argument("--port", type=int, default=41234)
+    parser.add_argument("--timeout", type=float, default=0.5, help="Plazo por dirección (s)")
+    parser.add_argument("--sequential", action="store_true", help="Medir también de a una dirección")
+    args = parser.parse_args()
+
+    emulators, silent = [], []
+    for n in range(args.devices):
+        emulator = ESP32Emulator(host=f"127.0.0.{n + 2}", port=args.port,
+                                 device_id=f"02:00:00:00:00:{n:02X}")
+        emulator.start_in_thread()
+        emulators.append(emulator)
+    for n in range(args.silent):
+        listener = socket.create_server((f"127.0.0.{args.devices + n + 2}", args.port))
+        silent.append(listener)
+
+    hosts = network_hosts("127.0.0.0/24")
+    elapsed, found = measure(hosts, args.port, args.timeout, 256)
+    print(f"barrido /24 en paralelo   {elapsed * 1000:8.0f} ms   placas {len(found)}")
+    cached = [board.address for board in found]
+    elapsed, found = measure(cached, args.port, args.timeout, 256)
+    print(f"revalidación de la caché  {elapsed * 1000:8.0f} ms   placas {len(found)}")
+    if args.sequential:
+        elapsed, found = measure(hosts, args.port, args.timeout, 1)
+        print(f"barrido /24 secuencial    {elapsed * 1000:8.0f} ms   placas {len(found)}")
+
+    for listener in silent:
+        listener.close()
+    for emulator in emulators:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
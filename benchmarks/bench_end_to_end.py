@@ -0,0 +1,447 @@
+"""Benchmark de extremo a extremo: del fin de la voz al acuse del ESP32.
+
+Reproduce un corpus de WAV etiquetados por el mismo camino que prueba3.py
+(segmentación con VAD -> preprocesado -> reconocimiento -> búsqueda del
+comando -> DevicePool.send) con sustitutos locales: el reconocedor
+"replay" de recognizers.py (transcripciones grabadas, latencia simulada)
+y el emulador del firmware (esp32_emulator.py). Las frases se encadenan
+en un solo flujo de audio que se entrega en bloques al ritmo de un
+micrófono y se corta con StreamingVAD con las opciones de
+VADMicrophoneSource, así que la espera del silencio final (hangover)
+cuenta en la latencia. Los comandos salen por DevicePool con las mismas
+opciones que prueba3.py (timeout de 5 s, cola con fusión y ritmo mínimo,
+plazo de 3 s desde la frase y prioridad para los de seguridad). Informa
+rendimiento, latencia p50/p95/p99 de cada etapa y aciertos de comando, y
+guarda todo en JSON para comparar entre commits.
+
+El manifiesto es una lista JSON de {"file": "x.wav", "text": "encender
+el led", "command": "LED_ON"} (command null = no es un comando; si falta se
+deduce del texto). Sin manifiesto se genera un corpus sintético. Con
+--speed 0 el audio se entrega sin esperas: la segmentación mide entonces
+solo el tiempo de CPU del VAD y no la cola de silencio.
+
+Uso:
+    python benchmarks/bench_end_to_end.py --synthetic 50 --output resultados.json
+    python benchmarks/bench_end_to_end.py corpus/etiquetas.json --preprocess --workers 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+import numpy as np
+import speech_recognition as sr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from audio_preprocess import AudioPreprocessor
+from commands import ESP32_REGISTRY, is_safety_command
+from devices import ALL, EXPIRED, DevicePool, DeviceRegistry
+from esp32_emulator import ESP32Emulator
+from metrics import METRICS
+from recognizers import ReplayBackend, percentile
+from vad import StreamingVAD
+from voice_engine import (VoiceEngine, EVENT_COMMAND, EVENT_NO_COMMAND, EVENT_NOT_UNDERSTOOD,
+                          EVENT_ERROR, EVENT_EXPIRED)
+
+SYNTHETIC_PHRASES = ["encender el led", "apagar el led", "subir frecuencia", "bajar frecuencia",
+                     "frecuencia rápida", "frecuencia lenta", "frecuencia a 3", "frecuencia a 7.5",
+                     "estado", "hola qué tal"]
+
+STAGES = ["segmentation", "queue", "preprocess", "recognition", "match", "delivery", "device",
+          "end_to_end"]
+
+# Opciones de prueba3.py: DevicePool(timeout=5) y VoiceEngine(command_deadline=COMMAND_DEADLINE)
+POOL_TIMEOUT = 5.0
+COMMAND_DEADLINE = 3.0
+
+# Muestras por bloque leído del micrófono (sr.Microphone, chunk_size por defecto)
+CHUNK = 1024
+
+
+def expected_command(text):
+    match = ESP32_REGISTRY.match(text)
+    return match.command if match else None
+
+
+def synthetic_corpus(directory, count, sample_rate=44100, seed=0):
+    """WAV con ruido y un tono distinto por archivo (cada uno con huella única)"""
+    rng = np.random.default_rng(seed)
+    entries = []
+    for n in range(count):
+        text = SYNTHETIC_PHRASES[n % len(SYNTHETIC_PHRASES)]
+        seconds = 0.6 + 0.4 * rng.random()
+        t = np.arange(int(sample_rate * seconds)) / sample_rate
+        tone = 4000 * np.sin(2 * np.pi * (150 + n) * t)
+        silence = lambda s: rng.normal(0, 60, int(sample_rate * s))
+        samples = np.concatenate([silence(0.3), tone, silence(0.4)]).astype(np.int16)
+        name = f"frase_{n:05d}.wav"
+        with wave.open(os.path.join(directory, name), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(samples.tobytes())
+        entries.append({"file": name, "text": text, "command": expected_command(text)})
+    path = os.path.join(directory, "etiquetas.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(entries, f, ensure_ascii=False)
+    return path
+
+
+def load_corpus(manifest):
+    base = os.path.dirname(os.path.abspath(manifest))
+    with open(manifest, encoding="utf-8") as f:
+        entries = json.load(f)
+    for entry in entries:
+        entry["path"] = os.path.join(base, entry["file"])
+        if "command" not in entry:
+            entry["command"] = expected_command(entry["text"])
+    return entries
+
+
+def corpus_stream(entries, sample_rate, gap, seed=0):
+    """PCM continuo con las frases separadas por gap segundos de ruido de fondo"""
+    rng = np.random.default_rng(seed)
+    recognizer = sr.Recognizer()
+    parts = []
+    for entry in entries:
+        with sr.AudioFile(entry["path"]) as source:
+            audio = recognizer.record(source)
+        parts.append(audio.get_raw_data(convert_rate=sample_rate, convert_width=2))
+        parts.append(rng.normal(0, 60, int(sample_rate * gap)).astype(np.int16).tobytes())
+    return b"".join(parts)
+
+
+class PacedVADSource:
+    """Flujo PCM entregado al ritmo de un micrófono y segmentado con StreamingVAD.
+
+    Como VADMicrophoneSource, pero leyendo de memoria: cada bloque de CHUNK
+    muestras se entrega cuando el micrófono habría terminado de grabarlo
+    (speed veces más rápido; 0 = sin esperas). Para cada frase anota cuándo
+    terminó la voz y cuándo la entregó el VAD.
+    """
+
+    def __init__(self, pcm, sample_rate=16000, energy_threshold=300, speed=1.0, **vad_options):
+        self.pcm = pcm
+        self.sample_rate = sample_rate
+        self.energy_threshold = energy_threshold
+        self.speed = speed
+        self.vad_options = vad_options
+        self.timings = []
+
+    @property
+    def live(self):
+        # Al ritmo del micrófono el motor descarta frases si se llena la cola, como en vivo
+        return self.speed > 0
+
+    def _vad(self):
+        # Umbral fijo (sin NoiseFloorTracker): los cortes son los mismos en cada pasada
+        return StreamingVAD(sample_rate=self.sample_rate, energy_threshold=self.energy_threshold,
+                            **self.vad_options)
+
+    def _chunks(self):
+        step = CHUNK * 2
+        for offset in range(0, len(self.pcm), step):
+            yield self.pcm[offset:offset + step]
+
+    def segments(self):
+        """Frases que entregará el VAD, sin esperas (para registrar sus transcripciones)"""
+        vad = self._vad()
+        return [pcm for chunk in self._chunks() for pcm in vad.feed(chunk)]
+
+    def utterances(self, recognizer, stop_event):
+        vad = self._vad()
+        rate = self.sample_rate * self.speed
+        started = time.perf_counter()
+        received = 0
+        for chunk in self._chunks():
+            if stop_event.is_set():
+                return
+            received += len(chunk) // 2
+            if rate:
+                delay = started + received / rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            arrived = time.perf_counter()
+            for pcm in vad.feed(chunk):
+                emitted = time.perf_counter()
+                if rate:
+                    # La voz terminó al llegar el bloque con su última trama
+                    end = vad.last_speech_end * vad.frame_samples
+                    speech_end = started + -(-end // CHUNK) * CHUNK / rate
+                else:
+                    speech_end = arrived
+                self.timings.append((speech_end, emitted))
+                yield sr.AudioData(pcm, self.sample_rate, 2)
+
+
+class TracedPipeline:
+    """Envuelve fuente, preprocesado, reconocedor y búsqueda para medir cada etapa.
+
+    Las frases se identifican por el objeto de audio (el motor numera las
+    frases en orden de captura, igual que aquí), y la búsqueda del comando
+    corre en el mismo hilo que el reconocimiento de su frase.
+    """
+
+    def __init__(self, source, backend, preprocess):
+        self.source = source
+        self.backend = backend
+        self._preprocess = preprocess
+        self.traces = []
+        self._by_audio = {}
+        self._local = threading.local()
+
+    @property
+    def live(self):
+        return self.source.live
+
+    def utterances(self, recognizer, stop_event):
+        for audio in self.source.utterances(recognizer, stop_event):
+            speech_end, emitted = self.source.timings[-1]
+            trace = {"speech_end_at": speech_end, "captured_at": emitted,
+                     "segmentation": emitted - speech_end}
+            self.traces.append(trace)
+            self._by_audio[id(audio)] = (trace, audio)
+            yield audio
+
+    def preprocess(self, audio):
+        trace = self._by_audio[id(audio)][0]
+        started = trace["started_at"] = time.perf_counter()
+        result = self._preprocess(audio) if self._preprocess else audio
+        trace["preprocess"] = time.perf_counter() - started
+        self._by_audio[id(result)] = (trace, result)
+        return result
+
+    def recognize(self, audio):
+        trace = self._by_audio[id(audio)][0]
+        self._local.trace = trace
+        started = time.perf_counter()
+        try:
+            return self.backend(audio)
+        finally:
+            trace["recognition"] = time.perf_counter() - started
+
+    def match(self, text):
+        trace = self._local.trace
+        started = time.perf_counter()
+        match = ESP32_REGISTRY.match(text)
+        trace["matched_at"] = time.perf_counter()
+        trace["match"] = trace["matched_at"] - started
+        return match
+
+
+def run(entries, args, directory):
+    recognizer = sr.Recognizer()
+    backend = ReplayBackend(recognizer=recognizer, latency=args.recognition_latency,
+                            jitter=args.recognition_jitter, error_rate=args.error_rate, seed=args.seed)
+    preprocess = AudioPreprocessor.for_backend(backend) if args.preprocess else None
+
+    played = entries * args.repeat
+    source = PacedVADSource(corpus_stream(played, args.sample_rate, args.gap, seed=args.seed),
+                            sample_rate=args.sample_rate, energy_threshold=args.energy_threshold,
+                            speed=args.speed, frame_ms=20, onset_ms=60, hangover_ms=args.hangover_ms,
+                            max_utterance_s=10)
+    segments = source.segments()
+    if len(segments) != len(played):
+        raise SystemExit(f"El VAD cortó {len(segments)} frases en {len(played)} archivos: "
+                         f"ajusta --energy-threshold o --gap")
+    # Las transcripciones se registran sobre el audio que recibirá el reconocedor
+    register = AudioPreprocessor.for_backend(backend) if args.preprocess else None
+    for pcm, entry in zip(segments, played):
+        audio = sr.AudioData(pcm, args.sample_rate, 2)
+        backend.add(register(audio) if register else audio, entry["text"])
+
+    emulator = ESP32Emulator(port=0, latency=args.esp32_latency, jitter=args.esp32_jitter,
+                             drop_rate=args.drop, seed=args.seed, udp=args.transport == "udp")
+    host, port = emulator.start_in_thread()
+    registry = DeviceRegistry(os.path.join(directory, "dispositivos.json"))
+    registry.add("emulador", host, port)
+    pool = DevicePool(registry, timeout=args.timeout, transport=args.transport)
+    pool.connect()
+
+    pipeline = TracedPipeline(source, backend, preprocess)
+    engine = VoiceEngine(recognizer=recognizer, recognize=pipeline.recognize,
+                         command_matcher=pipeline.match, preprocess=pipeline.preprocess,
+                         workers=args.workers, queue_size=args.queue_size,
+                         command_deadline=args.deadline)
+
+    outstanding = [0]
+    lock = threading.Lock()
+    all_acked = threading.Event()
+    all_acked.set()
+
+    def on_result(trace, sent, result):
+        now = time.perf_counter()
+        trace["device"] = now - sent
+        trace["done_at"] = now
+        trace["status"] = result.status
+        trace["response"] = result.response
+        if not result.ok:
+            trace["error"] = repr(result.error) if result.error else result.status
+        with lock:
+            outstanding[0] -= 1
+            if outstanding[0] == 0:
+                all_acked.set()
+
+    def on_command(event):
+        # Lo mismo que prueba3.handle_command -> send_to_esp32
+        trace = pipeline.traces[event.utterance_id]
+        trace["command"] = event.command
+        sent = time.perf_counter()
+        trace["delivery"] = sent - trace["matched_at"]
+        with lock:
+            outstanding[0] += 1
+            all_acked.clear()
+        pool.send(ALL, event.command, callback=lambda result: on_result(trace, sent, result),
+                  deadline=event.deadline, priority=is_safety_command(event.command))
+
+    def on_expired(event):
+        trace = pipeline.traces[event.utterance_id]
+        trace["command"] = event.command
+        trace["status"] = EXPIRED
+        trace["done_at"] = time.perf_counter()
+
+    def on_finished(event):
+        trace = pipeline.traces[event.utterance_id]
+        trace["command"] = None
+        trace["done_at"] = time.perf_counter()
+        if event.kind != EVENT_NO_COMMAND:
+            trace["error"] = repr(event.error) if event.error else "no se entendió"
+
+    engine.subscribe(EVENT_COMMAND, on_command)
+    engine.subscribe(EVENT_EXPIRED, on_expired)
+    engine.subscribe(EVENT_NO_COMMAND, on_finished)
+    engine.subscribe(EVENT_NOT_UNDERSTOOD, on_finished)
+    engine.subscribe(EVENT_ERROR, on_finished)
+
+    started = time.perf_counter()
+    engine.run(pipeline)
+    all_acked.wait(timeout=args.timeout + 5)
+    elapsed = time.perf_counter() - started
+    queues = pool.queue_stats()
+    pool.close()
+    emulator.stop()
+
+    return summarize(pipeline.traces, played, elapsed, preprocess, engine, queues)
+
+
+def summarize(traces, entries, elapsed, preprocess, engine, queues):
+    samples = {stage: [] for stage in STAGES}
+    statuses = {}
+    correct = acked = 0
+    for n, trace in enumerate(traces):
+        trace["queue"] = trace.get("started_at", trace["captured_at"]) - trace["captured_at"]
+        if "done_at" in trace:
+            trace["end_to_end"] = trace["done_at"] - trace["speech_end_at"]
+        for stage in STAGES:
+            if stage in trace:
+                samples[stage].append(trace[stage])
+        if n < len(entries) and trace.get("command") == entries[n]["command"] and "error" not in trace:
+            correct += 1
+        if "status" in trace:
+            statuses[trace["status"]] = statuses.get(trace["status"], 0) + 1
+        if trace.get("response") is not None:
+            acked += 1
+
+    stages = {}
+    for stage, values in samples.items():
+        stages[stage] = {
+            "count": len(values),
+            "mean_ms": sum(values) / len(values) * 1000 if values else 0.0,
+            "p50_ms": percentile(values, 0.50) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+        }
+    result = {
+        "utterances": len(traces),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(traces) / elapsed if elapsed else 0.0,
+        "commands_acked": acked,
+        "accuracy": correct / len(traces) if traces else 0.0,
+        "engine": engine.stats(),
+        "stages": stages,
+        # Resultado de cada comando (ACK, SKIPPED, EXPIRED...) y contadores de la cola de la placa
+        "statuses": statuses,
+        "device_queues": queues,
+    }
+    if preprocess is not None:
+        result["preprocess"] = preprocess.report()
+    # Las mismas etapas vistas desde la instrumentación del motor y del cliente
+    # (response = ida y vuelta a la placa, sin la espera en la cola)
+    result["metrics"] = METRICS.snapshot()
+    return result
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de extremo a extremo con corpus grabado")
+    parser.add_argument("manifest", nargs="?", help="Manifiesto JSON del corpus (sin él: sintético)")
+    parser.add_argument("--synthetic", type=int, default=50, help="Frases del corpus sintético")
+    parser.add_argument("--repeat", type=int, default=1, help="Veces que se reproduce el corpus")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Ritmo del audio respecto al tiempo real (0 = sin esperas)")
+    parser.add_argument("--sample-rate", type=int, default=16000)
+    parser.add_argument("--gap", type=float, default=0.5, help="Segundos de ruido entre frases")
+    parser.add_argument("--energy-threshold", type=float, default=300, help="Umbral del VAD")
+    parser.add_argument("--hangover-ms", type=int, default=300, help="Silencio que cierra una frase")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--queue-size", type=int, default=8)
+    parser.add_argument("--preprocess", action="store_true", help="Activar audio_preprocess")
+    parser.add_argument("--recognition-latency", type=float, default=0.05, help="Segundos por frase")
+    parser.add_argument("--recognition-jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de frases no entendidas")
+    parser.add_argument("--esp32-latency", type=float, default=0.005)
+    parser.add_argument("--esp32-jitter", type=float, default=0.002)
+    parser.add_argument("--drop", type=float, default=0.0, help="Respuestas perdidas en el emulador")
+    parser.add_argument("--timeout", type=float, default=POOL_TIMEOUT, help="Timeout de DevicePool")
+    parser.add_argument("--deadline", type=float, default=COMMAND_DEADLINE,
+                        help="Segundos tras los que un comando ya no se envía")
+    parser.add_argument("--transport", choices=["tcp", "udp"],
+                        default=os.environ.get("VOZ_ESP32_TRANSPORT", "tcp"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", metavar="ARCHIVO", help="Guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        manifest = args.manifest or synthetic_corpus(directory, args.synthetic, seed=args.seed)
+        entries = load_corpus(manifest)
+        result = run(entries, args, directory)
+
+    print(f"Frases: {result['utterances']} en {result['elapsed_s']:.2f} s "
+          f"({result['throughput_per_s']:.1f} frases/s), {result['commands_acked']} comandos confirmados")
+    print(f"Aciertos de comando: {result['accuracy']:.1%}")
+    print("Resultados de los envíos: " + ", ".join(f"{status} {count}"
+                                                    for status, count in sorted(result["statuses"].items())))
+    for name, stats in result["device_queues"].items():
+        print(f"Cola de {name}: enviados {stats['sent']}, omitidos {stats['skipped']}, "
+              f"juntados {stats['coalesced']}, vencidos {stats['expired']}, prioritarios {stats['priority']}")
+    print(f"{'etapa':<12}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for stage, stats in result["stages"].items():
+        print(f"{stage:<12}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+    if "preprocess" in result:
+        report = result["preprocess"]
+        print(f"Preprocesado: {report['bytes_saved']} bytes y {report['seconds_saved']:.1f} s ahorrados")
+
+    if args.output:
+        document = {"commit": git_commit(), "timestamp": time.time(),
+                    "config": {k: v for k, v in vars(args).items() if k != "output"},
+                    "result": result}
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(document, f, indent=2, ensure_ascii=False)
+        print(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
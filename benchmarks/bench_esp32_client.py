@@ -0,0 +1,87 @@
+"""Benchmark de esp32_client.ESP32Client contra el emulador local.
+
+Uso:
+    python benchmarks/bench_esp32_client.py --clients 8 --commands 500 --latency 0.002
+    python benchmarks/bench_esp32_client.py --protocol json   # sin tramas binarias
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from esp32_client import ESP32Client
+from esp32_emulator import ESP32Emulator
+
+COMMANDS = ["LED_ON", "LED_OFF", "FREQ:2.5", "FREQ_UP", "FREQ_DOWN", "STATUS"]
+
+
+def percentile(values, fraction):
+    """Percentil por el método del rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_client(host, port, commands, max_in_flight, protocol, latencies, errors, sent_bytes):
+    client = ESP32Client(host, port, timeout=5, max_in_flight=max_in_flight, protocol=protocol)
+    done = threading.Semaphore(0)
+
+    def on_done(future, sent_at):
+        if future.exception() is None:
+            latencies.append(time.perf_counter() - sent_at)
+        else:
+            errors.append(future.exception())
+        done.release()
+
+    for n in range(commands):
+        sent_at = time.perf_counter()
+        client.send(COMMANDS[n % len(COMMANDS)], callback=lambda f, t=sent_at: on_done(f, t))
+    for _ in range(commands):
+        done.acquire()
+    client.close()
+    sent_bytes.append(client.stats["bytes_sent"])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rendimiento y latencia del cliente ESP32")
+    parser.add_argument("--clients", type=int, default=4)
+    parser.add_argument("--commands", type=int, default=200, help="Comandos por cliente")
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--protocol", choices=("auto", "json"), default="auto",
+                        help="auto negocia las tramas binarias; json las desactiva")
+    args = parser.parse_args()
+
+    emulator = ESP32Emulator(port=0, latency=args.latency, jitter=args.jitter, shared_state=False)
+    host, port = emulator.start_in_thread()
+
+    latencies, errors, sent_bytes = [], [], []
+    threads = [threading.Thread(target=run_client,
+                                args=(host, port, args.commands, args.max_in_flight, args.protocol,
+                                      latencies, errors, sent_bytes))
+               for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    emulator.stop()
+
+    total = len(latencies)
+    print(f"Comandos: {total} correctos, {len(errors)} con error en {elapsed:.2f} s")
+    print(f"Rendimiento: {total / elapsed:.0f} comandos/s")
+    print(f"Bytes: {sum(sent_bytes)} enviados, {emulator.stats['bytes_out']} recibidos "
+          f"({emulator.stats['frames']} tramas binarias)")
+    for name, fraction in (("p50", 0.50), ("p95", 0.95), ("p99", 0.99)):
+        print(f"Latencia {name}: {percentile(latencies, fraction) * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Benchmark del envío a muchas placas: devices.DevicePool contra envío secuencial.
+
+Levanta N emuladores (uno por placa) y envía cada comando a todas: en
+paralelo con DevicePool.broadcast y, para comparar, placa por placa
+esperando cada respuesta, como haría un bucle sobre send_to_esp32.
+
+Uso:
+    python benchmarks/bench_fanout.py --devices 32 --rounds 20 --latency 0.02
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from devices import ALL, DevicePool, DeviceRegistry
+from esp32_emulator import ESP32Emulator
+from recognizers import percentile
+
+COMMANDS = ["LED_ON", "LED_OFF", "FREQ:2.5", "STATUS"]
+
+
+def measure(pool, names, rounds, sequential):
+    samples, failures = [], 0
+    for n in range(rounds):
+        command = COMMANDS[n % len(COMMANDS)]
+        started = time.perf_counter()
+        if sequential:
+            results = [pool.broadcast(name, command)[name] for name in names]
+        else:
+            results = list(pool.broadcast(ALL, command).values())
+        samples.append(time.perf_counter() - started)
+        failures += sum(1 for result in results if not result.ok)
+    return samples, failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Envío de un comando a muchas placas")
+    parser.add_argument("--devices", type=int, default=16)
+    parser.add_argument("--rounds", type=int, default=20, help="Comandos enviados a todas")
+    parser.add_argument("--latency", type=float, default=0.02, help="Latencia de cada emulador (s)")
+    parser.add_argument("--jitter", type=float, default=0.005)
+    args = parser.parse_args()
+
+    emulators = []
+    with tempfile.TemporaryDirectory() as directory:
+        registry = DeviceRegistry(os.path.join(directory, "dispositivos.json"))
+        for n in range(args.devices):
+            emulator = ESP32Emulator(port=0, latency=args.latency, jitter=args.jitter, seed=n)
+            host, port = emulator.start_in_thread()
+            emulators.append(emulator)
+            registry.add(f"placa{n:02d}", host, port)
+
+        # Sin la cola con estado: FREQ:2.5 repetido se omitiría y no se mediría el envío
+        pool = DevicePool(registry, timeout=5, coalesce=False)
+        pool.connect(ALL)
+        # Calentamiento: todas las conexiones abiertas antes de medir
+        pool.broadcast(ALL, "STATUS")
+        names = registry.resolve(ALL)
+
+        for label, sequential in (("en paralelo", False), ("secuencial", True)):
+            samples, failures = measure(pool, names, args.rounds, sequential)
+            print(f"{label:<12} p50 {percentile(samples, 0.50) * 1000:8.1f} ms   "
+                  f"p95 {percentile(samples, 0.95) * 1000:8.1f} ms   fallos {failures}")
+        pool.close()
+    for emulator in emulators:
+        emulator.stop()
+
+
+if __name__ == "__main__":
+    main()
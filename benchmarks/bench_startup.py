@@ -0,0 +1,102 @@
+"""Benchmark del tiempo de arranque de prueba1/2/3.
+
+Cada medición es un proceso nuevo (arranque en frío del intérprete) que se
+ejecuta en un directorio temporal vacío, sin caché de micrófonos ni
+historial previo. Mide la importación del módulo y, si hay pantalla, el
+tiempo hasta que la ventana se dibuja (VoiceRecognitionApp + root.update()).
+
+Uso:
+    python benchmarks/bench_startup.py --runs 5
+    python benchmarks/bench_startup.py --json startup.json --max-window-ms 1500
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = ["prueba1", "prueba2", "prueba3"]
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import {module} as app_module
+result = {{"import_ms": (time.perf_counter() - started) * 1000}}
+import tkinter as tk
+try:
+    root = tk.Tk()
+except tk.TclError:
+    root = None
+if root is not None:
+    started = time.perf_counter()
+    app = app_module.VoiceRecognitionApp(root)
+    root.update()
+    result["window_ms"] = (time.perf_counter() - started) * 1000
+    app.engine.stop()
+    app.history.close()
+    root.destroy()
+print("RESULT " + json.dumps(result))
+"""
+
+
+def measure(module, workdir):
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    started = time.perf_counter()
+    process = subprocess.run([sys.executable, "-c", PROBE.format(module=module)], cwd=workdir,
+                             env=env, capture_output=True, text=True)
+    total_ms = (time.perf_counter() - started) * 1000
+    if process.returncode != 0:
+        raise RuntimeError(f"{module} no arrancó:\n{process.stderr}")
+    line = next(line for line in process.stdout.splitlines() if line.startswith("RESULT "))
+    result = json.loads(line[len("RESULT "):])
+    result["process_ms"] = total_ms
+    return result
+
+
+def summarize(samples):
+    summary = {}
+    for key in samples[0]:
+        values = [sample[key] for sample in samples if key in sample]
+        summary[key] = {"median": statistics.median(values), "max": max(values)}
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de las aplicaciones")
+    parser.add_argument("apps", nargs="*", default=APPS)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--json", metavar="ARCHIVO", help="Guardar los resultados en JSON")
+    parser.add_argument("--max-window-ms", type=float, default=None,
+                        help="Falla (código 1) si la mediana hasta la ventana supera este valor")
+    args = parser.parse_args()
+
+    results = {}
+    failed = False
+    for module in args.apps:
+        samples = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                samples.append(measure(module, workdir))
+        summary = results[module] = summarize(samples)
+        parts = [f"{key} {value['median']:.0f} ms (máx {value['max']:.0f})" for key, value in summary.items()]
+        print(f"{module}: " + ", ".join(parts))
+        window = summary.get("window_ms")
+        if args.max_window_ms is not None and window and window["median"] > args.max_window_ms:
+            print(f"  ⚠ supera el límite de {args.max_window_ms:.0f} ms")
+            failed = True
+        if "window_ms" not in summary:
+            print("  (sin pantalla: solo se midió la importación)")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"runs": args.runs, "python": sys.version.split()[0], "results": results}, f, indent=2)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
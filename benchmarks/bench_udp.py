@@ -0,0 +1,81 @@
+"""Benchmark del canal UDP (esp32_udp.py) contra TCP en una WiFi con pérdidas.
+
+Envía comandos a ritmo fijo (como llegan de la voz, sin esperar la
+respuesta anterior) por TCP (esp32_client.ESP32Client) y por UDP
+(esp32_udp.UDPClient) a un emulador que pierde paquetes con probabilidad
+--loss. En TCP cada pérdida cuesta un RTO del sistema y bloquea lo que
+viene detrás; en UDP solo se reenvía el comando perdido.
+
+Uso:
+    python benchmarks/bench_udp.py --commands 200 --loss 0.05 --latency 0.005
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from esp32_client import ESP32Client
+from esp32_emulator import ESP32Emulator
+from esp32_udp import UDPClient
+from recognizers import percentile
+
+COMMANDS = ["LED_ON", "FREQ_UP", "LED_OFF", "FREQ_DOWN", "STATUS"]
+
+
+def run(client_class, args):
+    emulator = ESP32Emulator(port=0, latency=args.latency, jitter=args.jitter, udp=True,
+                             loss=args.loss, tcp_rto=args.tcp_rto, seed=args.seed)
+    host, port = emulator.start_in_thread()
+    client = client_class(host, port, timeout=5)
+    client.start()
+    # Calentamiento: conexión abierta (y protocolo negociado) antes de medir
+    client.send("STATUS").result(timeout=10)
+
+    latencies, failures = [], []
+    done = threading.Semaphore(0)
+
+    def on_done(future, sent_at):
+        if future.exception() is None:
+            latencies.append(time.perf_counter() - sent_at)
+        else:
+            failures.append(future.exception())
+        done.release()
+
+    for n in range(args.commands):
+        sent_at = time.perf_counter()
+        client.send(COMMANDS[n % len(COMMANDS)], callback=lambda f, t=sent_at: on_done(f, t))
+        time.sleep(args.interval)
+    for _ in range(args.commands):
+        done.acquire()
+    stats = dict(client.stats)
+    client.close()
+    emulator.stop()
+    return latencies, failures, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latencia de cola TCP contra UDP con pérdidas")
+    parser.add_argument("--commands", type=int, default=200)
+    parser.add_argument("--interval", type=float, default=0.05, help="Segundos entre comandos")
+    parser.add_argument("--loss", type=float, default=0.05, help="Probabilidad de perder cada paquete")
+    parser.add_argument("--latency", type=float, default=0.005, help="Latencia del emulador (s)")
+    parser.add_argument("--jitter", type=float, default=0.002)
+    parser.add_argument("--tcp-rto", type=float, default=0.2, help="RTO mínimo de TCP (Linux: 200 ms)")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    print(f"{args.commands} comandos, pérdida {args.loss:.0%}, latencia {args.latency * 1000:.0f} ms")
+    for label, client_class in (("TCP", ESP32Client), ("UDP", UDPClient)):
+        latencies, failures, stats = run(client_class, args)
+        extra = f"   reenvíos {stats['retransmits']}" if "retransmits" in stats else ""
+        print(f"{label}  p50 {percentile(latencies, 0.50) * 1000:7.1f} ms   "
+              f"p95 {percentile(latencies, 0.95) * 1000:7.1f} ms   "
+              f"p99 {percentile(latencies, 0.99) * 1000:7.1f} ms   "
+              f"máx {max(latencies, default=0) * 1000:7.1f} ms   fallos {len(failures)}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""Calibración de ruido ambiente guardada por micrófono y ajustada en marcha.
+
+adjust_for_ambient_noise(duration=1) bloquea un segundo de audio muerto en
+cada inicio de escucha. Aquí el umbral de energía y las estadísticas del
+ruido de fondo se guardan por nombre de micrófono (los de
+sr.Microphone.list_microphone_names()) y se reutilizan al iniciar; solo se
+calibra con adjust_for_ambient_noise la primera vez (o si la calibración
+guardada es muy antigua). Mientras se escucha, NoiseFloorTracker sigue
+estimando el ruido con las tramas sin voz del VAD y el umbral solo se
+cambia cuando el ruido se desvía lo suficiente del valor en uso.
+"""
+import json
+import math
+import os
+import threading
+import time
+
+DEFAULT_PATH = "calibracion.json"
+
+# Igual que speech_recognition: umbral = energía del ruido * 1.5
+DYNAMIC_ENERGY_RATIO = 1.5
+
+
+class NoiseFloorTracker:
+    """Estimación continua del ruido de fondo a partir de la energía por trama.
+
+    El nivel y la dispersión del ruido se promedian exponencialmente (alpha)
+    con las tramas clasificadas como silencio. Como las tramas por encima
+    del umbral nunca cuentan como silencio, si el ruido sube de golpe se usa
+    además el mínimo de cada ventana de window_frames tramas: si hasta el
+    mínimo supera el umbral en confirm_windows ventanas seguidas, el ruido de
+    fondo es el menor de esos mínimos. Una sola ventana no basta: unos 2 s de
+    voz continua (sin pausas entre palabras) también la superan y subirían el
+    umbral por encima de la propia voz. Con las tramas de 20 ms del VAD, 5
+    ventanas de 100 tramas son 10 s, lo mismo que la frase más larga.
+
+    El umbral solo cambia si se desvía más de drift del que está en uso y
+    además más de lo que explica la dispersión medida del ruido (3 noise_std).
+    """
+
+    def __init__(self, noise_floor=None, noise_std=0.0, ratio=DYNAMIC_ENERGY_RATIO, alpha=0.02,
+                 window_frames=100, confirm_windows=5, drift=0.25, min_threshold=50):
+        self.noise_floor = noise_floor
+        self.noise_std = noise_std
+        self.ratio = ratio
+        self.alpha = alpha
+        self.window_frames = window_frames
+        self.confirm_windows = confirm_windows
+        self.drift = drift
+        self.min_threshold = min_threshold
+        self.samples = 0
+        self.recalibrations = 0
+        self._window_min = math.inf
+        self._window_count = 0
+        self._loud_windows = 0
+        self._loud_min = math.inf
+
+    @classmethod
+    def from_calibration(cls, calibration, **options):
+        return cls(calibration.get("noise_floor"), calibration.get("noise_std", 0.0), **options)
+
+    @property
+    def threshold(self):
+        if self.noise_floor is None:
+            return None
+        return max(self.min_threshold, self.noise_floor * self.ratio)
+
+    def update(self, energy, speech, current_threshold):
+        """Registra una trama; devuelve el umbral nuevo si hubo deriva, si no None"""
+        if not speech:
+            if self.noise_floor is None:
+                self.noise_floor = energy
+            else:
+                delta = energy - self.noise_floor
+                self.noise_floor += self.alpha * delta
+                self.noise_std = math.sqrt((1 - self.alpha) * (self.noise_std ** 2 + self.alpha * delta * delta))
+            self.samples += 1
+
+        self._window_min = min(self._window_min, energy)
+        self._window_count += 1
+        if self._window_count >= self.window_frames:
+            if self._window_min > current_threshold:
+                # Ni una trama en silencio durante toda la ventana: ruido o voz continua
+                self._loud_windows += 1
+                self._loud_min = min(self._loud_min, self._window_min)
+                if self._loud_windows >= self.confirm_windows:
+                    self.noise_floor = self._loud_min
+                    self._loud_windows = 0
+                    self._loud_min = math.inf
+            else:
+                self._loud_windows = 0
+                self._loud_min = math.inf
+            self._window_min = math.inf
+            self._window_count = 0
+
+        threshold = self.threshold
+        if threshold is None:
+            return None
+        tolerance = max(self.drift * current_threshold, 3 * self.noise_std * self.ratio)
+        if abs(threshold - current_threshold) <= tolerance:
+            return None
+        self.recalibrations += 1
+        return threshold
+
+    def calibration(self, energy_threshold):
+        """Datos a guardar en CalibrationStore"""
+        return {"energy_threshold": energy_threshold, "noise_floor": self.noise_floor,
+                "noise_std": self.noise_std, "updated": time.time()}
+
+
+class CalibrationStore:
+    """Calibraciones por nombre de micrófono en un archivo JSON.
+
+    get() descarta las calibraciones de más de max_age segundos.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_age=7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._data = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._data = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def get(self, name):
+        with self._lock:
+            calibration = self._data.get(name)
+        if calibration is None or time.time() - calibration.get("updated", 0) > self.max_age:
+            return None
+        return dict(calibration)
+
+    def put(self, name, calibration):
+        with self._lock:
+            self._data[name] = dict(calibration)
+
+    def save(self):
+        """Escribe el archivo de forma atómica (archivo temporal + replace)"""
+        with self._lock:
+            data = json.dumps(self._data, indent=2, ensure_ascii=False)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(temporary, self.path)
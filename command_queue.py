@@ -0,0 +1,351 @@
+"""Cola de salida por placa que conoce el estado del ESP32.
+
+DeviceStateMirror guarda el último estado que confirmó la placa (LED y
+frecuencia), leído de sus propias respuestas ("OK: LED encendido",
+"OK: Frecuencia 2.50 Hz", "ESTADO: ..."), y lo adelanta con el efecto de
+los comandos aceptados y aún sin respuesta. Con él OutboundQueue:
+
+- descarta los comandos que no cambian nada (LED_ON con el LED ya
+  encendido, FREQ:2 con la frecuencia ya en 2 Hz...);
+- junta los ajustes de frecuencia que esperan turno (FREQ_UP, FREQ_DOWN,
+  FREQ:X.X...) en un único FREQ:X.X absoluto;
+- limita el ritmo de envío a la placa (un comando en vuelo y como mínimo
+  min_interval segundos entre envíos); mientras se espera, los comandos
+  siguientes se van juntando;
+- no envía tarde los comandos cuya hora límite pasó y deja que los de
+  seguridad (apagar, detener) se adelanten a todo lo pendiente.
+
+Todo se ejecuta en el hilo del bucle asyncio del cliente (el de
+devices.DevicePool), así que no necesita cerrojos.
+"""
+import collections
+import concurrent.futures
+import re
+import time
+
+from esp32_client import CommandExpired
+from esp32_protocol import arduino_float, atof
+
+# Comandos que solo cambian la frecuencia (se pueden juntar en un FREQ:X.X)
+FREQUENCY_COMMANDS = ("FREQ_UP", "FREQ_DOWN", "FREQ_FAST", "FREQ_SLOW")
+
+MIN_FREQUENCY = 0.0
+MAX_FREQUENCY = 10.0
+FREQUENCY_STEP = 0.5
+
+_FREQUENCY_REPLY = re.compile(r"^OK: Frecuencia (?:\D*)(\d+(?:\.\d+)?) Hz")
+_STATUS_REPLY = re.compile(r"^ESTADO: LED=(ON|OFF), FRECUENCIA=(\d+(?:\.\d+)?) Hz")
+
+
+def is_frequency_command(command):
+    return command in FREQUENCY_COMMANDS or command.startswith("FREQ:")
+
+
+def is_rejected(command):
+    """True si el firmware rechaza el comando (FREQ:X fuera de 0-10 Hz)"""
+    return command.startswith("FREQ:") and not MIN_FREQUENCY <= atof(command[5:]) <= MAX_FREQUENCY
+
+
+def frequency_after(command, frequency):
+    """Frecuencia tras el comando partiendo de frequency (None si no se sabe)"""
+    if command == "FREQ_FAST":
+        return 5.0
+    if command == "FREQ_SLOW":
+        return 1.0
+    if command.startswith("FREQ:"):
+        value = atof(command[5:])
+        if MIN_FREQUENCY <= value <= MAX_FREQUENCY:
+            return value
+        return frequency  # El firmware la rechaza y no cambia nada
+    if frequency is None:
+        return None
+    if command == "FREQ_UP":
+        return min(MAX_FREQUENCY, frequency + FREQUENCY_STEP)
+    if command == "FREQ_DOWN":
+        return max(MIN_FREQUENCY, frequency - FREQUENCY_STEP)
+    return frequency
+
+
+def frequency_command(frequency):
+    """Comando absoluto equivalente, con los decimales que imprime el firmware"""
+    return f"FREQ:{arduino_float(frequency)}"
+
+
+class DeviceStateMirror:
+    """Estado conocido de una placa: confirmado por sus respuestas y esperado.
+
+    led es el último LED_ON/LED_OFF confirmado (el ESTADO del firmware
+    informa la fase del parpadeo, que cambia sola, y no se usa). Solo vale
+    con la frecuencia en 0: mientras parpadea el bucle del sketch cambia el
+    LED por su cuenta y un LED_ON repetido sí tiene efecto, así que el LED
+    cuenta como desconocido. Un valor None significa desconocido: sin él no
+    se descarta ni se junta nada. El
+    estado confirmado caduca a los ttl segundos y al perder la conexión,
+    por si otro cliente o un reinicio de la placa lo cambió.
+    """
+
+    def __init__(self, ttl=30.0):
+        self.ttl = ttl
+        self.led = None
+        self.frequency = None
+        self.expected_led = None
+        self.expected_frequency = None
+        self.confirmed_at = None
+
+    def invalidate(self):
+        self.led = self.frequency = None
+        self.expected_led = self.expected_frequency = None
+        self.confirmed_at = None
+
+    def expire(self):
+        if self.confirmed_at is not None and time.monotonic() - self.confirmed_at > self.ttl:
+            self.invalidate()
+
+    def is_noop(self, command):
+        """True si la placa ya está (o quedará) en el estado que pide el comando"""
+        if is_rejected(command):
+            # Debe llegar a la placa para que su error llegue al usuario
+            return False
+        self.expire()
+        if command == "LED_ON":
+            return self.expected_frequency == 0 and self.expected_led is True
+        if command == "LED_OFF":
+            return self.expected_frequency == 0 and self.expected_led is False
+        if is_frequency_command(command) and self.expected_frequency is not None:
+            return frequency_after(command, self.expected_frequency) == self.expected_frequency
+        return False
+
+    def expect(self, command):
+        """Adelanta el efecto de un comando aceptado"""
+        if command == "LED_ON":
+            self.expected_led = True
+        elif command == "LED_OFF":
+            self.expected_led = False
+        elif is_frequency_command(command):
+            self.expected_frequency = frequency_after(command, self.expected_frequency)
+
+    def confirm(self, command, response):
+        """Actualiza el estado con la respuesta de la placa"""
+        if response == "OK: LED encendido":
+            self.led = True
+        elif response == "OK: LED apagado":
+            self.led = False
+        else:
+            match = _FREQUENCY_REPLY.match(response) or _STATUS_REPLY.match(response)
+            if match is None:
+                return
+            self.frequency = float(match.group(match.lastindex))
+        self.confirmed_at = time.monotonic()
+
+    def forget(self, command):
+        """El comando falló: lo que afectaba vuelve a ser desconocido"""
+        if command in ("LED_ON", "LED_OFF"):
+            self.led = self.expected_led = None
+        elif is_frequency_command(command):
+            self.frequency = self.expected_frequency = None
+
+    def settle(self):
+        """Sin comandos pendientes lo esperado es lo confirmado"""
+        self.expected_led = self.led
+        self.expected_frequency = self.frequency
+
+    def describe(self):
+        if self.expected_frequency:
+            led = "parpadeando"
+        elif self.expected_frequency is None:
+            led = "desconocido"
+        else:
+            led = {True: "encendido", False: "apagado", None: "desconocido"}[self.expected_led]
+        frequency = ("desconocida" if self.expected_frequency is None
+                     else f"{arduino_float(self.expected_frequency)} Hz")
+        return f"LED {led}, frecuencia {frequency}"
+
+
+class CommandCancelled(Exception):
+    """Comando pendiente anulado por un comando de seguridad posterior"""
+
+
+def _same_target(a, b):
+    """True si los dos comandos actúan sobre lo mismo (el LED o la frecuencia)"""
+    if a in ("LED_ON", "LED_OFF"):
+        return b in ("LED_ON", "LED_OFF")
+    return is_frequency_command(a) and is_frequency_command(b)
+
+
+class _Entry:
+    __slots__ = ("command", "callbacks", "base_frequency", "deadline")
+
+    def __init__(self, command, callback, base_frequency, deadline=None):
+        self.command = command
+        self.callbacks = [callback]
+        self.base_frequency = base_frequency
+        self.deadline = deadline
+
+
+class OutboundQueue:
+    """Comandos pendientes de una placa, con descarte, fusión y ritmo limitado.
+
+    send(comando, callback, deadline, priority) es el ESP32Client.send de
+    la placa. submit(comando, callback) llama a callback(future, omitido)
+    con la respuesta; omitido es True si el comando no cambiaba nada y no
+    se envió (el future trae entonces una descripción del estado). Los
+    comandos juntados reciben todos la respuesta del FREQ:X.X enviado.
+
+    Un comando con deadline (time.time()) que no salió a esa hora falla
+    con esp32_client.CommandExpired en lugar de enviarse tarde. Uno con
+    priority=True (apagar, detener) no se omite ni espera turno: sale en
+    el acto por el carril prioritario del cliente y anula con
+    CommandCancelled los pendientes que actúan sobre lo mismo.
+    """
+
+    def __init__(self, send, loop, mirror=None, min_interval=0.05, max_outstanding=1):
+        self.send = send
+        self.loop = loop
+        self.mirror = mirror or DeviceStateMirror()
+        self.min_interval = min_interval
+        self.max_outstanding = max_outstanding
+        self.stats = {"submitted": 0, "sent": 0, "skipped": 0, "coalesced": 0, "expired": 0,
+                      "priority": 0, "cancelled": 0}
+        self._pending = collections.deque()
+        self._sent = []
+        self._last_sent = 0.0
+        self._timer = None
+
+    def submit(self, command, callback, deadline=None, priority=False):
+        self.stats["submitted"] += 1
+        if priority:
+            self._send_now(command, callback, deadline)
+            return
+        mirror = self.mirror
+        if mirror.is_noop(command):
+            self.stats["skipped"] += 1
+            callback(self._unchanged(), True)
+            return
+        last = self._pending[-1] if self._pending else None
+        if (last is not None and is_frequency_command(command) and is_frequency_command(last.command)
+                and mirror.expected_frequency is not None and not is_rejected(command)
+                and not is_rejected(last.command)):
+            # Ajuste de frecuencia detrás de otro que aún no salió: un solo FREQ:X.X
+            mirror.expect(command)
+            self.stats["coalesced"] += 1
+            last.callbacks.append(callback)
+            last.command = frequency_command(mirror.expected_frequency)
+            # El comando juntado vale hasta el plazo del más reciente
+            if deadline is None or last.deadline is None:
+                last.deadline = None
+            else:
+                last.deadline = max(last.deadline, deadline)
+            return
+        self._append(command, callback, deadline)
+
+    def invalidate(self):
+        """La conexión se perdió: el estado de la placa ya no es seguro"""
+        self.mirror.invalidate()
+
+    def take_pending(self):
+        """Saca los comandos que aún no salieron (para pasarlos a otra cola)"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = list(self._pending), collections.deque()
+        self._recompute()
+        return pending
+
+    def adopt(self, entries):
+        """Encola comandos sacados de otra cola con take_pending()"""
+        for entry in entries:
+            entry.base_frequency = self.mirror.expected_frequency
+            self.mirror.expect(entry.command)
+            self._pending.append(entry)
+        self._schedule()
+
+    def refresh(self):
+        """Pide STATUS para conocer la frecuencia (p. ej. al conectar)"""
+        self._append("STATUS", lambda future, skipped: None)
+
+    def _unchanged(self):
+        future = concurrent.futures.Future()
+        future.set_result(f"Sin cambios: {self.mirror.describe()}")
+        return future
+
+    @staticmethod
+    def _fail(entry, error):
+        future = concurrent.futures.Future()
+        future.set_exception(error)
+        for callback in entry.callbacks:
+            callback(future, False)
+
+    def _append(self, command, callback, deadline=None):
+        base = self.mirror.expected_frequency
+        self.mirror.expect(command)
+        self._pending.append(_Entry(command, callback, base, deadline))
+        self._schedule()
+
+    def _send_now(self, command, callback, deadline):
+        self.stats["priority"] += 1
+        waiting = [entry for entry in self._pending if not _same_target(command, entry.command)]
+        for entry in self._pending:
+            if _same_target(command, entry.command):
+                self.stats["cancelled"] += len(entry.callbacks)
+                self._fail(entry, CommandCancelled(f"Anulado por {command}: {entry.command}"))
+        self._pending = collections.deque(waiting)
+        entry = _Entry(command, callback, self.mirror.expected_frequency, deadline)
+        self._transmit(entry, priority=True)
+        self._recompute()
+
+    def _transmit(self, entry, priority=False):
+        self._sent.append(entry)
+        self._last_sent = time.monotonic()
+        self.stats["sent"] += 1
+        self.send(entry.command, callback=lambda future: self._done(entry, future),
+                  deadline=entry.deadline, priority=priority)
+
+    def _recompute(self):
+        # Lo esperado = lo confirmado + el efecto de lo enviado y lo pendiente
+        self.mirror.settle()
+        for entry in self._sent + list(self._pending):
+            self.mirror.expect(entry.command)
+
+    def _schedule(self):
+        if self._timer is not None or not self._pending or len(self._sent) >= self.max_outstanding:
+            return
+        wait = self._last_sent + self.min_interval - time.monotonic()
+        if wait > 0:
+            self._timer = self.loop.call_later(wait, self._flush)
+        else:
+            self._flush()
+
+    def _flush(self):
+        self._timer = None
+        while self._pending and len(self._sent) < self.max_outstanding:
+            entry = self._pending.popleft()
+            if entry.deadline is not None and time.time() > entry.deadline:
+                self.stats["expired"] += len(entry.callbacks)
+                self._fail(entry, CommandExpired(f"Comando vencido antes de enviarse: {entry.command}"))
+                self._recompute()
+                continue
+            if (entry.command.startswith("FREQ:") and len(entry.callbacks) > 1
+                    and frequency_after(entry.command, entry.base_frequency) == entry.base_frequency):
+                # Los ajustes juntados se anulan (subir y bajar): nada que enviar
+                self.stats["skipped"] += len(entry.callbacks)
+                future = self._unchanged()
+                for callback in entry.callbacks:
+                    callback(future, True)
+                continue
+            self._transmit(entry)
+            break
+        self._schedule()
+
+    def _done(self, entry, future):
+        # Llega desde el hilo del bucle: el cliente comparte el bucle de la cola
+        self._sent.remove(entry)
+        mirror = self.mirror
+        if future.cancelled() or future.exception() is not None:
+            mirror.forget(entry.command)
+        else:
+            mirror.confirm(entry.command, future.result())
+        if not self._pending and not self._sent:
+            mirror.settle()
+        for callback in entry.callbacks:
+            callback(future, False)
+        self._schedule()
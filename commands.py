@@ -0,0 +1,237 @@
+"""Registro de comandos de voz compilado en un autómata de varios patrones.
+
+Las frases de todos los frontales (prueba1/2/3) se registran una sola vez y
+se compilan en un autómata Aho-Corasick sobre palabras, así el texto
+reconocido se recorre en una sola pasada sin importar cuántas frases haya.
+El texto se normaliza (minúsculas, sin tildes, sin artículos) y las frases
+pueden llevar parámetros numéricos: "frecuencia a {num}" -> FREQ:{num}.
+"""
+import re
+import unicodedata
+
+NUM = "{num}"
+
+# Palabras que no cambian el sentido del comando ("encender el led")
+STOPWORDS = {"el", "la", "los", "las", "lo", "un", "una", "unos", "unas",
+             "de", "del", "al", "a", "en", "por", "favor"}
+
+NUMBER_WORDS = {"cero": 0, "uno": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5,
+                "seis": 6, "siete": 7, "ocho": 8, "nueve": 9, "diez": 10}
+
+_TOKEN = re.compile(r"\d+(?:[.,]\d+)?|[a-z]+")
+
+
+def normalize(text):
+    """Minúsculas y sin tildes: "Adiós" -> "adios" """
+    if text.isascii():
+        return text.lower()
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def tokenize(text):
+    """Divide el texto normalizado en palabras; los números quedan como float"""
+    tokens = []
+    for token in _TOKEN.findall(normalize(text)):
+        if token[0].isdigit():
+            tokens.append(float(token.replace(",", ".")))
+        elif token in NUMBER_WORDS:
+            tokens.append(float(NUMBER_WORDS[token]))
+        elif token not in STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def format_number(value):
+    """3.5 -> "3.5", 2.0 -> "2" """
+    return f"{value:g}"
+
+
+class CommandMatch:
+    """Resultado de buscar un comando en el texto reconocido"""
+
+    def __init__(self, phrase, command, start, end, params):
+        self.phrase = phrase
+        self.command = command
+        self.start = start
+        self.end = end
+        self.params = params
+
+    def __repr__(self):
+        return f"CommandMatch({self.phrase!r} -> {self.command!r}, params={self.params})"
+
+
+class CommandRegistry:
+    """Frases de voz -> comandos, compiladas en un autómata Aho-Corasick.
+
+    El comando puede ser una plantilla ("FREQ:{num}") que se completa con
+    los números encontrados en las posiciones {num} de la frase. Si varias
+    frases coinciden gana la que empieza antes y, entre ellas, la más larga.
+    """
+
+    def __init__(self, entries=None):
+        self._entries = []
+        self._compiled = False
+        for phrase, command in (entries or []):
+            self.add(phrase, command)
+
+    def add(self, phrase, command):
+        """Registra una frase; el autómata se recompila en el siguiente uso"""
+        symbols = self._phrase_symbols(phrase)
+        if not symbols:
+            raise ValueError(f"Frase vacía: {phrase!r}")
+        self._entries.append((phrase, command, tuple(symbols)))
+        self._compiled = False
+        return self
+
+    def phrases(self):
+        """Frases registradas (para gramáticas de reconocedores locales)"""
+        return [phrase for phrase, _, _ in self._entries]
+
+    def commands(self):
+        return sorted({command for _, command, _ in self._entries})
+
+    def compile(self):
+        """Construye las transiciones, enlaces de fallo y salidas del autómata"""
+        goto = [{}]
+        outputs = [[]]
+        for index, (_, _, symbols) in enumerate(self._entries):
+            state = 0
+            for symbol in symbols:
+                if symbol not in goto[state]:
+                    goto.append({})
+                    outputs.append([])
+                    goto[state][symbol] = len(goto) - 1
+                state = goto[state][symbol]
+            outputs[state].append(index)
+
+        fail = [0] * len(goto)
+        queue = list(goto[0].values())
+        for state in queue:
+            for symbol, child in goto[state].items():
+                queue.append(child)
+                fallback = fail[state]
+                while fallback and symbol not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[child] = goto[fallback].get(symbol, 0)
+                outputs[child] = outputs[child] + outputs[fail[child]]
+
+        self._goto = goto
+        self._fail = fail
+        self._outputs = outputs
+        self._compiled = True
+        return self
+
+    def match_all(self, text):
+        """Todas las coincidencias sin solaparse, de izquierda a derecha"""
+        tokens = tokenize(text)
+        found = self._scan(tokens)
+        found.sort(key=lambda m: (m.start, -(m.end - m.start)))
+        result = []
+        position = 0
+        for match in found:
+            if match.start >= position:
+                result.append(match)
+                position = match.end
+        return result
+
+    def match(self, text):
+        """La primera coincidencia (la que empieza antes, la más larga) o None"""
+        found = self._scan(tokenize(text))
+        if not found:
+            return None
+        return min(found, key=lambda m: (m.start, -(m.end - m.start)))
+
+    def __call__(self, text):
+        return self.match(text)
+
+    def _scan(self, tokens):
+        if not self._compiled:
+            self.compile()
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        found = []
+        state = 0
+        for position, token in enumerate(tokens):
+            symbol = NUM if isinstance(token, float) else token
+            while state and symbol not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(symbol, 0)
+            for index in outputs[state]:
+                phrase, command, symbols = self._entries[index]
+                start = position - len(symbols) + 1
+                params = [tokens[start + i] for i, s in enumerate(symbols) if s == NUM]
+                found.append(CommandMatch(phrase, self._render(command, params),
+                                          start, position + 1, params))
+        return found
+
+    @staticmethod
+    def _render(command, params):
+        if not params or not isinstance(command, str) or NUM not in command:
+            return command
+        for value in params:
+            command = command.replace(NUM, format_number(value), 1)
+        return command
+
+    @staticmethod
+    def _phrase_symbols(phrase):
+        symbols = []
+        for word in phrase.split():
+            if word == NUM:
+                symbols.append(NUM)
+            else:
+                symbols.extend(t for t in tokenize(word) if not isinstance(t, float))
+        return symbols
+
+
+# Comandos de voz -> comandos del firmware ESP32 (prueba3.py)
+ESP32_REGISTRY = CommandRegistry([
+    ("encender led", "LED_ON"),
+    ("prender led", "LED_ON"),
+    ("activar led", "LED_ON"),
+    ("enciende led", "LED_ON"),
+    ("apagar led", "LED_OFF"),
+    ("apaga led", "LED_OFF"),
+    ("desactivar led", "LED_OFF"),
+    ("aumentar frecuencia", "FREQ_UP"),
+    ("subir frecuencia", "FREQ_UP"),
+    ("reducir frecuencia", "FREQ_DOWN"),
+    ("bajar frecuencia", "FREQ_DOWN"),
+    ("frecuencia rápida", "FREQ_FAST"),
+    ("frecuencia lenta", "FREQ_SLOW"),
+    ("frecuencia a {num}", "FREQ:{num}"),
+    ("frecuencia {num} hercios", "FREQ:{num}"),
+    ("detener parpadeo", "FREQ:0"),
+    ("estado", "STATUS"),
+])
+
+GOODBYE_ACTION = "👋 ¡Hasta luego!"
+
+# Comandos de voz -> acciones mostradas en pantalla (prueba1.py, prueba2.py)
+ACTION_REGISTRY = CommandRegistry([
+    ("encender led", "💡 LED ENCENDIDO"),
+    ("enciende led", "💡 LED ENCENDIDO"),
+    ("apagar led", "💡 LED APAGADO"),
+    ("apaga led", "💡 LED APAGADO"),
+    ("activar motor", "⚙️ MOTOR ACTIVADO"),
+    ("detener motor", "⚙️ MOTOR DETENIDO"),
+    ("hola", "👋 ¡Hola! ¿En qué puedo ayudarte?"),
+    ("adiós", GOODBYE_ACTION),
+    ("terminar", GOODBYE_ACTION),
+])
+
+# Comandos de seguridad (apagar, detener, terminar): no caducan y pasan
+# delante de los demás (ver VoiceEngine y command_queue.OutboundQueue)
+SAFETY_COMMANDS = frozenset({"LED_OFF", "FREQ:0", "💡 LED APAGADO", "⚙️ MOTOR DETENIDO",
+                             GOODBYE_ACTION})
+
+
+def is_safety_command(command):
+    """True si el comando detiene o apaga algo ("FREQ:0.0" cuenta como FREQ:0)"""
+    if not isinstance(command, str):
+        return False
+    if command.startswith("FREQ:"):
+        try:
+            return float(command[5:]) == 0
+        except ValueError:
+            return False
+    return command in SAFETY_COMMANDS
@@ -0,0 +1,329 @@
+"""Registro de placas ESP32 con nombre y grupos, y envío a varias a la vez.
+
+DeviceRegistry guarda en dispositivos.json las placas (nombre -> host y
+puerto) y los grupos (nombre -> placas). DevicePool mantiene una conexión
+persistente por placa (esp32_client.ESP32Client), todas en un mismo bucle
+asyncio en un solo hilo, y envía un comando a una placa, a un grupo o a
+todas a la vez: el tiempo total es el de la placa más lenta, no la suma.
+Cada placa devuelve su propio DeviceResult (ack, timeout o error).
+
+Los comandos de cada placa pasan por una command_queue.OutboundQueue que
+conoce su estado: los que no cambian nada no se envían (resultado
+"skipped"), los ajustes de frecuencia seguidos salen como un solo FREQ:X.X
+y el envío a cada placa tiene un ritmo máximo.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import os
+import threading
+import time
+
+from command_queue import CommandCancelled, OutboundQueue
+from esp32_client import CommandExpired, ESP32Client
+from esp32_udp import UDPClient
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PATH = "dispositivos.json"
+
+# Destino que abarca todas las placas registradas
+ALL = "todos"
+
+# Clientes por transporte (DevicePool(transport=...))
+TRANSPORTS = {"tcp": ESP32Client, "udp": UDPClient}
+
+# Estado del resultado de cada placa
+ACK = "ack"
+SKIPPED = "skipped"
+EXPIRED = "expired"
+CANCELLED = "cancelled"
+TIMEOUT = "timeout"
+ERROR = "error"
+
+
+class DeviceResult:
+    """Resultado de un comando en una placa"""
+
+    __slots__ = ("device", "status", "response", "error", "elapsed_ms")
+
+    def __init__(self, device, status, response=None, error=None, elapsed_ms=None):
+        self.device = device
+        self.status = status
+        self.response = response
+        self.error = error
+        self.elapsed_ms = elapsed_ms
+
+    @property
+    def ok(self):
+        # Un comando omitido porque no cambiaba nada también es un éxito
+        return self.status in (ACK, SKIPPED)
+
+    def __repr__(self):
+        return f"DeviceResult({self.device!r}, {self.status!r}, response={self.response!r})"
+
+
+class DeviceRegistry:
+    """Placas con nombre y grupos de placas, guardados en un archivo JSON.
+
+    ids guarda la MAC de cada placa si se conoce (discovery.DeviceLocator
+    la usa para encontrarla si cambia de IP).
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self.devices = {}
+        self.groups = {}
+        self.ids = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict):
+            logger.warning("%s no contiene un objeto JSON; se ignora", path)
+            return
+        devices, groups = data.get("devices") or {}, data.get("groups") or {}
+        if not isinstance(devices, dict) or not isinstance(groups, dict):
+            logger.warning("%s no tiene el formato esperado; se ignora lo que no encaja", path)
+        # Una entrada mal escrita se salta sin perder las demás
+        for name, entry in (devices.items() if isinstance(devices, dict) else ()):
+            try:
+                self.devices[name] = (entry["host"], int(entry.get("port", 1234)))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                logger.warning("Placa %r de %s mal definida; se ignora: %r", name, path, entry)
+                continue
+            if entry.get("id"):
+                self.ids[name] = entry["id"]
+        for name, members in (groups.items() if isinstance(groups, dict) else ()):
+            if isinstance(members, list):
+                self.groups[name] = [member for member in members if isinstance(member, str)]
+            else:
+                logger.warning("Grupo %r de %s mal definido; se ignora: %r", name, path, members)
+
+    def add(self, name, host, port=1234, groups=(), device_id=None):
+        with self._lock:
+            self.devices[name] = (host, port)
+            if device_id is not None:
+                self.ids[name] = device_id
+            for group in groups:
+                members = self.groups.setdefault(group, [])
+                if name not in members:
+                    members.append(name)
+
+    def remove(self, name):
+        with self._lock:
+            self.devices.pop(name, None)
+            self.ids.pop(name, None)
+            for members in self.groups.values():
+                if name in members:
+                    members.remove(name)
+
+    def set_group(self, group, members):
+        with self._lock:
+            self.groups[group] = list(members)
+
+    def targets(self):
+        """Destinos posibles: todas, los grupos y las placas"""
+        with self._lock:
+            return [ALL] + sorted(self.groups) + sorted(self.devices)
+
+    def resolve(self, target):
+        """Nombres de las placas de un destino (placa, grupo o ALL)"""
+        with self._lock:
+            if target == ALL:
+                return sorted(self.devices)
+            if target in self.devices:
+                return [target]
+            if target in self.groups:
+                return [name for name in self.groups[target] if name in self.devices]
+        raise KeyError(f"Destino desconocido: {target!r}")
+
+    def save(self):
+        """Escribe el archivo de forma atómica (archivo temporal + replace)"""
+        with self._lock:
+            devices = {}
+            for name, (host, port) in self.devices.items():
+                devices[name] = {"host": host, "port": port}
+                if name in self.ids:
+                    devices[name]["id"] = self.ids[name]
+            data = {"devices": devices,
+                    "groups": self.groups}
+            text = json.dumps(data, indent=2, ensure_ascii=False)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temporary, self.path)
+
+
+class DevicePool:
+    """Conexiones persistentes a las placas del registro y envío en paralelo.
+
+    Los clientes se crean al primer uso de cada placa y se reconectan solos.
+    Si cambia la dirección de una placa en el registro, el cliente se
+    reemplaza en el siguiente envío. on_state(placa, conectado, error) se
+    llama desde el hilo del bucle.
+
+    Con coalesce=False los comandos van directos al cliente, sin descarte,
+    fusión ni límite de ritmo; min_interval es la pausa mínima entre
+    envíos a una misma placa. transport="udp" usa el canal UDP
+    (esp32_udp.UDPClient) en lugar de la conexión TCP.
+    """
+
+    def __init__(self, registry, timeout=5.0, max_in_flight=8, on_state=None, coalesce=True,
+                 min_interval=0.05, transport="tcp", **client_options):
+        if transport not in TRANSPORTS:
+            raise ValueError(f"Transporte desconocido: {transport!r}")
+        self.registry = registry
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self.on_state = on_state
+        self.coalesce = coalesce
+        self.min_interval = min_interval
+        self.transport = transport
+        self.client_options = client_options
+        self._clients = {}
+        self._queues = {}
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="esp32-pool", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        with self._lock:
+            clients = list(self._clients.values())
+            self._clients.clear()
+            self._queues.clear()
+        for client in clients:
+            client.close()
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=2)
+            self._thread = None
+
+    def client(self, name):
+        """Cliente de la placa (se crea y conecta la primera vez)"""
+        address = self.registry.devices[name]
+        with self._lock:
+            client = self._clients.get(name)
+            if client is not None and (client.host, client.port) == address:
+                return client
+            old = client
+            old_queue = self._queues.get(name)
+            if self._thread is None:
+                self.start()
+            client = self._clients[name] = TRANSPORTS[self.transport](
+                address[0], address[1], timeout=self.timeout, max_in_flight=self.max_in_flight,
+                loop=self._loop, on_state=self._state_callback(name), **self.client_options)
+            if self.coalesce:
+                queue = self._queues[name] = OutboundQueue(client.send, self._loop,
+                                                           min_interval=self.min_interval)
+                if old_queue is not None:
+                    # Lo que aún no salió va a la dirección nueva; lo que estaba
+                    # en vuelo falla al cerrarse el cliente viejo
+                    self._loop.call_soon_threadsafe(
+                        lambda: queue.adopt(old_queue.take_pending()))
+        if old is not None:
+            old.close()
+        client.start()
+        return client
+
+    def connect(self, target=ALL):
+        """Abre de antemano las conexiones de un destino"""
+        for name in self.registry.resolve(target):
+            self.client(name)
+
+    def connected(self):
+        """Placas con la conexión abierta"""
+        with self._lock:
+            return sorted(name for name, client in self._clients.items() if client.connected)
+
+    def send(self, target, command, callback=None, deadline=None, priority=False):
+        """Envía el comando a todas las placas del destino sin esperar.
+
+        Devuelve {placa: Future} con un DeviceResult por placa (nunca
+        falla); callback(resultado) se llama al llegar cada uno. Una placa
+        desconectada da TIMEOUT a los timeout segundos aunque su cliente
+        siga esperando para reconectar; un comando que a esa hora aún no
+        salió (en cola o esperando turno) ya no se envía. Si llega deadline
+        (time.time()) sin que el comando haya salido, el resultado es
+        EXPIRED; con priority el comando pasa delante y los pendientes que
+        contradice quedan CANCELLED.
+        """
+        futures = {}
+        # Tras el TIMEOUT del grupo el comando no debe salir tarde
+        limit = time.time() + self.timeout
+        deadline = limit if deadline is None else min(deadline, limit)
+        for name in self.registry.resolve(target):
+            result = concurrent.futures.Future()
+            if callback is not None:
+                result.add_done_callback(lambda future: callback(future.result()))
+            sent = time.perf_counter()
+            client = self.client(name)
+            done = (lambda future, skipped=False, name=name, result=result, sent=sent:
+                    self._settle(result, self._result(name, future, sent, skipped)))
+            queue = self._queues.get(name)
+            if queue is not None:
+                # La cola solo se toca desde el hilo del bucle
+                self._loop.call_soon_threadsafe(queue.submit, command, done, deadline, priority)
+            else:
+                client.send(command, callback=done, deadline=deadline, priority=priority)
+            self._loop.call_soon_threadsafe(
+                self._loop.call_later, self.timeout, self._settle, result,
+                DeviceResult(name, TIMEOUT, error=TimeoutError(f"{name} no respondió a tiempo"),
+                             elapsed_ms=self.timeout * 1000))
+            futures[name] = result
+        return futures
+
+    def broadcast(self, target, command):
+        """Envía y espera: {placa: DeviceResult} cuando respondieron todas"""
+        return {name: future.result() for name, future in self.send(target, command).items()}
+
+    def queue_stats(self):
+        """{placa: contadores de su cola (enviados, omitidos, juntados...)}"""
+        with self._lock:
+            return {name: dict(queue.stats) for name, queue in self._queues.items()}
+
+    def _state_callback(self, name):
+        def on_state(connected, error):
+            with self._lock:
+                queue = self._queues.get(name)
+            if queue is not None:
+                # Al reconectar no se sabe si la placa se reinició: se pregunta
+                queue.invalidate()
+                if connected:
+                    queue.refresh()
+            if self.on_state is not None:
+                self.on_state(name, connected, error)
+        return on_state
+
+    @staticmethod
+    def _settle(result, value):
+        # Gana el primero: la respuesta del cliente o el plazo del grupo
+        try:
+            result.set_result(value)
+        except concurrent.futures.InvalidStateError:
+            pass
+
+    @staticmethod
+    def _result(name, future, sent, skipped=False):
+        elapsed_ms = (time.perf_counter() - sent) * 1000
+        try:
+            return DeviceResult(name, SKIPPED if skipped else ACK, response=future.result(),
+                                elapsed_ms=elapsed_ms)
+        except CommandExpired as e:
+            return DeviceResult(name, EXPIRED, error=e, elapsed_ms=elapsed_ms)
+        except CommandCancelled as e:
+            return DeviceResult(name, CANCELLED, error=e, elapsed_ms=elapsed_ms)
+        except TimeoutError as e:
+            return DeviceResult(name, TIMEOUT, error=e, elapsed_ms=elapsed_ms)
+        except Exception as e:
+            return DeviceResult(name, ERROR, error=e, elapsed_ms=elapsed_ms)
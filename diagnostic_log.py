@@ -0,0 +1,156 @@
+"""Registro de diagnóstico que no bloquea a los hilos de trabajo.
+
+Los hilos (captura, reconocimiento, cliente ESP32) solo encolan el registro
+con un QueueHandler acotado: si la cola se llena el mensaje se descarta y
+se cuenta, nunca se espera. Un QueueListener en su propio hilo lo formatea
+y lo entrega a los manejadores reales (consola y vista de diagnóstico).
+
+DiagnosticHandler guarda las últimas líneas en un búfer circular y agrupa
+los mensajes repetidos ("Escuchando..." en cada frase) en una sola línea
+por ventana de tiempo, así la memoria se mantiene constante aunque la
+aplicación lleve días abierta.
+"""
+import collections
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+
+DIAGNOSTIC_FORMAT = "[%(asctime)s] %(message)s"
+DIAGNOSTIC_DATEFMT = "%H:%M:%S"
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que descarta (y cuenta) en lugar de esperar con la cola llena"""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DiagnosticHandler(logging.Handler):
+    """Búfer circular de líneas de diagnóstico con agrupación de repetidos.
+
+    sink(line), si se da, recibe cada línea nueva (por ejemplo
+    UIStateChannel.append). Un mensaje idéntico al anterior dentro de
+    repeat_window segundos no se emite; el total de repeticiones se añade
+    como una línea cuando llega otro mensaje (o el mismo, vencida la ventana)
+    o cuando flush_expired() encuentra la ventana vencida, para que una
+    ráfaga seguida de silencio también se informe.
+    """
+
+    def __init__(self, sink=None, max_lines=1000, repeat_window=5.0, level=logging.INFO):
+        super().__init__(level)
+        self.sink = sink
+        self.lines = collections.deque(maxlen=max_lines)
+        self.repeat_window = repeat_window
+        self.suppressed = 0
+        self.setFormatter(logging.Formatter(DIAGNOSTIC_FORMAT, DIAGNOSTIC_DATEFMT))
+        # [mensaje, hora de la primera aparición, repeticiones sin mostrar]
+        self._last = None
+
+    def emit(self, record):
+        try:
+            message = record.getMessage()
+            last = self._last
+            if last is not None and last[0] == message and record.created - last[1] <= self.repeat_window:
+                last[2] += 1
+                self.suppressed += 1
+                return
+            self._flush_repeats()
+            self._last = [message, record.created, 0]
+            self._push(self.format(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        self.acquire()
+        try:
+            self._flush_repeats()
+        finally:
+            self.release()
+
+    def flush_expired(self, now=None):
+        """Emite las repeticiones pendientes si su ventana ya venció (llamar periódicamente)"""
+        self.acquire()
+        try:
+            now = time.time() if now is None else now
+            last = self._last
+            if last is not None and last[2] and now - last[1] > self.repeat_window:
+                self._flush_repeats()
+        finally:
+            self.release()
+
+    def snapshot(self):
+        """Copia de las líneas guardadas (la más antigua primero)"""
+        self.acquire()
+        try:
+            return list(self.lines)
+        finally:
+            self.release()
+
+    def _flush_repeats(self):
+        if self._last is not None and self._last[2]:
+            self._push(f"    (repetido {self._last[2]} veces más)")
+            self._last[2] = 0
+
+    def _push(self, line):
+        self.lines.append(line)
+        if self.sink is not None:
+            self.sink(line)
+
+
+class LogPipeline:
+    """Conecta un logger a sus manejadores a través de una cola acotada.
+
+    start() sustituye los manejadores del logger (raíz por defecto) por un
+    DroppingQueueHandler; los manejadores dados se ejecutan en el hilo del
+    QueueListener. stop() vacía la cola y restaura el logger.
+    """
+
+    def __init__(self, *handlers, level=logging.INFO, queue_size=10000, logger=None):
+        self.handlers = handlers
+        self.level = level
+        self.logger = logger or logging.getLogger()
+        self.queue_handler = DroppingQueueHandler(queue.Queue(queue_size))
+        self._listener = logging.handlers.QueueListener(self.queue_handler.queue, *handlers,
+                                                        respect_handler_level=True)
+        self._previous = None
+        self._lock = threading.Lock()
+
+    @property
+    def dropped(self):
+        return self.queue_handler.dropped
+
+    def start(self):
+        with self._lock:
+            if self._previous is not None:
+                return self
+            self._previous = (self.logger.level, list(self.logger.handlers))
+            for handler in self._previous[1]:
+                self.logger.removeHandler(handler)
+            self.logger.setLevel(self.level)
+            self.logger.addHandler(self.queue_handler)
+            self._listener.start()
+        return self
+
+    def stop(self):
+        with self._lock:
+            if self._previous is None:
+                return
+            self.logger.removeHandler(self.queue_handler)
+            self._listener.stop()
+            for handler in self.handlers:
+                handler.flush()
+            level, handlers = self._previous
+            self.logger.setLevel(level)
+            for handler in handlers:
+                self.logger.addHandler(handler)
+            self._previous = None
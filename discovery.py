@@ -0,0 +1,463 @@
+"""Búsqueda de placas ESP32 en la red local y libreta de direcciones.
+
+En lugar de escribir a mano la IP de cada placa (que cambia cuando el
+router le da otra por DHCP):
+
+- scan() prueba a la vez todas las direcciones de una red /24 en el puerto
+  1234 y se queda con las que saludan con "ESP32 listo"; con un plazo de
+  medio segundo por dirección una /24 entera tarda alrededor de un segundo.
+- El firmware anuncia además cada 2 s por difusión UDP (puerto 1235)
+  "ESP32 listo id=<MAC> port=1234"; discover() escucha esos anuncios
+  durante un intervalo entero más el plazo del barrido. La MAC también va
+  al final del saludo TCP y es lo que identifica a una placa aunque
+  cambie su IP.
+- AddressBook guarda las placas encontradas (direcciones_esp32.json) con la
+  hora en que se vieron; las de más de ttl segundos se ignoran.
+- DeviceLocator mantiene al día las direcciones de devices.DeviceRegistry:
+  al arrancar comprueba en paralelo las direcciones guardadas y, si una
+  placa ya no contesta allí (o se desconecta después), la busca por su MAC
+  y cambia su dirección; DevicePool reemplaza entonces su cliente. Las
+  placas con la conexión del grupo abierta no se prueban: el firmware
+  atiende un solo cliente TCP y la prueba fallaría.
+"""
+import asyncio
+import ipaddress
+import json
+import os
+import re
+import socket
+import threading
+import time
+
+from esp32_client import GREETING_PREFIX
+
+DEFAULT_PATH = "direcciones_esp32.json"
+DEFAULT_PORT = 1234
+BEACON_PORT = 1235
+# Segundos entre anuncios (BEACON_INTERVAL del firmware)
+BEACON_INTERVAL = 2.0
+
+_ID = re.compile(r"\bid=(\S+)")
+_PORT = re.compile(r"\bport=(\d+)")
+
+
+class Discovered:
+    """Una placa encontrada: dirección, MAC (None en firmware antiguo) y hora"""
+
+    __slots__ = ("host", "port", "device_id", "seen")
+
+    def __init__(self, host, port=DEFAULT_PORT, device_id=None, seen=None):
+        self.host = host
+        self.port = port
+        self.device_id = device_id
+        self.seen = time.time() if seen is None else seen
+
+    @property
+    def address(self):
+        return self.host, self.port
+
+    def __repr__(self):
+        return f"Discovered({self.host!r}, {self.port}, device_id={self.device_id!r})"
+
+
+def beacon_text(device_id, port=DEFAULT_PORT):
+    """Anuncio UDP del firmware (el emulador envía el mismo)"""
+    if device_id is None:
+        return f"{GREETING_PREFIX} port={port}"
+    return f"{GREETING_PREFIX} id={device_id} port={port}"
+
+
+def parse_greeting(line):
+    """Saludo o anuncio -> (es un ESP32, MAC o None, puerto o None)"""
+    if not line.startswith(GREETING_PREFIX):
+        return False, None, None
+    device_id = _ID.search(line)
+    port = _PORT.search(line)
+    return True, device_id and device_id.group(1), port and int(port.group(1))
+
+
+def local_network():
+    """Red /24 de la interfaz con la que se sale a la red local"""
+    probe = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        # connect() en UDP no envía nada: solo elige la interfaz de salida
+        probe.connect(("10.255.255.255", 1))
+        address = probe.getsockname()[0]
+    except OSError:
+        address = "127.0.0.1"
+    finally:
+        probe.close()
+    return str(ipaddress.ip_network(f"{address}/24", strict=False))
+
+
+def network_hosts(*networks):
+    """Direcciones de las redes dadas, sin repetir ("10.0.0.0/24", "10.0.0.7"...)"""
+    hosts = {}
+    for network in networks:
+        for host in ipaddress.ip_network(network, strict=False).hosts():
+            hosts[str(host)] = None
+    return list(hosts)
+
+
+async def probe(host, port=DEFAULT_PORT, timeout=0.5):
+    """Abre una conexión y lee el saludo; Discovered si es un ESP32, si no None"""
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    except (OSError, asyncio.TimeoutError):
+        return None
+    finally:
+        writer.close()
+    is_esp32, device_id, _ = parse_greeting(line.decode(errors="replace").strip())
+    return Discovered(host, port, device_id) if is_esp32 else None
+
+
+async def scan(hosts, port=DEFAULT_PORT, timeout=0.5, concurrency=256):
+    """Prueba todas las direcciones a la vez (como mucho concurrency conexiones)"""
+    limit = asyncio.Semaphore(concurrency)
+
+    async def limited(address):
+        host, address_port = address if isinstance(address, tuple) else (address, port)
+        async with limit:
+            return await probe(host, address_port, timeout)
+
+    results = await asyncio.gather(*(limited(address) for address in hosts))
+    return [found for found in results if found is not None]
+
+
+class _BeaconProtocol(asyncio.DatagramProtocol):
+    def __init__(self, found):
+        self.found = found
+
+    def datagram_received(self, data, addr):
+        is_esp32, device_id, port = parse_greeting(data.decode(errors="replace").strip())
+        if is_esp32:
+            self.found[device_id or addr[0]] = Discovered(addr[0], port or DEFAULT_PORT, device_id)
+
+
+async def listen_beacons(duration, port=BEACON_PORT):
+    """Anuncios recibidos durante duration segundos ([] si el puerto está ocupado)"""
+    found = {}
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind(("", port))
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _BeaconProtocol(found), sock=sock)
+    except OSError:
+        sock.close()
+        return []
+    try:
+        await asyncio.sleep(duration)
+    finally:
+        transport.close()
+    return list(found.values())
+
+
+async def discover_async(hosts, port=DEFAULT_PORT, timeout=0.5, beacon_port=BEACON_PORT,
+                         beacon_wait=None, concurrency=256):
+    """Barrido de hosts y escucha de anuncios a la vez; una entrada por placa"""
+    if beacon_wait is None:
+        # Menos que un intervalo entero perdería el anuncio la mitad de las veces
+        beacon_wait = BEACON_INTERVAL + timeout
+    tasks = [scan(hosts, port, timeout, concurrency)]
+    if beacon_port:
+        tasks.append(listen_beacons(beacon_wait, beacon_port))
+    results = await asyncio.gather(*tasks)
+    boards = {}
+    for found in (found for result in results for found in result):
+        # Una placa sin MAC (firmware antiguo) se distingue por su dirección
+        boards[found.device_id or found.address] = found
+    return list(boards.values())
+
+
+def discover(networks=None, port=DEFAULT_PORT, timeout=0.5, beacon_port=BEACON_PORT,
+             beacon_wait=None, concurrency=256):
+    """Busca placas en las redes dadas (por defecto la /24 local)"""
+    hosts = network_hosts(*(networks or [local_network()]))
+    return asyncio.run(discover_async(hosts, port, timeout, beacon_port, beacon_wait, concurrency))
+
+
+class AddressBook:
+    """Placas encontradas (por MAC, o por dirección si no la hay) en un archivo JSON.
+
+    fresh() descarta las que no se vieron en los últimos ttl segundos.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=24 * 3600):
+        self.path = path
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._boards = {}
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            for entry in data.get("boards", []):
+                found = Discovered(entry["host"], entry.get("port", DEFAULT_PORT), entry.get("id"),
+                                   entry.get("seen", 0))
+                self._boards[self._key(found)] = found
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    @staticmethod
+    def _key(found):
+        return found.device_id or f"{found.host}:{found.port}"
+
+    def record(self, boards):
+        with self._lock:
+            for found in boards:
+                if found.device_id is not None:
+                    # La placa cambió de IP: su dirección vieja ya no le corresponde
+                    self._boards.pop(f"{found.host}:{found.port}", None)
+                self._boards[self._key(found)] = found
+
+    def fresh(self):
+        """Placas vistas hace menos de ttl segundos"""
+        limit = time.time() - self.ttl
+        with self._lock:
+            return [found for found in self._boards.values() if found.seen >= limit]
+
+    def find(self, device_id):
+        with self._lock:
+            return self._boards.get(device_id)
+
+    def save(self):
+        """Escribe el archivo de forma atómica (archivo temporal + replace)"""
+        with self._lock:
+            data = {"boards": [{"host": found.host, "port": found.port, "id": found.device_id,
+                                "seen": found.seen} for found in self._boards.values()]}
+            text = json.dumps(data, indent=2, ensure_ascii=False)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(temporary, self.path)
+
+
+class DeviceLocator:
+    """Direcciones al día para las placas de un devices.DeviceRegistry.
+
+    revalidate() comprueba a la vez las direcciones del registro y las de
+    la libreta; solo si falta alguna placa (o el registro está vacío) barre
+    las redes (la /24 local y las de las direcciones conocidas). Una placa
+    se reconoce por su MAC; si una placa sin MAC es la única que falta y
+    aparece una sola placa nueva, se le asigna esa. on_state(placa,
+    conectado, error) se conecta al de DevicePool: si una placa se
+    desconecta y no vuelve en grace segundos queda pendiente de búsqueda;
+    la búsqueda empieza en cuanto termina la que esté en marcha (como mucho
+    una cada min_interval s) y cubre a todas las pendientes.
+    on_change(placa, Discovered) avisa de cada dirección cambiada y
+    on_found(lista) de cada búsqueda; ambos se llaman desde el hilo del
+    localizador.
+    """
+
+    def __init__(self, registry, pool=None, book=None, networks=None, port=DEFAULT_PORT,
+                 timeout=0.5, beacon_port=BEACON_PORT, grace=3.0, min_interval=30.0,
+                 on_change=None, on_found=None):
+        self.registry = registry
+        self.pool = pool
+        self.book = book if book is not None else AddressBook()
+        self.networks = networks
+        self.port = port
+        self.timeout = timeout
+        self.beacon_port = beacon_port
+        self.grace = grace
+        self.min_interval = min_interval
+        self.on_change = on_change
+        self.on_found = on_found
+        self.stats = {"revalidations": 0, "scans": 0, "moved": 0}
+        self._lock = threading.Lock()
+        self._busy = False
+        self._last_search = time.monotonic() - min_interval
+        # Placas desconectadas: esperando el plazo de gracia o la búsqueda
+        self._grace_timers = {}
+        self._pending = set()
+        self._retry_timer = None
+
+    def start(self):
+        """revalidate() y conexión de todas las placas en segundo plano"""
+        return self._spawn(self.revalidate)
+
+    def start_search(self):
+        """search() en segundo plano (False si ya hay una búsqueda en marcha)"""
+        return self._spawn(self.search)
+
+    def on_state(self, name, connected, error=None):
+        with self._lock:
+            if connected:
+                timer = self._grace_timers.pop(name, None)
+                if timer is not None:
+                    timer.cancel()
+                self._pending.discard(name)
+                return
+            if name in self._grace_timers or name in self._pending:
+                return
+            # El cliente reconecta solo si fue un corte breve: se espera sin ocupar el localizador
+            timer = self._grace_timers[name] = threading.Timer(self.grace, self._grace_expired, (name,))
+            timer.daemon = True
+        timer.start()
+
+    def close(self):
+        with self._lock:
+            timers = list(self._grace_timers.values()) + [self._retry_timer]
+            self._grace_timers.clear()
+            self._pending.clear()
+        for timer in timers:
+            if timer is not None:
+                timer.cancel()
+
+    def revalidate(self):
+        """Comprueba las direcciones guardadas; devuelve {placa: Discovered} de las que cambiaron"""
+        self.stats["revalidations"] += 1
+        connected = self._connected_boards()
+        addresses = {address for address in self.registry.devices.values()}
+        addresses.update(found.address for found in self.book.fresh())
+        addresses.difference_update(board.address for board in connected)
+        alive = asyncio.run(scan(sorted(addresses), self.port, self.timeout)) + connected
+        self.book.record(alive)
+        moved = self._assign(alive)
+        if self._missing(alive) or not self.registry.devices:
+            moved.update(self.search())
+        else:
+            self._save()
+        return moved
+
+    def search(self):
+        """Barrido completo de las redes y asignación por MAC"""
+        self.stats["scans"] += 1
+        with self._lock:
+            self._last_search = time.monotonic()
+        connected = self._connected_boards()
+        skip = {board.host for board in connected}
+        hosts = [host for host in network_hosts(*self._networks()) if host not in skip]
+        found = asyncio.run(discover_async(hosts, self.port, self.timeout, self.beacon_port))
+        boards = {board.device_id or board.address: board for board in connected}
+        boards.update((board.device_id or board.address, board) for board in found)
+        boards = list(boards.values())
+        self.book.record(boards)
+        moved = self._assign(boards)
+        self._save()
+        if self.on_found is not None:
+            self.on_found(boards)
+        return moved
+
+    def _connected_boards(self):
+        """Placas con conexión abierta en el grupo: siguen vivas y no se prueban"""
+        if self.pool is None:
+            return []
+        boards = []
+        for name in self.pool.connected():
+            address = self.registry.devices.get(name)
+            if address is not None:
+                boards.append(Discovered(*address, device_id=self.registry.ids.get(name)))
+        return boards
+
+    def _networks(self):
+        if self.networks:
+            return self.networks
+        networks = [local_network()]
+        for host, _ in self.registry.devices.values():
+            try:
+                network = str(ipaddress.ip_network(f"{host}/24", strict=False))
+            except ValueError:
+                continue  # Un nombre de host, no una IP
+            if network not in networks:
+                networks.append(network)
+        return networks
+
+    def _missing(self, boards):
+        """Placas del registro que no están en boards"""
+        found = {board.address for board in boards}
+        return [name for name, address in self.registry.devices.items() if address not in found]
+
+    def _assign(self, boards):
+        """Aprende las MAC de las placas que contestaron y mueve las que cambiaron de IP"""
+        by_address = {board.address: board for board in boards}
+        by_id = {board.device_id: board for board in boards if board.device_id is not None}
+        moved = {}
+        for name, address in list(self.registry.devices.items()):
+            device_id = self.registry.ids.get(name)
+            board = by_address.get(address)
+            if board is not None:
+                if board.device_id is not None and board.device_id != device_id:
+                    self.registry.add(name, *address, device_id=board.device_id)
+                continue
+            board = by_id.get(device_id) if device_id is not None else None
+            if board is not None:
+                moved[name] = board
+        # Una sola placa sin MAC perdida y una sola placa nueva: es ella
+        known = set(self.registry.devices.values()) | {board.address for board in moved.values()}
+        known_ids = set(self.registry.ids.values())
+        unknown = [board for board in boards
+                   if board.address not in known and board.device_id not in known_ids]
+        lost = [name for name in self._missing(boards)
+                if name not in moved and self.registry.ids.get(name) is None]
+        if len(lost) == 1 and len(unknown) == 1:
+            moved[lost[0]] = unknown[0]
+        for name, board in moved.items():
+            self.stats["moved"] += 1
+            self.registry.add(name, board.host, board.port, device_id=board.device_id)
+            if self.on_change is not None:
+                self.on_change(name, board)
+        return moved
+
+    def _save(self):
+        for store in (self.book, self.registry):
+            try:
+                store.save()
+            except OSError:
+                pass
+
+    def _spawn(self, task, *args):
+        with self._lock:
+            if self._busy:
+                return False
+            self._busy = True
+        threading.Thread(target=self._run, args=(task, *args), name="esp32-locator",
+                         daemon=True).start()
+        return True
+
+    def _run(self, task, *args):
+        try:
+            task(*args)
+        finally:
+            with self._lock:
+                self._busy = False
+        if self.pool is not None and self.registry.devices:
+            # Con la dirección nueva en el registro el grupo reemplaza el cliente
+            self.pool.connect()
+        # Las desconexiones avisadas durante la tarea se atienden ahora
+        self._search_pending()
+
+    def _grace_expired(self, name):
+        with self._lock:
+            self._grace_timers.pop(name, None)
+        if self.pool is not None and name in self.pool.connected():
+            return
+        with self._lock:
+            self._pending.add(name)
+        self._search_pending()
+
+    def _search_pending(self):
+        with self._lock:
+            if self._busy or not self._pending:
+                return
+            wait = self._last_search + self.min_interval - time.monotonic()
+            if wait > 0:
+                # Límite de búsquedas: se reintenta cuando se cumpla
+                if self._retry_timer is None:
+                    self._retry_timer = threading.Timer(wait, self._retry)
+                    self._retry_timer.daemon = True
+                    self._retry_timer.start()
+                return
+            self._pending.clear()
+            self._busy = True
+        threading.Thread(target=self._run, args=(self.search,), name="esp32-locator",
+                         daemon=True).start()
+
+    def _retry(self):
+        with self._lock:
+            self._retry_timer = None
+        self._search_pending()
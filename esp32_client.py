@@ -0,0 +1,395 @@
+"""Cliente asíncrono para el protocolo JSON por líneas del ESP32.
+
+Reemplaza el sendall + recv(1024) bloqueante de prueba3.send_to_esp32: un
+hilo dedicado ejecuta un bucle asyncio con una cola de salida, envía varios
+comandos seguidos sin esperar cada respuesta (pipelining), empareja las
+respuestas por línea con sus peticiones en orden y se reconecta solo con
+espera exponencial. La interfaz recibe Futures o callbacks y nunca se bloquea.
+
+Con protocol="auto" (por defecto) negocia al conectar el protocolo binario
+de esp32_protocol.py y, si el firmware lo acepta, agrupa los comandos
+pendientes en una sola trama; si no, sigue con JSON.
+"""
+import asyncio
+import collections
+import concurrent.futures
+import json
+import threading
+import time
+
+import esp32_protocol
+from metrics import METRICS
+
+GREETING_PREFIX = "ESP32 listo"
+
+
+class CommandExpired(TimeoutError):
+    """El comando venció (hora límite del llamador) antes de poder enviarse"""
+
+
+class ESP32Client:
+    """Cliente en segundo plano con cola de salida y reconexión automática.
+
+    El firmware responde exactamente una línea por comando y en el mismo
+    orden, así que las respuestas se asignan a las peticiones pendientes en
+    orden FIFO. Si una respuesta no llega a tiempo ya no es posible saber a
+    qué petición corresponden las siguientes: se fallan las pendientes con
+    TimeoutError y se reabre la conexión.
+
+    En metrics se registran las etapas send (espera en la cola de salida)
+    y response (ida y vuelta desde que se escribe) y los contadores esp32_*.
+
+    Con loop (un bucle asyncio que ya corre en otro hilo) el cliente no
+    crea hilo propio: así devices.DevicePool atiende muchas placas con un
+    solo hilo.
+
+    send(..., priority=True) usa un carril aparte que el escritor vacía
+    antes que la cola normal; send(..., deadline=hora) descarta el comando
+    con CommandExpired si a esa hora (time.time()) aún no salió.
+    """
+
+    def __init__(self, host, port=1234, timeout=5.0, connect_timeout=5.0, max_in_flight=8,
+                 reconnect_delay=0.5, max_reconnect_delay=10.0, on_state=None, metrics=None,
+                 loop=None, protocol="auto"):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_in_flight = max_in_flight
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.on_state = on_state
+        self.metrics = metrics or METRICS
+        if protocol not in ("auto", "json"):
+            raise ValueError(f"Protocolo desconocido: {protocol!r}")
+        self.protocol = protocol
+
+        self.connected = False
+        # True si la conexión actual usa tramas binarias
+        self.binary = False
+        self.stats = {"sent": 0, "responses": 0, "timeouts": 0, "expired": 0, "errors": 0,
+                      "reconnects": 0, "max_in_flight": 0, "frames": 0, "bytes_sent": 0}
+        self._seq = 0
+
+        self._shared_loop = loop
+        self._loop = None
+        self._thread = None
+        self._started = False
+        self._main_task = None
+        self._closed = False
+        self._outbox = collections.deque()
+        self._urgent = collections.deque()
+        self._outbox_ready = None
+        self._slot_free = None
+        self._in_flight = collections.deque()
+
+    def start(self):
+        """Inicia la conexión en segundo plano (en su hilo o en el bucle compartido)"""
+        if self._started:
+            return
+        self._started = True
+        self._closed = False
+        if self._shared_loop is not None:
+            self._loop = self._shared_loop
+            self._loop.call_soon_threadsafe(self._attach)
+            return
+        self._loop = asyncio.new_event_loop()
+        ready = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(ready,),
+                                        name="esp32-client", daemon=True)
+        self._thread.start()
+        ready.wait()
+
+    def close(self):
+        """Cierra la conexión y detiene el hilo del cliente (si tiene uno propio)"""
+        if not self._started:
+            return
+        self._closed = True
+        done = asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout=2)
+            self._thread = None
+        else:
+            try:
+                done.result(timeout=2)
+            except Exception:
+                pass
+        self._started = False
+
+    def send(self, command, callback=None, deadline=None, priority=False):
+        """Encola un comando y devuelve un Future con la respuesta (str).
+
+        El Future falla con TimeoutError si no hay respuesta a tiempo, con
+        CommandExpired si llega deadline (time.time()) sin haberse enviado o
+        con ConnectionError si la conexión se pierde con el comando en vuelo.
+        callback(future) se llama desde el hilo del cliente al terminar.
+        """
+        future = concurrent.futures.Future()
+        if callback is not None:
+            future.add_done_callback(callback)
+        if not self._started:
+            self.start()
+        expires = None
+        if deadline is not None:
+            # Hora de reloj -> reloj monótono, que es el que usa el escritor
+            expires = time.monotonic() + (deadline - time.time())
+        self._loop.call_soon_threadsafe(self._enqueue, command, future, time.perf_counter(), expires,
+                                        priority)
+        return future
+
+    @staticmethod
+    def encode(command):
+        """Mensaje JSON por línea que espera el firmware"""
+        message = json.dumps({
+            "command": command,
+            "timestamp": time.time(),
+            "type": "control"
+        })
+        return message.encode() + b"\n"
+
+    # --- Hilo del cliente -------------------------------------------------
+
+    def _run_loop(self, ready):
+        asyncio.set_event_loop(self._loop)
+        self._attach()
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+        self._loop.close()
+
+    def _attach(self):
+        self._outbox_ready = asyncio.Event()
+        self._slot_free = asyncio.Event()
+        self._main_task = self._loop.create_task(self._connection_loop())
+
+    async def _shutdown(self):
+        if self._thread is not None:
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        else:
+            # Bucle compartido: solo las tareas de este cliente (las de la
+            # conexión se cancelan al cancelar la principal)
+            tasks = [self._main_task]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._fail_all(ConnectionError("Cliente cerrado"), include_outbox=True)
+        if self._thread is not None:
+            self._loop.stop()
+
+    def _enqueue(self, command, future, queued, expires=None, priority=False):
+        if self._closed:
+            future.set_exception(ConnectionError("Cliente cerrado"))
+            return
+        lane = self._urgent if priority else self._outbox
+        lane.append((command, future, time.monotonic() + self.timeout, queued, expires))
+        self._outbox_ready.set()
+
+    def _count(self, name, amount=1):
+        self.stats[name] += amount
+        self.metrics.inc(f"esp32_{name}", amount)
+
+    def _set_state(self, connected, error=None):
+        self.connected = connected
+        self.metrics.set("esp32_connected", int(connected))
+        if self.on_state is not None:
+            self.on_state(connected, error)
+
+    async def _connection_loop(self):
+        delay = self.reconnect_delay
+        first = True
+        while not self._closed:
+            if not first:
+                self._count("reconnects")
+            first = False
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(self.host, self.port), self.connect_timeout)
+                self.binary = False
+                if self.protocol == "auto":
+                    try:
+                        self.binary = await asyncio.wait_for(self._negotiate(reader, writer),
+                                                             self.connect_timeout)
+                    except BaseException:
+                        writer.close()
+                        raise
+            except (OSError, asyncio.TimeoutError) as e:
+                self._set_state(False, e)
+                # Los comandos en cola que ya vencieron no se envían tarde
+                self._expire_outbox()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+
+            delay = self.reconnect_delay
+            self._set_state(True)
+            try:
+                error = await self._serve(reader, writer)
+            finally:
+                writer.close()
+            self._fail_all(error)
+            self._set_state(False, error)
+
+    async def _negotiate(self, reader, writer):
+        """Propone el protocolo binario; True si el firmware lo aceptó"""
+        writer.write(self.encode(esp32_protocol.NEGOTIATE_COMMAND))
+        await writer.drain()
+        while True:
+            line = await reader.readline()
+            if not line:
+                raise ConnectionError("Conexión cerrada por el ESP32")
+            response = line.decode(errors="replace").strip()
+            if not response or response.startswith(GREETING_PREFIX):
+                continue
+            # Un firmware antiguo responde "ERROR: Comando desconocido"
+            return response == esp32_protocol.NEGOTIATE_REPLY
+
+    async def _serve(self, reader, writer):
+        """Atiende una conexión hasta que se pierde; devuelve la causa"""
+        tasks = [asyncio.ensure_future(self._writer(writer)),
+                 asyncio.ensure_future(self._reader(reader))]
+        try:
+            done, pending = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for task in tasks:
+                task.cancel()
+        error = None
+        for task in done:
+            if not task.cancelled() and task.exception() is not None:
+                error = task.exception()
+        return error or ConnectionError("Conexión cerrada por el ESP32")
+
+    async def _writer(self, writer):
+        while True:
+            while not self._urgent and not self._outbox:
+                self._outbox_ready.clear()
+                await self._outbox_ready.wait()
+            while len(self._in_flight) >= self.max_in_flight:
+                self._slot_free.clear()
+                await self._slot_free.wait()
+            # Todo lo pendiente que quepa en vuelo sale en una sola escritura
+            # (una trama con el protocolo binario)
+            batch = []
+            written = time.perf_counter()
+            while ((self._urgent or self._outbox) and len(batch) < esp32_protocol.MAX_BATCH
+                   and len(self._in_flight) < self.max_in_flight):
+                lane = self._urgent or self._outbox
+                command, future, deadline, queued, expires = lane.popleft()
+                if future.cancelled() or self._expired(command, future, deadline, expires):
+                    continue
+                self._seq = (self._seq + 1) & 0xFFFF
+                self.metrics.observe("send", written - queued)
+                self._in_flight.append((command, future, time.monotonic() + self.timeout, written,
+                                        self._seq))
+                batch.append((self._seq, command))
+            if not batch:
+                continue
+            if self.binary:
+                data = esp32_protocol.encode_requests(batch)
+                self._count("frames")
+            else:
+                data = b"".join(self.encode(command) for _, command in batch)
+            writer.write(data)
+            self._count("sent", len(batch))
+            self.stats["bytes_sent"] += len(data)
+            self.metrics.set("esp32_in_flight", len(self._in_flight))
+            self.stats["max_in_flight"] = max(self.stats["max_in_flight"], len(self._in_flight))
+            await writer.drain()
+
+    async def _reader(self, reader):
+        while True:
+            # Sin peticiones en vuelo se despierta cada self.timeout para
+            # recalcular el plazo de las que se envíen mientras tanto
+            timeout = self.timeout
+            if self._in_flight:
+                timeout = max(0.0, self._in_flight[0][2] - time.monotonic())
+            try:
+                if self.binary:
+                    header = await asyncio.wait_for(reader.readexactly(esp32_protocol.HEADER.size), timeout)
+                else:
+                    line = await asyncio.wait_for(reader.readline(), timeout)
+            except asyncio.TimeoutError:
+                if not self._in_flight or self._in_flight[0][2] > time.monotonic():
+                    continue
+                self._count("timeouts")
+                raise TimeoutError("El ESP32 no respondió (timeout)")
+            except asyncio.IncompleteReadError:
+                raise ConnectionError("Conexión cerrada por el ESP32")
+            if self.binary:
+                await self._read_frame(reader, header)
+                continue
+            if not line:
+                raise ConnectionError("Conexión cerrada por el ESP32")
+            response = line.decode(errors="replace").strip()
+            if not response or response.startswith(GREETING_PREFIX):
+                continue
+            if not self._in_flight:
+                # Línea sin petición pendiente (p. ej. respuesta tardía): se ignora
+                continue
+            self._resolve(self._in_flight.popleft(), response)
+
+    async def _read_frame(self, reader, header):
+        """Respuestas de una trama binaria; cada una corresponde a la petición más antigua"""
+        try:
+            length = esp32_protocol.decode_header(header)
+            payload = await asyncio.wait_for(reader.readexactly(length), self.timeout)
+            records = esp32_protocol.decode_responses(payload)
+        except ValueError as e:
+            raise ConnectionError(f"Trama inválida del ESP32: {e}")
+        except asyncio.TimeoutError:
+            raise TimeoutError("Trama incompleta del ESP32 (timeout)")
+        except asyncio.IncompleteReadError:
+            raise ConnectionError("Conexión cerrada por el ESP32")
+        for status, seq, flags, value in records:
+            if not self._in_flight or self._in_flight[0][4] != seq:
+                raise ConnectionError(f"Respuesta fuera de orden del ESP32 (secuencia {seq})")
+            entry = self._in_flight.popleft()
+            op = esp32_protocol.parse_command(entry[0])[0]
+            self._resolve(entry, esp32_protocol.response_text(op, status, flags, value))
+
+    def _resolve(self, entry, response):
+        command, future, _, written, _ = entry
+        self._slot_free.set()
+        self.metrics.observe("response", time.perf_counter() - written)
+        self.metrics.set("esp32_in_flight", len(self._in_flight))
+        self._count("responses")
+        if not future.done():
+            future.set_result(response)
+
+    def _expired(self, command, future, deadline, expires):
+        """Falla el futuro si venció su hora límite o el timeout; True si lo hizo"""
+        now = time.monotonic()
+        if expires is not None and now > expires:
+            self._count("expired")
+            error = CommandExpired(f"Comando vencido antes de enviarse: {command}")
+        elif now > deadline:
+            self._count("timeouts")
+            error = TimeoutError(f"Comando vencido antes de enviarse: {command}")
+        else:
+            return False
+        if not future.done():
+            future.set_exception(error)
+        return True
+
+    def _expire_outbox(self):
+        for lane in (self._urgent, self._outbox):
+            waiting = [entry for entry in lane if not self._expired(*entry[:3], entry[4])]
+            lane.clear()
+            lane.extend(waiting)
+
+    def _fail_all(self, error, include_outbox=False):
+        if isinstance(error, TimeoutError):
+            exception = error
+        else:
+            exception = ConnectionError(str(error))
+            self._count("errors", len(self._in_flight))
+        while self._in_flight:
+            future = self._in_flight.popleft()[1]
+            if not future.done():
+                future.set_exception(exception)
+        self.metrics.set("esp32_in_flight", 0)
+        if self._slot_free is not None:
+            self._slot_free.set()
+        for lane in (self._urgent, self._outbox):
+            while include_outbox and lane:
+                future = lane.popleft()[1]
+                if not future.done():
+                    future.set_exception(exception)
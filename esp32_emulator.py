@@ -0,0 +1,425 @@
+"""Emulador local del firmware balancin_comunicacion.ino.
+
+Servidor TCP que habla el mismo protocolo que el ESP32 (saludo, JSON por
+línea, LED_ON/LED_OFF, FREQ:X.X, FREQ_UP/FREQ_DOWN, FREQ_FAST/FREQ_SLOW,
+STATUS y las respuestas de error) para probar y medir prueba3.py y
+esp32_client.py sin placa. Permite inyectar latencia, variación (jitter),
+respuestas perdidas y desconexiones, y atiende muchos clientes a la vez.
+También negocia el protocolo binario de esp32_protocol.py (con
+binary=False se comporta como un firmware que solo entiende JSON) y, con
+udp=True, atiende el canal UDP de esp32_udp.py en el mismo número de
+puerto. loss simula una WiFi con pérdidas en ambos transportes.
+Con device_id el saludo lleva la MAC emulada y, con beacon=(host, puerto),
+envía cada beacon_interval segundos el anuncio de discovery.py.
+"""
+import argparse
+import asyncio
+import collections
+import json
+import random
+import threading
+import time
+
+import esp32_protocol as protocol
+from discovery import BEACON_INTERVAL, BEACON_PORT, beacon_text
+
+GREETING = "ESP32 listo - Envía JSON con comando 'command'"
+
+
+class DeviceState:
+    """Estado del firmware (LED y frecuencia de parpadeo) y sus respuestas"""
+
+    def __init__(self):
+        self.led_on = False
+        self.current_frequency = 1.0
+        self._started = time.monotonic()
+
+    @property
+    def led_state(self):
+        """Estado del parpadeo que reporta STATUS (variable ledState del sketch)"""
+        if self.current_frequency <= 0:
+            return False
+        elapsed = time.monotonic() - self._started
+        return int(elapsed * 2 * self.current_frequency) % 2 == 1
+
+    def handle_message(self, message):
+        """Procesa una línea JSON como processMessage() del sketch"""
+        message = message.strip()
+        try:
+            doc = json.loads(message)
+        except ValueError:
+            return "ERROR: JSON inválido"
+        command = doc.get("command") if isinstance(doc, dict) else None
+        return self.apply(command)
+
+    def apply(self, command):
+        """Aplica un comando y devuelve la línea de respuesta"""
+        op, arg = protocol.parse_command(command)
+        return protocol.response_text(op, *self.apply_op(op, arg))
+
+    def apply_op(self, op, arg=0.0):
+        """Aplica un código de esp32_protocol; devuelve (estado, banderas, frecuencia)"""
+        status = protocol.STATUS_OK
+        if op == protocol.OP_LED_ON:
+            self.led_on = True
+        elif op == protocol.OP_LED_OFF:
+            self.led_on = False
+        elif op == protocol.OP_FREQ:
+            if 0 <= arg <= 10:
+                self.current_frequency = arg
+            else:
+                status = protocol.STATUS_RANGE
+        elif op == protocol.OP_FREQ_UP:
+            self.current_frequency = min(10.0, self.current_frequency + 0.5)
+        elif op == protocol.OP_FREQ_DOWN:
+            self.current_frequency = max(0.0, self.current_frequency - 0.5)
+        elif op == protocol.OP_FREQ_FAST:
+            self.current_frequency = 5.0
+        elif op == protocol.OP_FREQ_SLOW:
+            self.current_frequency = 1.0
+        elif op != protocol.OP_STATUS:
+            status = protocol.STATUS_UNKNOWN
+        flags = protocol.FLAG_LED if self.led_state else 0
+        return status, flags, self.current_frequency
+
+
+# Secuencias aplicadas que recuerda cada sesión UDP (UDP_WINDOW en el sketch)
+UDP_WINDOW = 32
+
+
+class UDPSession:
+    """Secuencias ya aplicadas de un cliente UDP: un reenvío no repite el comando.
+
+    Un comando absoluto (LED o frecuencia) más viejo que otro ya aplicado
+    sobre lo mismo llegó desordenado: se confirma sin aplicarlo.
+    """
+
+    def __init__(self, session, state, window=UDP_WINDOW):
+        self.session = session
+        self.state = state
+        self.applied = collections.OrderedDict()
+        self.window = window
+        self.latest = {}
+
+    def handle(self, op, seq, arg):
+        """Devuelve (registro de respuesta, qué pasó: applied, duplicate o superseded)"""
+        cached = self.applied.get(seq)
+        if cached is not None:
+            return cached, "duplicate"
+        target = None
+        if op in (protocol.OP_LED_ON, protocol.OP_LED_OFF):
+            target = "led"
+        elif op in (protocol.OP_FREQ, protocol.OP_FREQ_FAST, protocol.OP_FREQ_SLOW):
+            # FREQ_UP/FREQ_DOWN son relativos: se aplican siempre (una vez)
+            target = "frequency"
+        if target is not None and target in self.latest and protocol.seq_newer(self.latest[target], seq):
+            outcome = "superseded"
+            status, flags, value = self.state.apply_op(protocol.OP_STATUS)
+        else:
+            outcome = "applied"
+            status, flags, value = self.state.apply_op(op, arg)
+            if target is not None:
+                self.latest[target] = seq
+        record = (status, seq, flags, value)
+        self.applied[seq] = record
+        if len(self.applied) > self.window:
+            self.applied.popitem(last=False)
+        return record, outcome
+
+
+class _UDPDevice(asyncio.DatagramProtocol):
+    def __init__(self, emulator):
+        self.emulator = emulator
+        self.transport = None
+        self.sessions = {}
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        emulator = self.emulator
+        stats = emulator.stats
+        stats["udp_datagrams"] += 1
+        if emulator._lost():
+            return
+        try:
+            session, payload = protocol.decode_datagram(data)
+            requests = protocol.decode_requests(payload)
+        except ValueError:
+            return
+        peer = self.sessions.get(addr)
+        if peer is None or peer.session != session:
+            state = emulator.state if emulator.shared_state else DeviceState()
+            peer = self.sessions[addr] = UDPSession(session, state)
+        responses = []
+        for op, seq, arg in requests:
+            record, outcome = peer.handle(op, seq, arg)
+            stats[f"udp_{outcome}"] += 1
+            responses.append(record)
+        reply = protocol.encode_datagram(session, protocol.response_payload(responses))
+        delay = emulator.latency + (emulator.random.uniform(0, emulator.jitter) if emulator.jitter else 0.0)
+        # Con jitter las respuestas pueden llegar desordenadas, como en la red
+        asyncio.get_running_loop().call_later(delay, self._reply, reply, addr)
+
+    def _reply(self, data, addr):
+        if self.emulator._lost() or self.transport is None or self.transport.is_closing():
+            return
+        self.transport.sendto(data, addr)
+        self.emulator.stats["bytes_out"] += len(data)
+
+
+class ESP32Emulator:
+    """Servidor TCP que emula el ESP32 con fallos configurables.
+
+    latency/jitter: segundos añadidos antes de cada respuesta (jitter es el
+    máximo adicional, uniforme). drop_rate: probabilidad de no responder.
+    disconnect_rate: probabilidad de cerrar la conexión al recibir un
+    comando. loop_delay=0.01 reproduce el delay(10) del loop() del sketch.
+    Con shared_state=False cada cliente tiene su propio DeviceState. Con
+    binary=False no acepta el protocolo binario (firmware antiguo).
+
+    loss es la probabilidad de perder cada paquete en cada sentido. Por UDP
+    el datagrama se pierde; por TCP el sistema lo retransmite tras tcp_rto
+    segundos (el doble en cada nueva pérdida), y todo lo que viene detrás
+    en la conexión espera (bloqueo de cabeza de línea).
+    """
+
+    def __init__(self, host="127.0.0.1", port=1234, latency=0.0, jitter=0.0, drop_rate=0.0,
+                 disconnect_rate=0.0, loop_delay=0.0, shared_state=True, seed=None, binary=True,
+                 udp=False, loss=0.0, tcp_rto=0.2, device_id=None, beacon=None,
+                 beacon_interval=BEACON_INTERVAL):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.disconnect_rate = disconnect_rate
+        self.loop_delay = loop_delay
+        self.shared_state = shared_state
+        self.binary = binary
+        self.udp = udp
+        self.loss = loss
+        self.tcp_rto = tcp_rto
+        self.device_id = device_id
+        self.beacon = beacon
+        self.beacon_interval = beacon_interval
+        self.state = DeviceState()
+        self.random = random.Random(seed)
+        self.stats = {"connections": 0, "active": 0, "messages": 0, "responses": 0,
+                      "dropped": 0, "disconnects": 0, "binary_connections": 0, "frames": 0,
+                      "bytes_in": 0, "bytes_out": 0, "lost": 0, "tcp_retransmits": 0,
+                      "udp_datagrams": 0, "udp_applied": 0, "udp_duplicate": 0, "udp_superseded": 0,
+                      "beacons": 0}
+
+        self._server = None
+        self._udp = None
+        self._beacon_task = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self):
+        """Abre el socket de escucha; devuelve (host, puerto) reales"""
+        self._server = await asyncio.start_server(self._handle_client, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        if self.udp:
+            self._udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: _UDPDevice(self), local_addr=(self.host, self.port))
+        if self.beacon is not None:
+            self._beacon_task = asyncio.get_running_loop().create_task(self._send_beacons())
+        return self.host, self.port
+
+    @property
+    def greeting(self):
+        return GREETING if self.device_id is None else f"{GREETING} id={self.device_id}"
+
+    async def _send_beacons(self):
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+            asyncio.DatagramProtocol, local_addr=(self.host, 0), allow_broadcast=True)
+        message = beacon_text(self.device_id, self.port).encode()
+        try:
+            while True:
+                transport.sendto(message, self.beacon)
+                self.stats["beacons"] += 1
+                await asyncio.sleep(self.beacon_interval)
+        finally:
+            transport.close()
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_in_thread(self):
+        """Ejecuta el emulador en un hilo propio (útil en pruebas y benchmarks)"""
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="esp32-emulator", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self.host, self.port
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._server.close)
+            if self._udp is not None:
+                self._loop.call_soon_threadsafe(self._udp.close)
+            if self._beacon_task is not None:
+                asyncio.run_coroutine_threadsafe(self._stop_beacons(), self._loop).result(timeout=2)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=2)
+            self._loop = None
+
+    async def _stop_beacons(self):
+        # Se espera a que la tarea termine para que cierre su socket antes del bucle
+        self._beacon_task.cancel()
+        try:
+            await self._beacon_task
+        except asyncio.CancelledError:
+            pass
+
+    async def _handle_client(self, reader, writer):
+        self.stats["connections"] += 1
+        self.stats["active"] += 1
+        state = self.state if self.shared_state else DeviceState()
+        try:
+            writer.write((self.greeting + "\r\n").encode())
+            await writer.drain()
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                self.stats["messages"] += 1
+                self.stats["bytes_in"] += len(line)
+                if self.loop_delay:
+                    await asyncio.sleep(self.loop_delay)
+                if self.disconnect_rate and self.random.random() < self.disconnect_rate:
+                    self.stats["disconnects"] += 1
+                    break
+                await self._tcp_loss()
+                message = line.decode(errors="replace")
+                if self.binary and self._is_negotiation(message):
+                    await self._send(writer, (protocol.NEGOTIATE_REPLY + "\r\n").encode())
+                    self.stats["binary_connections"] += 1
+                    await self._serve_binary(reader, writer, state)
+                    break
+                response = state.handle_message(message)
+                await self._delay()
+                if self._drop():
+                    continue
+                await self._tcp_loss()
+                await self._send(writer, (response + "\r\n").encode())
+                self.stats["responses"] += 1
+        except (ConnectionError, OSError, ValueError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.stats["active"] -= 1
+            writer.close()
+
+    async def _serve_binary(self, reader, writer, state):
+        """Tramas binarias hasta que se cierra la conexión (una respuesta por trama)"""
+        while True:
+            header = await reader.readexactly(protocol.HEADER.size)
+            payload = await reader.readexactly(protocol.decode_header(header))
+            requests = protocol.decode_requests(payload)
+            self.stats["frames"] += 1
+            self.stats["messages"] += len(requests)
+            self.stats["bytes_in"] += len(header) + len(payload)
+            await self._tcp_loss()
+            if self.loop_delay:
+                await asyncio.sleep(self.loop_delay)
+            if self.disconnect_rate and self.random.random() < self.disconnect_rate:
+                self.stats["disconnects"] += 1
+                return
+            responses = []
+            for op, seq, arg in requests:
+                status, flags, value = state.apply_op(op, arg)
+                responses.append((status, seq, flags, value))
+            await self._delay()
+            if self._drop():
+                continue
+            await self._tcp_loss()
+            await self._send(writer, protocol.encode_responses(responses))
+            self.stats["responses"] += len(responses)
+
+    @staticmethod
+    def _is_negotiation(message):
+        try:
+            doc = json.loads(message)
+        except ValueError:
+            return False
+        return isinstance(doc, dict) and doc.get("command") == protocol.NEGOTIATE_COMMAND
+
+    async def _delay(self):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            await asyncio.sleep(delay)
+
+    def _lost(self):
+        if self.loss and self.random.random() < self.loss:
+            self.stats["lost"] += 1
+            return True
+        return False
+
+    async def _tcp_loss(self):
+        # El paquete perdido se retransmite tras el RTO, que se duplica si se vuelve a perder
+        rto = self.tcp_rto
+        while self._lost():
+            self.stats["tcp_retransmits"] += 1
+            await asyncio.sleep(rto)
+            rto *= 2
+
+    def _drop(self):
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            self.stats["dropped"] += 1
+            return True
+        return False
+
+    async def _send(self, writer, data):
+        writer.write(data)
+        self.stats["bytes_out"] += len(data)
+        await writer.drain()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emulador del firmware ESP32 (balancin_comunicacion)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1234)
+    parser.add_argument("--latency", type=float, default=0.0, help="Latencia fija por respuesta (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Latencia adicional aleatoria máxima (s)")
+    parser.add_argument("--drop", type=float, default=0.0, help="Probabilidad de no responder")
+    parser.add_argument("--disconnect", type=float, default=0.0, help="Probabilidad de cortar la conexión")
+    parser.add_argument("--loop-delay", type=float, default=0.0, help="Pausa por mensaje (0.01 = sketch)")
+    parser.add_argument("--per-client-state", action="store_true", help="Estado independiente por cliente")
+    parser.add_argument("--json-only", action="store_true", help="Rechazar el protocolo binario")
+    parser.add_argument("--udp", action="store_true", help="Atender también el canal UDP")
+    parser.add_argument("--loss", type=float, default=0.0, help="Probabilidad de perder cada paquete")
+    parser.add_argument("--id", default=None, help="MAC emulada (en el saludo y el anuncio)")
+    parser.add_argument("--beacon", action="store_true",
+                        help="Anunciarse por difusión UDP en el puerto 1235, como el firmware")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    emulator = ESP32Emulator(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                             drop_rate=args.drop, disconnect_rate=args.disconnect,
+                             loop_delay=args.loop_delay, shared_state=not args.per_client_state,
+                             seed=args.seed, binary=not args.json_only, udp=args.udp, loss=args.loss,
+                             device_id=args.id,
+                             beacon=("255.255.255.255", BEACON_PORT) if args.beacon else None)
+    transports = "TCP y UDP" if args.udp else "TCP"
+    print(f"Emulador ESP32 escuchando en {args.host}:{args.port} ({transports})")
+    try:
+        asyncio.run(emulator.serve_forever())
+    except KeyboardInterrupt:
+        print(f"Estadísticas: {emulator.stats}")
+
+
+if __name__ == "__main__":
+    main()
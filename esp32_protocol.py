@@ -0,0 +1,172 @@
+"""Protocolo binario compacto entre el cliente y el ESP32 (alternativa al JSON).
+
+Se negocia al conectar: el cliente envía el comando JSON "PROTO:BIN1"; un
+firmware que lo soporta responde "OK: PROTO BIN1" y desde ese momento la
+conexión usa tramas binarias. Un firmware antiguo responde "ERROR: Comando
+desconocido" y se sigue con JSON por línea.
+
+Trama (little-endian, igual que el ESP32):
+
+    cabecera  u8 0xA5 | u16 longitud de la carga en bytes
+    petición  u8 código | u16 secuencia | f32 argumento        (7 bytes)
+    respuesta u8 estado | u16 secuencia | u8 banderas | f32 valor (8 bytes)
+
+Una trama lleva varios registros (hasta MAX_BATCH) y el firmware responde
+cada trama con otra con un registro por petición. La respuesta trae el
+estado del LED (bandera FLAG_LED) y la frecuencia actual; response_text()
+la convierte en la misma línea que enviaría el firmware en modo JSON.
+
+Por UDP (esp32_udp.py) se usan los mismos registros; cada datagrama lleva
+en lugar de la longitud el número de sesión del cliente:
+
+    datagrama u8 0xA6 | u16 sesión | registros...
+
+Cada registro de respuesta confirma una secuencia concreta (ack
+selectivo); un datagrama sin registros es un saludo / keepalive.
+"""
+import re
+import struct
+
+NEGOTIATE_COMMAND = "PROTO:BIN1"
+NEGOTIATE_REPLY = "OK: PROTO BIN1"
+
+MAGIC = 0xA5
+HEADER = struct.Struct("<BH")
+REQUEST = struct.Struct("<BHf")
+RESPONSE = struct.Struct("<BHBf")
+MAX_BATCH = 32
+
+UDP_MAGIC = 0xA6
+DATAGRAM = struct.Struct("<BH")
+
+# Códigos de operación (0 = comando desconocido)
+OP_UNKNOWN = 0
+OP_LED_ON = 1
+OP_LED_OFF = 2
+OP_FREQ = 3
+OP_FREQ_UP = 4
+OP_FREQ_DOWN = 5
+OP_FREQ_FAST = 6
+OP_FREQ_SLOW = 7
+OP_STATUS = 8
+
+OPCODES = {"LED_ON": OP_LED_ON, "LED_OFF": OP_LED_OFF, "FREQ_UP": OP_FREQ_UP,
+           "FREQ_DOWN": OP_FREQ_DOWN, "FREQ_FAST": OP_FREQ_FAST, "FREQ_SLOW": OP_FREQ_SLOW,
+           "STATUS": OP_STATUS}
+
+# Estado de cada respuesta
+STATUS_OK = 0
+STATUS_UNKNOWN = 1
+STATUS_RANGE = 2
+
+FLAG_LED = 0x01
+
+_FLOAT_PREFIX = re.compile(r"\s*[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?")
+
+
+def atof(text):
+    """Conversión como atof() de C: prefijo numérico o 0.0"""
+    match = _FLOAT_PREFIX.match(text)
+    return float(match.group(0)) if match else 0.0
+
+
+def arduino_float(value):
+    """Formato de Print::print(float) en Arduino (2 decimales)"""
+    return f"{value:.2f}"
+
+
+def parse_command(command):
+    """Comando de texto -> (código, argumento)"""
+    if not isinstance(command, str):
+        return OP_UNKNOWN, 0.0
+    if command.startswith("FREQ:"):
+        return OP_FREQ, atof(command[5:])
+    return OPCODES.get(command, OP_UNKNOWN), 0.0
+
+
+def request_payload(records):
+    """[(secuencia, comando), ...] -> registros de petición sin cabecera"""
+    payload = bytearray()
+    for seq, command in records:
+        op, arg = parse_command(command)
+        payload += REQUEST.pack(op, seq & 0xFFFF, arg)
+    return bytes(payload)
+
+
+def response_payload(records):
+    """[(estado, secuencia, banderas, valor), ...] -> registros sin cabecera"""
+    return b"".join(RESPONSE.pack(*record) for record in records)
+
+
+def encode_requests(records):
+    """[(secuencia, comando), ...] -> una trama"""
+    payload = request_payload(records)
+    return HEADER.pack(MAGIC, len(payload)) + payload
+
+
+def encode_responses(records):
+    """[(estado, secuencia, banderas, valor), ...] -> una trama"""
+    payload = response_payload(records)
+    return HEADER.pack(MAGIC, len(payload)) + payload
+
+
+def decode_header(header):
+    """Longitud de la carga; ValueError si la cabecera no es válida"""
+    magic, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError(f"Trama inválida (0x{magic:02X})")
+    return length
+
+
+def decode_requests(payload):
+    """Carga -> [(código, secuencia, argumento), ...]"""
+    if len(payload) % REQUEST.size or len(payload) // REQUEST.size > MAX_BATCH:
+        raise ValueError(f"Longitud de trama inválida: {len(payload)}")
+    return list(REQUEST.iter_unpack(payload))
+
+
+def decode_responses(payload):
+    """Carga -> [(estado, secuencia, banderas, valor), ...]"""
+    if len(payload) % RESPONSE.size:
+        raise ValueError(f"Longitud de trama inválida: {len(payload)}")
+    return list(RESPONSE.iter_unpack(payload))
+
+
+def encode_datagram(session, payload=b""):
+    """Datagrama UDP con la carga de registros ya empaquetada"""
+    return DATAGRAM.pack(UDP_MAGIC, session & 0xFFFF) + payload
+
+
+def decode_datagram(data):
+    """Datagrama -> (sesión, carga); ValueError si no es del protocolo"""
+    if len(data) < DATAGRAM.size:
+        raise ValueError("Datagrama demasiado corto")
+    magic, session = DATAGRAM.unpack_from(data)
+    if magic != UDP_MAGIC:
+        raise ValueError(f"Datagrama inválido (0x{magic:02X})")
+    return session, data[DATAGRAM.size:]
+
+
+def seq_newer(a, b):
+    """True si la secuencia a es posterior a b (aritmética módulo 2**16)"""
+    return a != b and ((a - b) & 0xFFFF) < 0x8000
+
+
+def response_text(op, status, flags, value):
+    """La línea que el firmware habría respondido en modo JSON"""
+    if status == STATUS_UNKNOWN:
+        return "ERROR: Comando desconocido"
+    if status == STATUS_RANGE:
+        return "ERROR: Frecuencia debe ser 0-10 Hz"
+    if op == OP_LED_ON:
+        return "OK: LED encendido"
+    if op == OP_LED_OFF:
+        return "OK: LED apagado"
+    if op in (OP_FREQ, OP_FREQ_UP, OP_FREQ_DOWN):
+        return f"OK: Frecuencia {arduino_float(value)} Hz"
+    if op == OP_FREQ_FAST:
+        return "OK: Frecuencia rápida 5 Hz"
+    if op == OP_FREQ_SLOW:
+        return "OK: Frecuencia lenta 1 Hz"
+    led = "ON" if flags & FLAG_LED else "OFF"
+    return f"ESTADO: LED={led}, FRECUENCIA={arduino_float(value)} Hz"
@@ -0,0 +1,197 @@
+"""Canal de control por UDP con el ESP32: secuencias, acks selectivos y reenvío.
+
+Por TCP un segmento perdido en una WiFi con pérdidas detiene todo lo que
+viene detrás hasta que el sistema lo retransmite (cientos de ms). Por UDP
+cada comando viaja con su número de secuencia en los mismos registros
+binarios de esp32_protocol.py; la placa responde cada secuencia por
+separado (ack selectivo), recuerda las últimas que aplicó para no repetir
+un comando reenviado (aplicación idempotente) y el cliente reenvía solo
+los comandos sin ack, con un plazo corto (retransmit_timeout) que se
+duplica en cada intento.
+
+UDPClient tiene la misma interfaz que esp32_client.ESP32Client (send
+devuelve un Future con la misma línea de texto que por TCP), así que
+devices.DevicePool puede usar uno u otro (transport="udp").
+"""
+import asyncio
+import random
+import time
+
+import esp32_protocol
+from esp32_client import ESP32Client
+
+# Keepalives sin respuesta tras los que la placa se da por desconectada
+MISSED_KEEPALIVES = 3
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._on_datagram(data)
+
+    def error_received(self, exc):
+        # ICMP "puerto inalcanzable": la placa no escucha (aún); se sigue reenviando
+        self.client._on_error(exc)
+
+
+class UDPClient(ESP32Client):
+    """Cliente del canal UDP con la interfaz de ESP32Client.
+
+    Un comando sin ack se reenvía a los retransmit_timeout segundos, luego
+    al doble, hasta max_retransmit_timeout entre intentos; si en timeout
+    segundos no hubo ack falla con TimeoutError. Sin comandos pendientes
+    se envía un saludo cada keepalive segundos; connected refleja si la
+    placa contesta.
+    """
+
+    def __init__(self, host, port=1234, timeout=2.0, retransmit_timeout=0.04,
+                 max_retransmit_timeout=0.32, keepalive=2.0, max_in_flight=16, **options):
+        options.pop("protocol", None)
+        super().__init__(host, port, timeout=timeout, max_in_flight=max_in_flight, **options)
+        self.retransmit_timeout = retransmit_timeout
+        self.max_retransmit_timeout = max_retransmit_timeout
+        self.keepalive = keepalive
+        self.binary = True
+        self.stats.update({"retransmits": 0, "duplicate_acks": 0, "datagrams": 0})
+        # Sesión nueva por cliente: la placa olvida las secuencias de la anterior
+        self._session = random.getrandbits(16)
+        self._by_seq = {}
+        self._transport = None
+        self._last_heard = 0.0
+        self._next_hello = 0.0
+
+    # --- Hilo del cliente -------------------------------------------------
+
+    async def _connection_loop(self):
+        loop = asyncio.get_running_loop()
+        delay = self.reconnect_delay
+        while not self._closed:
+            try:
+                transport, _ = await loop.create_datagram_endpoint(
+                    lambda: _ClientProtocol(self), remote_addr=(self.host, self.port))
+            except OSError as e:
+                self._set_state(False, e)
+                self._expire_outbox()
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+                continue
+            delay = self.reconnect_delay
+            self._transport = transport
+            self._next_hello = 0.0
+            try:
+                error = await self._pump()
+            except OSError as e:
+                error = e
+            finally:
+                transport.close()
+                self._transport = None
+            self._fail_all(error)
+            self._set_state(False, error)
+
+    async def _pump(self):
+        """Envía, reenvía y vence comandos hasta que se cierra el cliente"""
+        while True:
+            now = time.monotonic()
+            self._expire_in_flight(now)
+            records = self._retransmissions(now)
+            written = time.perf_counter()
+            while ((self._urgent or self._outbox) and len(self._in_flight) < self.max_in_flight
+                   and len(records) < esp32_protocol.MAX_BATCH):
+                lane = self._urgent or self._outbox
+                command, future, deadline, queued, expires = lane.popleft()
+                if future.cancelled() or self._expired(command, future, deadline, expires):
+                    continue
+                self._seq = (self._seq + 1) & 0xFFFF
+                # [comando, futuro, plazo, escrito, secuencia, intentos, próximo reenvío]
+                entry = [command, future, now + self.timeout, written, self._seq, 0,
+                         now + self.retransmit_timeout]
+                self._in_flight.append(entry)
+                self._by_seq[self._seq] = entry
+                records.append((self._seq, command))
+                self.metrics.observe("send", written - queued)
+                self._count("sent")
+            if records:
+                self._send_datagram(esp32_protocol.request_payload(records))
+                self.metrics.set("esp32_in_flight", len(self._in_flight))
+                self.stats["max_in_flight"] = max(self.stats["max_in_flight"], len(self._in_flight))
+            elif not self._in_flight and now >= self._next_hello:
+                # Saludo / keepalive: un datagrama sin registros
+                self._send_datagram(b"")
+                self._next_hello = now + (self.keepalive if self.connected else self.reconnect_delay)
+            if self.connected and now - self._last_heard > MISSED_KEEPALIVES * self.keepalive:
+                self._set_state(False, TimeoutError("El ESP32 no responde por UDP"))
+
+            wake_at = self._next_hello
+            for entry in self._in_flight:
+                wake_at = min(wake_at, entry[6], entry[2])
+            # Despierta con un comando nuevo, un ack o el próximo reenvío
+            # (sin wait_for, que en 3.11 puede tragarse la cancelación)
+            self._outbox_ready.clear()
+            timer = asyncio.get_running_loop().call_later(max(0.0, wake_at - time.monotonic()),
+                                                          self._outbox_ready.set)
+            try:
+                await self._outbox_ready.wait()
+            finally:
+                timer.cancel()
+
+    def _retransmissions(self, now):
+        records = []
+        for entry in self._in_flight:
+            if entry[6] > now or len(records) >= esp32_protocol.MAX_BATCH:
+                continue
+            entry[5] += 1
+            entry[6] = now + min(self.retransmit_timeout * 2 ** entry[5], self.max_retransmit_timeout)
+            records.append((entry[4], entry[0]))
+            self._count("retransmits")
+        return records
+
+    def _expire_in_flight(self, now):
+        for entry in [entry for entry in self._in_flight if entry[2] < now]:
+            self._in_flight.remove(entry)
+            del self._by_seq[entry[4]]
+            self._count("timeouts")
+            if not entry[1].done():
+                entry[1].set_exception(TimeoutError(f"El ESP32 no confirmó {entry[0]} (timeout)"))
+            self._slot_free.set()
+
+    def _send_datagram(self, payload):
+        self._transport.sendto(esp32_protocol.encode_datagram(self._session, payload))
+        self.stats["datagrams"] += 1
+        self.stats["bytes_sent"] += esp32_protocol.DATAGRAM.size + len(payload)
+
+    def _on_datagram(self, data):
+        try:
+            session, payload = esp32_protocol.decode_datagram(data)
+            records = esp32_protocol.decode_responses(payload)
+        except ValueError:
+            return
+        if session != self._session:
+            return
+        self._last_heard = time.monotonic()
+        if not self.connected:
+            self._set_state(True)
+        for status, seq, flags, value in records:
+            entry = self._by_seq.pop(seq, None)
+            if entry is None:
+                # Ack de un reenvío cuya respuesta original ya llegó
+                self._count("duplicate_acks")
+                continue
+            self._in_flight.remove(entry)
+            self.metrics.observe("response", time.perf_counter() - entry[3])
+            self._count("responses")
+            op = esp32_protocol.parse_command(entry[0])[0]
+            if not entry[1].done():
+                entry[1].set_result(esp32_protocol.response_text(op, status, flags, value))
+        self.metrics.set("esp32_in_flight", len(self._in_flight))
+        self._slot_free.set()
+        self._outbox_ready.set()
+
+    def _on_error(self, error):
+        if self.connected:
+            self._set_state(False, error)
+
+    def _fail_all(self, error, include_outbox=False):
+        super()._fail_all(error, include_outbox)
+        self._by_seq.clear()
@@ -0,0 +1,215 @@
+"""Historial persistente de comandos de voz (SQLite en modo WAL).
+
+Cada frase procesada se guarda como una fila de solo anexado: hora,
+transcripción, comando encontrado, reconocedor, latencias y respuesta del
+ESP32. record() no toca el disco: encola la fila y un hilo escritor la
+inserta por lotes en una sola transacción, así la interfaz nunca espera
+a SQLite. Las lecturas usan otra conexión; con WAL no bloquean al
+escritor. Hay índices por hora y por comando para consultar rangos de
+tiempo o un comando concreto entre millones de filas.
+
+El filtro de texto usa una tabla FTS5 (history_fts) con la transcripción y
+el comando, que un trigger llena al insertar: cada palabra escrita busca
+las palabras que empiezan así, sin recorrer la tabla entera. Si SQLite no
+tiene FTS5 se recurre a LIKE '%texto%' (recorrido completo).
+"""
+import queue
+import re
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = "historial.db"
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS history ("
+    "id INTEGER PRIMARY KEY, "
+    "timestamp REAL NOT NULL, "
+    "transcript TEXT, "
+    "command TEXT, "
+    "backend TEXT, "
+    "recognition_ms REAL, "
+    "response_ms REAL, "
+    "response TEXT)",
+    "CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp)",
+    "CREATE INDEX IF NOT EXISTS history_command ON history (command, timestamp)",
+)
+
+# Contenido externo: el texto vive en history y el índice solo guarda los rowid.
+# El historial es de solo anexado, así que basta el trigger de INSERT
+_FTS_SCHEMA = (
+    "CREATE VIRTUAL TABLE history_fts USING fts5("
+    "transcript, command, content='history', content_rowid='id', "
+    "tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER history_fts_insert AFTER INSERT ON history BEGIN "
+    "INSERT INTO history_fts (rowid, transcript, command) "
+    "VALUES (new.id, new.transcript, new.command); END",
+    # Bases creadas antes del índice: se indexan las filas que ya había
+    "INSERT INTO history_fts (history_fts) VALUES ('rebuild')",
+)
+
+_COLUMNS = "id, timestamp, transcript, command, backend, recognition_ms, response_ms, response"
+
+_STOP = object()
+
+
+class HistoryEntry:
+    """Una fila del historial (latencias en milisegundos, None si no aplica)"""
+
+    __slots__ = ("id", "timestamp", "transcript", "command", "backend",
+                 "recognition_ms", "response_ms", "response")
+
+    def __init__(self, id, timestamp, transcript, command=None, backend=None,
+                 recognition_ms=None, response_ms=None, response=None):
+        self.id = id
+        self.timestamp = timestamp
+        self.transcript = transcript
+        self.command = command
+        self.backend = backend
+        self.recognition_ms = recognition_ms
+        self.response_ms = response_ms
+        self.response = response
+
+    def __repr__(self):
+        return (f"HistoryEntry({self.id}, {self.transcript!r} -> {self.command!r}, "
+                f"response={self.response!r})")
+
+
+class HistoryStore:
+    """Historial de solo anexado con escritura por lotes en segundo plano.
+
+    batch_size limita cuántas filas se insertan por transacción; con poca
+    carga cada fila se escribe en cuanto llega y con mucha se agrupan solas.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, batch_size=500):
+        self.path = path
+        self.batch_size = batch_size
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "errors": 0}
+
+        self._queue = queue.Queue()
+        db = self._connect()
+        for statement in _SCHEMA:
+            db.execute(statement)
+        self.full_text = self._create_fts(db)
+        db.commit()
+        # Conexión de lectura (interfaz y consultas); la de escritura es del hilo
+        self._reader = db
+        self._read_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._writer, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def record(self, transcript, command=None, backend=None, recognition_ms=None,
+               response_ms=None, response=None, timestamp=None):
+        """Encola una fila; no bloquea (seguro desde cualquier hilo)"""
+        self.stats["queued"] += 1
+        self._queue.put((timestamp or time.time(), transcript, command, backend,
+                         recognition_ms, response_ms, response))
+
+    def flush(self):
+        """Espera a que las filas encoladas estén en disco"""
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        with self._read_lock:
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+
+    def query(self, start=None, end=None, command=None, text=None, limit=100, offset=0,
+              newest_first=True):
+        """Filas en [start, end) con el comando dado y/o cuyas palabras (transcripción o
+        comando) empiezan por las del texto"""
+        where, params = self._where(start, end, command, text)
+        order = "DESC" if newest_first else "ASC"
+        sql = (f"SELECT {_COLUMNS} FROM history{where} "
+               f"ORDER BY timestamp {order}, id {order} LIMIT ? OFFSET ?")
+        with self._read_lock:
+            rows = self._reader.execute(sql, params + [limit, offset]).fetchall()
+        return [HistoryEntry(*row) for row in rows]
+
+    def count(self, start=None, end=None, command=None, text=None):
+        where, params = self._where(start, end, command, text)
+        with self._read_lock:
+            return self._reader.execute(f"SELECT COUNT(*) FROM history{where}", params).fetchone()[0]
+
+    def command_counts(self, start=None, end=None):
+        """{comando: veces} en el rango (None = frases sin comando)"""
+        where, params = self._where(start, end, None, None)
+        with self._read_lock:
+            rows = self._reader.execute(f"SELECT command, COUNT(*) FROM history{where} "
+                                        "GROUP BY command", params).fetchall()
+        return dict(rows)
+
+    @staticmethod
+    def _create_fts(db):
+        """Crea el índice de texto si falta; False si este SQLite no tiene FTS5"""
+        if db.execute("SELECT 1 FROM sqlite_master WHERE name = 'history_fts'").fetchone():
+            return True
+        try:
+            with db:
+                for statement in _FTS_SCHEMA:
+                    db.execute(statement)
+        except sqlite3.OperationalError:
+            return False
+        return True
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        # En WAL, NORMAL solo arriesga la última transacción ante un corte de luz
+        db.execute("PRAGMA synchronous=NORMAL")
+        return db
+
+    def _where(self, start, end, command, text):
+        clauses, params = [], []
+        if start is not None:
+            clauses.append("timestamp >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("timestamp < ?")
+            params.append(end)
+        if command is not None:
+            clauses.append("command = ?")
+            params.append(command)
+        if text and self.full_text:
+            # "FREQ:3" -> "FREQ"* AND "3"*: palabras que empiezan así, por el índice
+            words = re.findall(r"\w+", text)
+            if words:
+                clauses.append("id IN (SELECT rowid FROM history_fts WHERE history_fts MATCH ?)")
+                params.append(" AND ".join(f'"{word}"*' for word in words))
+        elif text:
+            clauses.append("(transcript LIKE ? OR command LIKE ?)")
+            params.extend([f"%{text}%"] * 2)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def _writer(self):
+        db = self._connect()
+        try:
+            while True:
+                batch = [self._queue.get()]
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self._queue.get_nowait())
+                    except queue.Empty:
+                        break
+                rows = [row for row in batch if row is not _STOP]
+                if rows:
+                    try:
+                        with db:
+                            db.executemany("INSERT INTO history (timestamp, transcript, command, "
+                                           "backend, recognition_ms, response_ms, response) "
+                                           "VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+                        self.stats["written"] += len(rows)
+                        self.stats["batches"] += 1
+                    except sqlite3.Error:
+                        self.stats["errors"] += 1
+                for _ in batch:
+                    self._queue.task_done()
+                if len(rows) < len(batch):
+                    return
+        finally:
+            db.close()
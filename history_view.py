@@ -0,0 +1,285 @@
+"""Historial virtualizado: la lista solo contiene las filas visibles.
+
+Un tk.Listbox con cientos de miles de filas se vuelve lento al insertar en
+la posición 0 y al desplazarse. VirtualListbox mantiene los datos fuera
+del widget, en una fuente paginada, y en cada desplazamiento reemplaza solo
+las filas que caben en pantalla; la barra de desplazamiento refleja la
+posición dentro de la fuente completa.
+
+Fuentes (la fila 0 es la más reciente):
+    ListHistorySource  - filas en memoria con filtro incremental
+    StoreHistorySource - history_store.HistoryStore, por páginas con caché
+"""
+import collections
+import time
+import tkinter as tk
+
+from commands import normalize
+
+
+def format_entry(entry):
+    """Filas de pantalla de una entrada del historial (texto y, si hay, acción)"""
+    stamp = time.strftime("%H:%M:%S", time.localtime(entry.timestamp))
+    rows = [f"{stamp} - {entry.transcript}"]
+    if entry.command:
+        rows.append(f"{stamp} - {entry.command}")
+    return rows
+
+
+def format_summary(entry):
+    """Una sola fila por entrada: "hora - texto → comando" """
+    stamp = time.strftime("%H:%M:%S", time.localtime(entry.timestamp))
+    if entry.command:
+        return f"{stamp} - {entry.transcript} → {entry.command}"
+    return f"{stamp} - {entry.transcript}"
+
+
+def load_recent(store, limit=100000, end=None):
+    """(filas, claves) de las últimas entradas anteriores a end, la más antigua primero.
+
+    Pensada para un hilo en segundo plano; el resultado va a
+    ListHistorySource.insert_older() en el hilo de Tk.
+    """
+    rows = []
+    for entry in reversed(store.query(end=end, limit=limit)):
+        rows.extend(format_entry(entry))
+    return rows, [normalize(row) for row in rows]
+
+
+class ListHistorySource:
+    """Filas en memoria (la más antigua primero internamente).
+
+    set_filter() es incremental: si el texto nuevo extiende al anterior solo
+    se vuelven a revisar las filas que ya coincidían, y las filas agregadas
+    después se comparan una sola vez. Al pasar de max_rows se descartan las
+    más antiguas por lotes (un 10 % de una vez).
+    """
+
+    def __init__(self, rows=(), max_rows=200000):
+        self.max_rows = max_rows
+        self._rows = []
+        self._keys = []
+        self._filter = ""
+        self._matches = None
+        self.append(rows)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def append(self, rows):
+        """Agrega filas nuevas; devuelve cuántas quedan visibles con el filtro"""
+        start = len(self._rows)
+        self._rows.extend(rows)
+        self._keys.extend(normalize(row) for row in rows)
+        added = len(self._rows) - start
+        if self._matches is not None:
+            new = [i for i in range(start, len(self._rows)) if self._filter in self._keys[i]]
+            self._matches.extend(new)
+            added = len(new)
+        self._trim()
+        return added
+
+    def insert_older(self, rows, keys=None):
+        """Agrega filas más antiguas que todas las actuales (rows: la más antigua primero).
+
+        keys (normalize() de cada fila) puede calcularse antes en otro hilo.
+        """
+        rows = list(rows)[-self.max_rows:]
+        if keys is None:
+            keys = [normalize(row) for row in rows]
+        self._rows[:0] = rows
+        self._keys[:0] = list(keys)[-len(rows):] if rows else []
+        if self._matches is not None:
+            self._apply_filter(self._filter, range(len(self._rows)))
+        self._trim()
+
+    def set_filter(self, text):
+        text = normalize(text.strip())
+        if not text:
+            self._filter, self._matches = "", None
+        elif self._matches is not None and text.startswith(self._filter):
+            self._apply_filter(text, self._matches)
+        else:
+            self._apply_filter(text, range(len(self._rows)))
+
+    def count(self):
+        return len(self._rows) if self._matches is None else len(self._matches)
+
+    def rows(self, start, stop):
+        """Filas visibles start..stop (0 = la más reciente)"""
+        count = self.count()
+        stop = min(stop, count)
+        if self._matches is None:
+            indexes = range(count - 1 - start, count - 1 - stop, -1)
+        else:
+            indexes = [self._matches[count - 1 - i] for i in range(start, stop)]
+        return [self._rows[i] for i in indexes]
+
+    def _apply_filter(self, text, candidates):
+        keys = self._keys
+        self._filter = text
+        self._matches = [i for i in candidates if text in keys[i]]
+
+    def _trim(self):
+        if len(self._rows) <= self.max_rows + self.max_rows // 10:
+            return
+        excess = len(self._rows) - self.max_rows
+        del self._rows[:excess]
+        del self._keys[:excess]
+        if self._matches is not None:
+            self._matches = [i - excess for i in self._matches if i >= excess]
+
+
+class StoreHistorySource:
+    """HistoryStore leída por páginas, con las últimas páginas en caché LRU.
+
+    Las filas recién grabadas aparecen después de refresh() (el escritor del
+    historial trabaja por lotes en segundo plano). Cada cambio de filtro
+    cuesta una consulta y un COUNT, así que VirtualListbox espera
+    filter_delay ms sin teclear antes de aplicarlo.
+    """
+
+    filter_delay = 300
+
+    def __init__(self, store, page_size=200, cache_pages=32, format_row=None):
+        self.store = store
+        self.page_size = page_size
+        self.cache_pages = cache_pages
+        self.format_row = format_row or format_summary
+        self._filter = ""
+        self._count = None
+        self._pages = collections.OrderedDict()
+
+    def set_filter(self, text):
+        text = text.strip()
+        if text == self._filter:
+            return
+        self._filter = text
+        self.refresh()
+
+    def refresh(self):
+        self._count = None
+        self._pages.clear()
+
+    def count(self):
+        if self._count is None:
+            self._count = self.store.count(text=self._filter or None)
+        return self._count
+
+    def rows(self, start, stop):
+        stop = min(stop, self.count())
+        rows = []
+        for page in range(start // self.page_size, (stop - 1) // self.page_size + 1):
+            offset = page * self.page_size
+            rows.extend(self._page(page)[max(start - offset, 0):stop - offset])
+        return rows
+
+    def _page(self, page):
+        if page in self._pages:
+            self._pages.move_to_end(page)
+            return self._pages[page]
+        entries = self.store.query(text=self._filter or None, limit=self.page_size,
+                                   offset=page * self.page_size)
+        rows = [self.format_row(entry) for entry in entries]
+        self._pages[page] = rows
+        while len(self._pages) > self.cache_pages:
+            self._pages.popitem(last=False)
+        return rows
+
+
+class VirtualListbox:
+    """Muestra una fuente paginada en un tk.Listbox sin cargarla entera.
+
+    Usa el Listbox y la barra de desplazamiento que ya tiene la interfaz
+    (con sus estilos): el Listbox solo contiene las filas visibles. Si se da
+    filter_var (StringVar de un Entry), el filtro se aplica al escribir, con
+    una espera de filter_delay ms para no filtrar en cada tecla (por defecto
+    la que pida la fuente, o 150 ms).
+    """
+
+    def __init__(self, listbox, scrollbar, source, filter_var=None, filter_delay=None):
+        self.listbox = listbox
+        self.scrollbar = scrollbar
+        self.source = source
+        self.filter_var = filter_var
+        if filter_delay is None:
+            filter_delay = getattr(source, "filter_delay", 150)
+        self.filter_delay = filter_delay
+        self.top = 0
+        self.visible = int(listbox.cget("height")) or 10
+        self._filter_after = None
+
+        scrollbar.configure(command=self._on_scrollbar)
+        listbox.configure(yscrollcommand="")
+        listbox.bind("<Configure>", self._on_resize)
+        listbox.bind("<MouseWheel>", lambda e: self.scroll(-1 if e.delta > 0 else 1, "units"))
+        listbox.bind("<Button-4>", lambda e: self.scroll(-1, "units"))
+        listbox.bind("<Button-5>", lambda e: self.scroll(1, "units"))
+        listbox.bind("<Prior>", lambda e: self.scroll(-1, "pages"))
+        listbox.bind("<Next>", lambda e: self.scroll(1, "pages"))
+        if filter_var is not None:
+            filter_var.trace_add("write", self._on_filter_changed)
+        self.render()
+
+    def refresh(self):
+        """Vuelve a leer la fuente (p. ej. StoreHistorySource tras nuevas escrituras)"""
+        if hasattr(self.source, "refresh"):
+            self.source.refresh()
+        self.render()
+
+    def append(self, rows):
+        """Filas nuevas en una fuente en memoria (la más antigua primero).
+
+        Si se está leyendo más abajo, la vista no salta.
+        """
+        added = self.source.append(rows)
+        if self.top:
+            self.top += added
+        self.render()
+
+    def scroll(self, amount, what="units"):
+        step = 3 if what == "units" else self.visible
+        self.scroll_to(self.top + amount * step)
+        return "break"
+
+    def scroll_to(self, top):
+        self.top = max(0, min(int(top), self.source.count() - self.visible))
+        self.render()
+
+    def render(self):
+        count = self.source.count()
+        self.top = max(0, min(self.top, count - self.visible))
+        rows = self.source.rows(self.top, self.top + self.visible)
+        self.listbox.delete(0, tk.END)
+        if rows:
+            self.listbox.insert(0, *rows)
+        if count:
+            self.scrollbar.set(self.top / count, (self.top + len(rows)) / count)
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_scrollbar(self, action, *args):
+        if action == "moveto":
+            self.scroll_to(float(args[0]) * self.source.count())
+        elif action == "scroll":
+            self.scroll(int(args[0]), args[1])
+
+    def _on_resize(self, event):
+        line = self.listbox.bbox(0)
+        height = line[3] + 1 if line else None
+        if height:
+            visible = max(1, event.height // height)
+            if visible != self.visible:
+                self.visible = visible
+                self.render()
+
+    def _on_filter_changed(self, *args):
+        if self._filter_after is not None:
+            self.listbox.after_cancel(self._filter_after)
+        self._filter_after = self.listbox.after(self.filter_delay, self._apply_filter)
+
+    def _apply_filter(self):
+        self._filter_after = None
+        self.source.set_filter(self.filter_var.get())
+        self.top = 0
+        self.render()
@@ -0,0 +1,237 @@
+"""Métricas de latencia por etapa, contadores y exportación en texto Prometheus.
+
+Cada etapa de la cadena (apertura del micrófono, calibración, captura,
+segmentación, preprocesado, reconocimiento, búsqueda del comando, envío y
+respuesta del ESP32) se mide con span() u observe() y alimenta un
+histograma por etapa; los eventos (frases, no entendidas, timeouts,
+reconexiones...) se cuentan con inc(). Los módulos usan por defecto el
+registro global METRICS, que MetricsServer publica por HTTP en /metrics
+para Prometheus y snapshot() resume para el panel de prueba3.py.
+"""
+import bisect
+import collections
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Límites de los histogramas en segundos (de 0,5 ms a 30 s)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Etapas en el orden de la cadena (el panel y la exportación las listan así)
+STAGES = ("mic_open", "calibration", "capture", "segmentation", "queue", "preprocess",
+          "recognition", "match", "send", "response")
+
+COUNTER_HELP = {
+    "utterances": "Frases capturadas",
+    "utterances_dropped": "Frases descartadas con la cola llena",
+    "utterances_duplicate": "Frases repetidas por otro micrófono (descartadas)",
+    "unrecognized": "Frases que el reconocedor no entendió",
+    "recognition_errors": "Errores del reconocedor",
+    "commands": "Frases con un comando reconocido",
+    "commands_expired": "Comandos descartados por llegar después de su hora límite",
+    "commands_priority": "Comandos de seguridad entregados por el carril prioritario",
+    "calibration_cache_hits": "Inicios de escucha con la calibración guardada",
+    "esp32_sent": "Comandos enviados al ESP32",
+    "esp32_responses": "Respuestas recibidas del ESP32",
+    "esp32_timeouts": "Comandos sin respuesta a tiempo",
+    "esp32_expired": "Comandos vencidos antes de enviarse al ESP32",
+    "esp32_errors": "Comandos perdidos por errores de conexión",
+    "esp32_reconnects": "Reconexiones con el ESP32",
+    "esp32_retransmits": "Comandos reenviados por UDP sin ack a tiempo",
+    "esp32_duplicate_acks": "Acks UDP repetidos (de un comando ya confirmado)",
+}
+
+GAUGE_HELP = {
+    "queue_depth": "Frases esperando un hilo de reconocimiento",
+    "esp32_in_flight": "Comandos enviados sin respuesta",
+    "esp32_connected": "1 si hay conexión con el ESP32",
+}
+
+
+def _percentile(ordered, fraction):
+    # Rango más cercano, como recognizers.percentile (sin importar speech_recognition)
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+class Histogram:
+    """Histograma acumulado por límites más una ventana de las últimas muestras.
+
+    Los contadores por límite son los que se exportan a Prometheus; la
+    ventana (window muestras) da percentiles exactos de lo reciente para
+    el panel en vivo.
+    """
+
+    __slots__ = ("buckets", "counts", "count", "sum", "recent")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1024):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.recent = collections.deque(maxlen=window)
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.recent.append(value)
+
+    def summary(self):
+        ordered = sorted(self.recent)
+        return {"count": self.count,
+                "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+                "p50_ms": _percentile(ordered, 0.50) * 1000,
+                "p95_ms": _percentile(ordered, 0.95) * 1000,
+                "p99_ms": _percentile(ordered, 0.99) * 1000}
+
+
+class _Span:
+    __slots__ = ("registry", "stage", "started")
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.perf_counter() - self.started)
+        return False
+
+
+class MetricsRegistry:
+    """Histogramas por etapa, contadores y medidores, seguros entre hilos"""
+
+    def __init__(self, prefix="voz", buckets=DEFAULT_BUCKETS, window=1024):
+        self.prefix = prefix
+        self.buckets = buckets
+        self.window = window
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+        self._gauges = {}
+
+    def span(self, stage):
+        """Context manager que mide el bloque y lo registra en la etapa"""
+        return _Span(self, stage)
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(self.buckets, self.window)
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+            self._gauges.clear()
+
+    def _ordered_stages(self):
+        known = [stage for stage in STAGES if stage in self._stages]
+        return known + sorted(stage for stage in self._stages if stage not in STAGES)
+
+    def snapshot(self):
+        """Resumen para mostrar: percentiles recientes por etapa y contadores"""
+        with self._lock:
+            return {"stages": {stage: self._stages[stage].summary() for stage in self._ordered_stages()},
+                    "counters": dict(self._counters),
+                    "gauges": dict(self._gauges)}
+
+    def render(self):
+        """Todas las métricas en el formato de texto de Prometheus (0.0.4)"""
+        prefix = self.prefix
+        lines = []
+        with self._lock:
+            if self._stages:
+                name = f"{prefix}_stage_seconds"
+                lines.append(f"# HELP {name} Duración de cada etapa de la cadena de voz")
+                lines.append(f"# TYPE {name} histogram")
+                for stage in self._ordered_stages():
+                    histogram = self._stages[stage]
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{{stage="{stage}",le="{bound:g}"}} {cumulative}')
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum!r}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+            for counter, value in sorted(self._counters.items()):
+                name = f"{prefix}_{counter}_total"
+                lines.append(f"# HELP {name} {COUNTER_HELP.get(counter, counter)}")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+            for gauge, value in sorted(self._gauges.items()):
+                name = f"{prefix}_{gauge}"
+                lines.append(f"# HELP {name} {GAUGE_HELP.get(gauge, gauge)}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+# Registro compartido por el motor, el VAD y el cliente del ESP32
+METRICS = MetricsRegistry()
+
+
+class MetricsServer:
+    """Servidor HTTP local que publica registry.render() en /metrics.
+
+    Con port=0 el sistema elige un puerto libre (ver address).
+    """
+
+    def __init__(self, registry=None, host="127.0.0.1", port=9108):
+        self.registry = registry or METRICS
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    @property
+    def address(self):
+        return self._server.server_address if self._server else None
+
+    def start(self):
+        """Abre el puerto (OSError si está ocupado) y atiende en un hilo; devuelve self"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
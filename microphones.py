@@ -0,0 +1,144 @@
+"""Lista de micrófonos en caché, enumerada en segundo plano.
+
+sr.Microphone.list_microphone_names() inicia PortAudio y recorre todos los
+dispositivos, lo que puede tardar bastante en el arranque. MicrophoneCatalog
+devuelve al instante la última lista guardada en disco y vuelve a
+enumerar en un hilo; on_update(nombres, error) se llama al terminar cada
+enumeración (con la lista anterior y el error si falla). Con
+watch_interval se repite cada tantos segundos (start_watch) para detectar
+micrófonos conectados o desconectados; esas enumeraciones periódicas solo
+llaman a on_update si la lista cambió.
+
+Mientras se captura audio no se enumera: PortAudio no es seguro entre
+hilos con un flujo abierto y, ya iniciado, no vuelve a buscar
+dispositivos. Las aplicaciones llaman a pause() antes de abrir el
+micrófono y a resume() al cerrarlo; lo pedido entretanto se enumera
+entonces.
+"""
+import json
+import os
+import threading
+
+import speech_recognition as sr
+
+DEFAULT_PATH = "microfonos.json"
+
+# Segundos entre enumeraciones del vigilante de las aplicaciones
+WATCH_INTERVAL = 10.0
+
+
+class MicrophoneCatalog:
+    """Nombres de micrófonos: caché en disco + enumeración en segundo plano"""
+
+    def __init__(self, path=DEFAULT_PATH, on_update=None, watch_interval=None,
+                 enumerate_devices=None):
+        self.path = path
+        self.on_update = on_update
+        self.watch_interval = watch_interval
+        self.enumerate_devices = enumerate_devices or sr.Microphone.list_microphone_names
+        self.refreshes = 0
+        self._names = None
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._idle = threading.Event()
+        self._idle.set()
+        # Capturas en curso (una sesión nueva puede empezar antes de que termine la anterior)
+        self._capturing = 0
+        # quiet de la enumeración pedida durante la captura (None = ninguna)
+        self._deferred = None
+        self._stop = threading.Event()
+        self._watcher = None
+        try:
+            with open(path, encoding="utf-8") as f:
+                self._names = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    @property
+    def names(self):
+        """Última lista conocida (None si nunca se enumeró)"""
+        return self._names
+
+    def refresh_async(self, quiet=False):
+        """Vuelve a enumerar en un hilo; no hace nada si ya hay una enumeración en curso.
+
+        Con quiet on_update solo se llama si la lista cambió.
+        """
+        with self._lock:
+            if self._capturing:
+                self._deferred = quiet if self._deferred is None else self._deferred and quiet
+                return False
+            if self._refreshing:
+                return False
+            self._refreshing = True
+            self._idle.clear()
+        threading.Thread(target=self._refresh, args=(quiet,), name="mic-enumeration",
+                         daemon=True).start()
+        return True
+
+    def refresh(self):
+        """Enumera en el hilo actual y devuelve la lista"""
+        with self._lock:
+            self._refreshing = True
+            self._idle.clear()
+        self._refresh()
+        return self._names
+
+    def pause(self, timeout=2.0):
+        """Se va a abrir el micrófono: espera a la enumeración en curso y no empieza otras"""
+        with self._lock:
+            self._capturing += 1
+        return self._idle.wait(timeout)
+
+    def resume(self):
+        """El micrófono se cerró: hace la enumeración pedida durante la captura"""
+        with self._lock:
+            self._capturing = max(0, self._capturing - 1)
+            if self._capturing:
+                return
+            quiet, self._deferred = self._deferred, None
+        if quiet is not None:
+            self.refresh_async(quiet)
+
+    def start_watch(self):
+        if self.watch_interval and self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="mic-watch", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _watch(self):
+        while not self._stop.wait(self.watch_interval):
+            self.refresh_async(quiet=True)
+
+    def _refresh(self, quiet=False):
+        try:
+            names = list(self.enumerate_devices())
+        except Exception as e:
+            self._finish()
+            if self.on_update and not quiet:
+                self.on_update(self._names, e)
+            return
+        self.refreshes += 1
+        changed = names != self._names
+        self._names = names
+        if changed:
+            self._save(names)
+        self._finish()
+        if self.on_update and (changed or not quiet):
+            self.on_update(names, None)
+
+    def _finish(self):
+        with self._lock:
+            self._refreshing = False
+            self._idle.set()
+
+    def _save(self, names):
+        temporary = f"{self.path}.tmp"
+        try:
+            with open(temporary, "w", encoding="utf-8") as f:
+                json.dump(names, f, ensure_ascii=False)
+            os.replace(temporary, self.path)
+        except OSError:
+            pass
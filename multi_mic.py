@@ -0,0 +1,118 @@
+"""Escucha simultánea en varios micrófonos con un único flujo de frases.
+
+Cada micrófono tiene su propio hilo de captura y segmentación (una
+vad.VADMicrophoneSource con su propia calibración) y todas las frases se
+juntan en una cola que el VoiceEngine consume como una fuente más. Para que
+el reconocimiento no se turne el GIL se combina con el reconocedor "pool"
+de recognizers.py (un grupo de procesos). Cuando la misma frase llega por
+varios micrófonos, CrossMicDeduplicator descarta las copias.
+"""
+import copy
+import logging
+import queue
+import threading
+import time
+
+import speech_recognition as sr
+
+from commands import normalize
+from vad import VADMicrophoneSource
+
+logger = logging.getLogger(__name__)
+
+
+class DeviceAudio(sr.AudioData):
+    """Frase con el micrófono de origen y la hora (time.time()) de captura"""
+
+    def __init__(self, frame_data, sample_rate, sample_width, device=None, captured_at=None):
+        super().__init__(frame_data, sample_rate, sample_width)
+        self.device = device
+        self.captured_at = captured_at if captured_at is not None else time.time()
+
+
+class MultiMicrophoneSource:
+    """Fuente en vivo que escucha a la vez en varios micrófonos.
+
+    devices: índices de sr.Microphone, o un dict índice -> nombre (el
+    nombre identifica la calibración guardada y el origen de cada frase).
+    source_factory(índice, nombre) crea la fuente de cada micrófono; por
+    defecto una VADMicrophoneSource con vad_options. Si un micrófono falla
+    los demás siguen; solo cuando fallan todos se propaga el primer error.
+    """
+
+    live = True
+
+    def __init__(self, devices, source_factory=None, queue_size=32, **vad_options):
+        if not isinstance(devices, dict):
+            devices = {index: f"#{index}" for index in devices}
+        self.devices = devices
+        self.source_factory = source_factory or (
+            lambda index, name: VADMicrophoneSource(device_index=index, device_name=name, **vad_options))
+        self.queue_size = queue_size
+        self.captured = {name: 0 for name in devices.values()}
+        self.dropped = 0
+        self.errors = {}
+
+    def utterances(self, recognizer, stop_event):
+        merged = queue.Queue(maxsize=self.queue_size)
+        threads = []
+        for index, name in self.devices.items():
+            # Cada micrófono calibra su propio umbral de energía
+            thread = threading.Thread(target=self._capture,
+                                      args=(index, name, copy.copy(recognizer), merged, stop_event),
+                                      name=f"captura-{name}", daemon=True)
+            thread.start()
+            threads.append(thread)
+
+        while not stop_event.is_set():
+            try:
+                yield merged.get(timeout=0.1)
+            except queue.Empty:
+                if not any(thread.is_alive() for thread in threads):
+                    break
+        if len(self.errors) == len(self.devices):
+            raise next(iter(self.errors.values()))
+
+    def _capture(self, index, name, recognizer, merged, stop_event):
+        try:
+            source = self.source_factory(index, name)
+            for audio in source.utterances(recognizer, stop_event):
+                item = DeviceAudio(audio.frame_data, audio.sample_rate, audio.sample_width, device=name)
+                try:
+                    merged.put_nowait(item)
+                except queue.Full:
+                    # El motor está saturado: se pierde la frase, no la captura
+                    self.dropped += 1
+                    continue
+                self.captured[name] += 1
+        except Exception as e:
+            self.errors[name] = e
+            logger.warning("Micrófono %s detenido: %s", name, e)
+
+
+class CrossMicDeduplicator:
+    """Detecta la misma frase oída por otro micrófono en menos de window segundos.
+
+    La comparación es por texto normalizado (commands.normalize). La
+    misma frase repetida en el mismo micrófono no es un duplicado: es el
+    usuario repitiendo la orden.
+    """
+
+    def __init__(self, window=1.5, max_entries=256):
+        self.window = window
+        self.max_entries = max_entries
+        self.duplicates = 0
+        self._seen = {}
+        self._lock = threading.Lock()
+
+    def is_duplicate(self, text, device, captured_at):
+        key = normalize(text)
+        with self._lock:
+            seen = self._seen.get(key)
+            if seen is not None and seen[0] != device and abs(captured_at - seen[1]) <= self.window:
+                self.duplicates += 1
+                return True
+            self._seen[key] = (device, captured_at)
+            if len(self._seen) > self.max_entries:
+                self._seen = {k: v for k, v in self._seen.items() if captured_at - v[1] <= self.window}
+            return False
@@ -3,9 +3,17 @@ import time
 import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-from PIL import Image, ImageTk
-import pygame
-import os
+from audio_preprocess import AudioPreprocessor
+from calibration import CalibrationStore
+from commands import ACTION_REGISTRY, GOODBYE_ACTION
+from history_store import HistoryStore
+from microphones import WATCH_INTERVAL, MicrophoneCatalog
+from history_view import ListHistorySource, VirtualListbox, load_recent
+from recognizers import backend_from_config
+from ui_channel import UIStateChannel
+from vad import VADMicrophoneSource
+from voice_engine import (VoiceEngine, EVENT_LISTENING, EVENT_PROCESSING,
+                          EVENT_TEXT, EVENT_COMMAND, EVENT_NO_COMMAND, EVENT_NOT_UNDERSTOOD, EVENT_ERROR, EVENT_STOPPED)
 
 class VoiceRecognitionApp:
     def __init__(self, root):
@@ -14,15 +22,76 @@ class VoiceRecognitionApp:
         self.root.geometry("800x600")
         self.root.configure(bg="#2c3e50")
         
-        # Inicializar pygame para sonidos
-        pygame.mixer.init()
-        
         # Variables de estado
         self.listening = False
         self.recognizer = sr.Recognizer()
         
+        # Reconocedor elegido por configuración (VOZ_BACKEND, por defecto google)
+        self.backend = backend_from_config(recognizer=self.recognizer, language='es-ES',
+                                           registry=ACTION_REGISTRY)
+        
+        # Calibración de ruido guardada por micrófono (evita recalibrar en cada inicio)
+        self.calibration = CalibrationStore()
+        
+        # Recorte de silencios y remuestreo a la frecuencia del reconocedor
+        self.preprocess = AudioPreprocessor.for_backend(self.backend)
+        
+        # Historial persistente (escritura por lotes en segundo plano)
+        self.history = HistoryStore()
+        
+        # Motor de reconocimiento (la interfaz solo se suscribe a sus eventos)
+        self.engine = VoiceEngine(recognizer=self.recognizer, language='es-ES',
+                                  recognize=self.backend, command_matcher=ACTION_REGISTRY, workers=2,
+                                  preprocess=self.preprocess)
+        # Los hilos del motor solo publican estado en el canal; el hilo de Tk
+        # lo aplica una vez por cuadro
+        self.ui = UIStateChannel(self.root, fps=30)
+        self.engine.subscribe(EVENT_LISTENING, lambda e: self.ui.publish("indicator", ("yellow", "Escuchando...")))
+        self.engine.subscribe(EVENT_PROCESSING, lambda e: self.ui.publish("indicator", ("blue", "Procesando...")))
+        self.engine.subscribe(EVENT_TEXT, lambda e: self.process_result(e.text))
+        self.engine.subscribe(EVENT_COMMAND, lambda e: self.execute_command(e.command))
+        self.engine.subscribe(EVENT_NOT_UNDERSTOOD, lambda e: self.show_not_understood())
+        self.engine.subscribe(EVENT_ERROR, self.on_engine_error)
+        self.engine.subscribe(EVENT_STOPPED, lambda e: self.ui.publish("stopped"))
+        # Con el micrófono cerrado se puede volver a enumerar (ver microphones.py)
+        self.engine.subscribe(EVENT_STOPPED, lambda e: self.microphones.resume())
+        self.engine.subscribe(EVENT_COMMAND, self.record_history)
+        self.engine.subscribe(EVENT_NO_COMMAND, self.record_history)
+        
+        # Mensajes de depuración en consola (desde el hilo del motor)
+        self.engine.subscribe(EVENT_LISTENING, lambda e: print("[DEBUG] Esperando audio..."))
+        self.engine.subscribe(EVENT_PROCESSING, lambda e: print("[DEBUG] Audio recibido, procesando..."))
+        self.engine.subscribe(EVENT_TEXT, lambda e: print(f"[DEBUG] Texto reconocido: {e.text}"))
+        self.engine.subscribe(EVENT_NOT_UNDERSTOOD, lambda e: print("[DEBUG] No se pudo entender el audio."))
+        
         self.setup_ui()
+        
+        # Estados que el canal aplica en el hilo de Tk
+        self.ui.bind_rows("history", self.add_history_rows)
+        self.ui.bind("history_loaded", self.on_history_loaded)
+        self.ui.bind("result", lambda value: self.show_result(*value))
+        self.ui.bind("indicator", lambda value: self.set_indicator(*value))
+        self.ui.bind("error", self.show_error)
+        self.ui.bind("goodbye", lambda value: self.root.after(2000, self.stop_listening))
+        self.ui.bind("stopped", self.on_engine_stopped)
+        self.ui.bind("microphones", lambda value: self.show_microphones(*value))
+        self.ui.start()
+        
+        # Micrófonos: la lista guardada aparece al instante y se vuelve a
+        # enumerar en segundo plano, sin retrasar la ventana; después se
+        # vigila cada WATCH_INTERVAL s por si se conecta o desconecta uno
+        self.microphones = MicrophoneCatalog(
+            on_update=lambda names, error: self.ui.publish("microphones", (names, error)),
+            watch_interval=WATCH_INTERVAL)
+        if self.microphones.names is not None:
+            self.show_microphones(self.microphones.names)
         self.update_microphone_list()
+        self.microphones.start_watch()
+        
+        # Cargar el historial guardado sin bloquear el arranque
+        started = time.time()
+        threading.Thread(target=lambda: self.ui.publish("history_loaded", load_recent(self.history, end=started)),
+                         name="history-loader", daemon=True).start()
         
     def setup_ui(self):
         # Colores y estilos modernos
@@ -88,11 +157,16 @@ class VoiceRecognitionApp:
         # Historial de comandos
         history_label = ttk.Label(main_frame, text="Historial de comandos:", font=("Segoe UI", 12, "bold"))
         history_label.grid(row=7, column=0, sticky=tk.W, pady=(10, 5))
+        self.history_filter = tk.StringVar()
+        ttk.Label(main_frame, text="🔍", font=("Segoe UI", 12)).grid(row=7, column=1, sticky=tk.E, pady=(10, 5))
+        ttk.Entry(main_frame, textvariable=self.history_filter, width=25).grid(row=7, column=2, sticky=tk.E, pady=(10, 5))
         self.history_listbox = tk.Listbox(main_frame, height=8, font=("Segoe UI", 11), bg=card_bg, fg=text_color, relief=tk.FLAT, bd=2, highlightthickness=2, highlightbackground=accent, selectbackground=accent, selectforeground=main_bg)
         self.history_listbox.grid(row=8, column=0, columnspan=3, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 20))
-        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL, command=self.history_listbox.yview)
+        scrollbar = ttk.Scrollbar(main_frame, orient=tk.VERTICAL)
         scrollbar.grid(row=8, column=3, sticky=(tk.N, tk.S), pady=(0, 20))
-        self.history_listbox.configure(yscrollcommand=scrollbar.set)
+        # El Listbox solo muestra las filas visibles; los datos están en la fuente
+        self.history_view = VirtualListbox(self.history_listbox, scrollbar, ListHistorySource(),
+                                           filter_var=self.history_filter)
         main_frame.rowconfigure(8, weight=1)
 
         # Mejorar bordes de ventana
@@ -100,17 +174,22 @@ class VoiceRecognitionApp:
         self.root.configure(bg=main_bg)
         
     def update_microphone_list(self):
-        """Actualiza la lista de micrófonos disponibles"""
-        try:
-            mics = sr.Microphone.list_microphone_names()
-            self.mic_combo['values'] = mics
-            if mics:
-                self.mic_combo.current(0)
-                self.mic_status.config(text="Estado: Micrófono disponible", foreground="green")
-            else:
-                self.mic_status.config(text="Estado: No se encontraron micrófonos", foreground="red")
-        except Exception as e:
-            messagebox.showerror("Error", f"No se pudieron cargar los micrófonos: {e}")
+        """Vuelve a enumerar los micrófonos en segundo plano"""
+        if self.microphones.refresh_async() and not self.mic_combo['values']:
+            self.mic_status.config(text="Estado: Buscando micrófonos...", foreground="orange")
+    
+    def show_microphones(self, mics, error=None):
+        """Muestra la lista de micrófonos conservando el elegido"""
+        if error is not None:
+            messagebox.showerror("Error", f"No se pudieron cargar los micrófonos: {error}")
+            return
+        selected = self.mic_combo.get()
+        self.mic_combo['values'] = mics
+        if mics:
+            self.mic_combo.current(mics.index(selected) if selected in mics else 0)
+            self.mic_status.config(text="Estado: Micrófono disponible", foreground="green")
+        else:
+            self.mic_status.config(text="Estado: No se encontraron micrófonos", foreground="red")
     
     def toggle_listening(self):
         """Alterna entre escuchar y parar"""
@@ -130,108 +209,90 @@ class VoiceRecognitionApp:
         self.status_canvas.itemconfig(self.indicator, fill="green")
         self.status_canvas.itemconfig(self.status_text, text="Escuchando...")
         
-        # Iniciar hilo para no bloquear la interfaz
-        thread = threading.Thread(target=self.listen_loop, daemon=True)
-        thread.start()
+        # El motor escucha en su propio hilo para no bloquear la interfaz
+        mic_index = self.mic_combo.current()
+        print(f"[DEBUG] Usando micrófono índice: {mic_index}")
+        # Mientras el micrófono está abierto no se enumeran dispositivos
+        self.microphones.pause()
+        self.engine.start(VADMicrophoneSource(device_index=mic_index, calibration_duration=1,
+                                              calibration=self.calibration, device_name=self.mic_combo.get()))
     
     def stop_listening(self):
         """Detiene el proceso de escucha"""
         self.listening = False
+        self.engine.stop()
         self.toggle_btn.config(text="🎤 Iniciar Escucha")
         self.status_canvas.itemconfig(self.indicator, fill="red")
         self.status_canvas.itemconfig(self.status_text, text="Inactivo")
     
-    def listen_loop(self):
-        """Bucle principal de escucha"""
-        mic_index = self.mic_combo.current()
-        print(f"[DEBUG] Usando micrófono índice: {mic_index}")
-        with sr.Microphone(device_index=mic_index) as source:
-            print("[DEBUG] Ajustando para el ruido ambiental...")
-            self.recognizer.adjust_for_ambient_noise(source, duration=1)
-            print("[DEBUG] Comenzando bucle de escucha...")
-            while self.listening:
-                try:
-                    print("[DEBUG] Esperando audio...")
-                    # Actualizar UI desde el hilo principal
-                    self.root.after(0, lambda: self.status_canvas.itemconfig(self.indicator, fill="yellow"))
-                    self.root.after(0, lambda: self.status_canvas.itemconfig(self.status_text, text="Escuchando..."))
-                    # Escuchar audio
-                    audio = self.recognizer.listen(source, timeout=3, phrase_time_limit=5)
-                    print("[DEBUG] Audio recibido, procesando...")
-                    # Reconocer
-                    self.root.after(0, lambda: self.status_canvas.itemconfig(self.indicator, fill="blue"))
-                    self.root.after(0, lambda: self.status_canvas.itemconfig(self.status_text, text="Procesando..."))
-                    text = self.recognizer.recognize_google(audio, language='es-ES')
-                    print(f"[DEBUG] Texto reconocido: {text}")
-                    # Procesar resultado
-                    self.root.after(0, lambda t=text: self.process_result(t))
-                    # Pequeña pausa antes de escuchar de nuevo
-                    time.sleep(1)
-                except sr.WaitTimeoutError:
-                    print("[DEBUG] Tiempo de espera agotado, no se detectó audio.")
-                    continue
-                except sr.UnknownValueError:
-                    print("[DEBUG] No se pudo entender el audio.")
-                    self.root.after(0, self.show_not_understood)
-                except sr.RequestError as e:
-                    print(f"[DEBUG] Error del servicio: {e}")
-                    self.root.after(0, lambda: self.show_error(f"Error del servicio: {e}"))
-                except Exception as e:
-                    print(f"[DEBUG] Error inesperado: {e}")
-                    self.root.after(0, lambda: self.show_error(f"Error inesperado: {e}"))
-                # Restaurar estado de escucha
-                if self.listening:
-                    self.root.after(0, lambda: self.status_canvas.itemconfig(self.indicator, fill="green"))
-                    self.root.after(0, lambda: self.status_canvas.itemconfig(self.status_text, text="Escuchando..."))
+    def set_indicator(self, color, text):
+        """Actualiza el indicador de estado"""
+        if not self.listening:
+            return
+        self.status_canvas.itemconfig(self.indicator, fill=color)
+        self.status_canvas.itemconfig(self.status_text, text=text)
+    
+    def on_engine_stopped(self, value=None):
+        """Sincroniza la interfaz si el motor terminó por su cuenta"""
+        if self.listening and not self.engine.listening:
+            self.stop_listening()
+    
+    def on_engine_error(self, event):
+        """Publica los errores del motor de reconocimiento"""
+        if isinstance(event.error, sr.RequestError):
+            print(f"[DEBUG] Error del servicio: {event.error}")
+            self.ui.publish("error", f"Error del servicio: {event.error}")
+        else:
+            print(f"[DEBUG] Error inesperado: {event.error}")
+            self.ui.publish("error", f"Error inesperado: {event.error}")
     
     def process_result(self, text):
-        """Procesa el texto reconocido"""
-        # Mostrar en el área de texto
-        self.result_text.delete(1.0, tk.END)
-        self.result_text.insert(tk.END, text)
-        
-        # Añadir al historial
-        self.history_listbox.insert(0, f"{time.strftime('%H:%M:%S')} - {text}")
-        if self.history_listbox.size() > 50:  # Limitar historial
-            self.history_listbox.delete(50, tk.END)
-        
-        # Resaltar brevemente
-        self.result_text.configure(bg="#27ae60")
-        self.root.after(500, lambda: self.result_text.configure(bg="#34495e"))
-        
-        # Procesar comando
-        self.execute_command(text.lower())
+        """Procesa el texto reconocido (hilo del motor)"""
+        self.ui.append("history", f"{time.strftime('%H:%M:%S')} - {text}")
+        self.ui.publish("result", (text, True))
+        # Restaurar estado de escucha
+        self.ui.publish("indicator", ("green", "Escuchando..."))
     
-    def execute_command(self, command):
-        """Ejecuta acciones basadas en el comando de voz"""
-        action = None
-        
-        if "encender" in command and "led" in command:
-            action = "💡 LED ENCENDIDO"
-        elif "apagar" in command and "led" in command:
-            action = "💡 LED APAGADO"
-        elif "activar" in command and "motor" in command:
-            action = "⚙️ MOTOR ACTIVADO"
-        elif "detener" in command and "motor" in command:
-            action = "⚙️ MOTOR DETENIDO"
-        elif "hola" in command:
-            action = "👋 ¡Hola! ¿En qué puedo ayudarte?"
-        elif "adiós" in command or "terminar" in command:
-            action = "👋 ¡Hasta luego!"
-            self.root.after(2000, self.stop_listening)
+    def execute_command(self, action):
+        """Ejecuta la acción encontrada por el motor para el comando de voz (hilo del motor)"""
+        if action == GOODBYE_ACTION:
+            self.ui.publish("goodbye")
         
         if action:
             # Mostrar acción en el historial
-            self.history_listbox.insert(0, f"{time.strftime('%H:%M:%S')} - {action}")
-            if self.history_listbox.size() > 50:
-                self.history_listbox.delete(50, tk.END)
+            self.ui.append("history", f"{time.strftime('%H:%M:%S')} - {action}")
     
     def show_not_understood(self):
-        """Muestra mensaje de no entendido"""
+        """Publica el mensaje de no entendido (hilo del motor)"""
+        self.ui.publish("result", ("No se pudo entender el audio. Intenta de nuevo.", False))
+        self.ui.publish("indicator", ("green", "Escuchando..."))
+    
+    def record_history(self, event):
+        """Guarda la frase y su acción en el historial persistente (hilo del motor)"""
+        self.history.record(event.text, event.command, backend=self.backend.name,
+                            recognition_ms=event.latency * 1000 if event.latency is not None else None,
+                            timestamp=event.timestamp)
+    
+    def on_history_loaded(self, loaded):
+        """Agrega debajo las filas guardadas en sesiones anteriores"""
+        rows, keys = loaded
+        self.history_view.source.insert_older(rows, keys)
+        self.history_view.render()
+    
+    def add_history_rows(self, rows):
+        """Agrega las filas nuevas al historial virtualizado (la más reciente arriba)"""
+        self.history_view.append(rows)
+    
+    def show_result(self, text, understood):
+        """Muestra el último resultado y lo resalta brevemente"""
         self.result_text.delete(1.0, tk.END)
-        self.result_text.insert(tk.END, "No se pudo entender el audio. Intenta de nuevo.")
-        self.result_text.configure(bg="#e74c3c")
-        self.root.after(1000, lambda: self.result_text.configure(bg="#34495e"))
+        self.result_text.insert(tk.END, text)
+        if understood:
+            self.result_text.configure(bg="#27ae60")
+            self.root.after(500, lambda: self.result_text.configure(bg="#34495e"))
+        else:
+            self.result_text.configure(bg="#e74c3c")
+            self.root.after(1000, lambda: self.result_text.configure(bg="#34495e"))
     
     def show_error(self, message):
         """Muestra mensaje de error"""
@@ -242,6 +303,10 @@ def main():
     root = tk.Tk()
     app = VoiceRecognitionApp(root)
     root.mainloop()
+    app.microphones.stop()
+    app.engine.stop()
+    app.engine.join(timeout=2)
+    app.history.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
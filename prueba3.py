@@ -1,34 +1,157 @@
 import speech_recognition as sr
 import time
-import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
-import socket
-import json
 import logging
+import os
+from audio_preprocess import AudioPreprocessor
+from calibration import CalibrationStore
+from commands import ESP32_REGISTRY, is_safety_command
+from devices import ALL, CANCELLED, EXPIRED, TIMEOUT, DevicePool, DeviceRegistry
+from discovery import DEFAULT_PORT, AddressBook, DeviceLocator
+from diagnostic_log import DiagnosticHandler, LogPipeline
+from history_store import HistoryStore
+from metrics import METRICS, MetricsServer
+from microphones import WATCH_INTERVAL, MicrophoneCatalog
+from recognizers import backend_from_config
+from ui_channel import UIStateChannel
+from vad import VADMicrophoneSource
+from voice_engine import (VoiceEngine, EVENT_LISTENING, EVENT_TEXT,
+                          EVENT_COMMAND, EVENT_NO_COMMAND, EVENT_NOT_UNDERSTOOD, EVENT_ERROR,
+                          EVENT_DROPPED, EVENT_EXPIRED, EVENT_STOPPED)
 
-# Configurar logging para depuración
-logging.basicConfig(level=logging.DEBUG, 
-                   format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger()
 
+# Líneas visibles en el área de diagnóstico; se recortan de a DIAG_TRIM_BATCH
+DIAG_MAX_LINES = 1000
+DIAG_TRIM_BATCH = 200
+
+# Métricas en http://127.0.0.1:<puerto>/metrics (formato Prometheus); 0 = desactivado
+METRICS_PORT = int(os.environ.get("VOZ_METRICS_PORT", "9108"))
+METRICS_REFRESH_MS = 1000
+
+# Transporte de los comandos: "tcp" (conexión persistente) o "udp" (esp32_udp.py)
+ESP32_TRANSPORT = os.environ.get("VOZ_ESP32_TRANSPORT", "tcp")
+
+# Segundos desde que se dijo la frase tras los que un comando ya no se envía
+# (los de seguridad, como apagar o detener, no caducan)
+COMMAND_DEADLINE = 3.0
+
+STAGE_LABELS = {"mic_open": "micrófono", "calibration": "calibración", "capture": "captura",
+                "segmentation": "segmentación", "queue": "cola", "preprocess": "preprocesado",
+                "recognition": "reconocimiento", "match": "comando", "send": "envío",
+                "response": "respuesta ESP32"}
+
 class VoiceRecognitionApp:
     def __init__(self, root):
         self.root = root
         self.root.title("Diagnóstico - Control por Voz ESP32")
-        self.root.geometry("900x700")
+        self.root.geometry("900x820")
         
         # Variables de estado
         self.listening = False
         self.recognizer = sr.Recognizer()
-        self.esp32_ip = "10.75.36.124"  # Cambia por la IP real de tu ESP32
-        self.esp32_port = 1234
         self.wifi_connected = False
-        self.socket = None
+        self.connected_devices = set()
+        
+        # Reconocedor elegido por configuración (VOZ_BACKEND, por defecto google)
+        self.backend = backend_from_config(recognizer=self.recognizer, language='es-ES',
+                                           registry=ESP32_REGISTRY)
+        
+        # Los hilos de trabajo publican en el canal; el hilo de Tk lo aplica
+        # una vez por cuadro
+        self.ui = UIStateChannel(self.root, fps=30)
+        
+        # Logging en segundo plano: quien registra solo encola (sin bloquear)
+        # y el hilo del QueueListener escribe en consola y en el diagnóstico
+        console = logging.StreamHandler()
+        console.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        self.diag_log = DiagnosticHandler(sink=lambda line: self.ui.append("diag", line + "\n"),
+                                          max_lines=DIAG_MAX_LINES)
+        self.log_pipeline = LogPipeline(console, self.diag_log, level=logging.INFO).start()
+        # Las repeticiones de una ráfaga se informan aunque no llegue otro mensaje
+        self.ui.every_frame(self.diag_log.flush_expired)
+        
+        # Latencia por etapa y contadores (metrics.METRICS), también por HTTP
+        self.metrics_server = None
+        if METRICS_PORT:
+            try:
+                self.metrics_server = MetricsServer(METRICS, port=METRICS_PORT).start()
+                self.log_diagnostic(f"Métricas en http://127.0.0.1:{METRICS_PORT}/metrics")
+            except OSError as e:
+                self.log_diagnostic(f"No se pudo abrir el puerto de métricas {METRICS_PORT}: {e}")
+        
+        # Calibración de ruido guardada por micrófono (evita recalibrar en cada inicio)
+        self.calibration = CalibrationStore()
+        
+        # Placas con nombre y grupos (dispositivos.json); una conexión
+        # persistente por placa y envío en paralelo a varias
+        self.devices = DeviceRegistry()
+        self.pool = DevicePool(self.devices, timeout=5, transport=ESP32_TRANSPORT,
+                               on_state=self.on_pool_state)
+        
+        # Sin IP escrita a mano: las placas se buscan en la red local y sus
+        # direcciones se guardan (direcciones_esp32.json); si una cambia de
+        # IP se la vuelve a encontrar por su MAC
+        self.address_book = AddressBook()
+        self.locator = DeviceLocator(self.devices, self.pool, self.address_book,
+                                     on_change=lambda name, board: self.ui.publish(
+                                         "device_moved", (name, board)),
+                                     on_found=lambda boards: self.ui.publish("discovered", boards))
+        
+        # Recorte de silencios y remuestreo a la frecuencia del reconocedor
+        self.preprocess = AudioPreprocessor.for_backend(self.backend)
+        
+        # Historial persistente (escritura por lotes en segundo plano)
+        self.history = HistoryStore()
+        
+        # Motor de reconocimiento (sus manejadores corren en el hilo del motor)
+        self.engine = VoiceEngine(recognizer=self.recognizer, language='es-ES',
+                                  recognize=self.backend, command_matcher=ESP32_REGISTRY, workers=2,
+                                  preprocess=self.preprocess, command_deadline=COMMAND_DEADLINE)
+        self.engine.subscribe(EVENT_LISTENING, lambda e: self.log_diagnostic("Escuchando..."))
+        self.engine.subscribe(EVENT_TEXT, lambda e: self.show_voice_text(e.text))
+        self.engine.subscribe(EVENT_COMMAND, lambda e: self.handle_command(e.text, e.match, e.latency,
+                                                                           deadline=e.deadline))
+        self.engine.subscribe(EVENT_EXPIRED, self.on_command_expired)
+        self.engine.subscribe(EVENT_NO_COMMAND, lambda e: self.handle_command(e.text, None, e.latency))
+        self.engine.subscribe(EVENT_NOT_UNDERSTOOD, lambda e: self.log_diagnostic("No se entendió el audio"))
+        self.engine.subscribe(EVENT_ERROR, lambda e: self.log_diagnostic(f"Error en reconocimiento: {e.error}"))
+        self.engine.subscribe(EVENT_DROPPED, lambda e: self.log_diagnostic(
+            f"Frase descartada, cola llena ({self.engine.stats()['dropped']} en total)"))
+        self.engine.subscribe(EVENT_STOPPED, lambda e: self.ui.publish("stopped"))
+        # Con el micrófono cerrado se puede volver a enumerar (ver microphones.py)
+        self.engine.subscribe(EVENT_STOPPED, lambda e: self.microphones.resume())
         
         # Configurar interfaz
         self.setup_ui()
+        
+        # Estados que el canal aplica en el hilo de Tk
+        self.ui.bind_rows("diag", self.add_diagnostic_rows)
+        self.ui.bind_rows("result", self.add_result_rows)
+        for name in self.devices.devices:
+            self.bind_device(name)
+        self.ui.bind("stopped", self.on_engine_stopped)
+        self.ui.bind("discovered", self.on_discovered)
+        self.ui.bind("device_moved", lambda value: self.on_device_moved(*value))
+        self.ui.bind("microphones", lambda value: self.show_microphones(*value))
+        self.ui.start()
+        self.root.after(METRICS_REFRESH_MS, self.refresh_metrics)
+        
+        # Al arrancar se comprueban las direcciones guardadas (en paralelo) y
+        # se conectan las placas; sin placas guardadas se busca en la red
+        self.locator.start()
+        
+        # Micrófonos: la lista guardada aparece al instante y se vuelve a
+        # enumerar en segundo plano, sin retrasar la ventana; después se
+        # vigila cada WATCH_INTERVAL s por si se conecta o desconecta uno
+        self.microphones = MicrophoneCatalog(
+            on_update=lambda names, error: self.ui.publish("microphones", (names, error)),
+            watch_interval=WATCH_INTERVAL)
+        if self.microphones.names is not None:
+            self.show_microphones(self.microphones.names)
         self.update_microphone_list()
+        self.microphones.start_watch()
         
         # Botón para test de conexión manual
         ttk.Button(self.root, text="🔧 Test de Conexión Manual", 
@@ -47,22 +170,46 @@ class VoiceRecognitionApp:
         self.diag_text.pack(fill=tk.X)
         self.diag_text.insert(tk.END, "Sistema de diagnóstico iniciado...\n")
         
+        # Panel de métricas en vivo (percentiles de las últimas frases)
+        metrics_frame = ttk.LabelFrame(main_frame, text="Métricas", padding="10")
+        metrics_frame.pack(fill=tk.X, pady=10)
+        
+        self.metrics_var = tk.StringVar(value="Sin datos todavía")
+        ttk.Label(metrics_frame, textvariable=self.metrics_var, font=("Consolas", 9),
+                  justify=tk.LEFT).pack(anchor=tk.W)
+        
         # Configuración WiFi
         wifi_frame = ttk.LabelFrame(main_frame, text="Configuración WiFi ESP32", padding="10")
         wifi_frame.pack(fill=tk.X, pady=10)
         
         ttk.Label(wifi_frame, text="IP del ESP32:").grid(row=0, column=0, sticky=tk.W, pady=5)
-        self.ip_var = tk.StringVar(value=self.esp32_ip)
+        addresses = list(self.devices.devices.values())
+        self.ip_var = tk.StringVar(value=addresses[0][0] if addresses else "")
         ttk.Entry(wifi_frame, textvariable=self.ip_var, width=15).grid(row=0, column=1, padx=5, pady=5)
         
         ttk.Label(wifi_frame, text="Puerto:").grid(row=0, column=2, sticky=tk.W, pady=5)
-        self.port_var = tk.StringVar(value="1234")
+        self.port_var = tk.StringVar(value=str(addresses[0][1] if addresses else DEFAULT_PORT))
         ttk.Entry(wifi_frame, textvariable=self.port_var, width=8).grid(row=0, column=3, padx=5, pady=5)
         
-        ttk.Button(wifi_frame, text="Conectar", command=self.connect_to_esp32).grid(row=0, column=4, padx=5, pady=5)
+        ttk.Label(wifi_frame, text="Nombre:").grid(row=0, column=4, sticky=tk.W, pady=5)
+        self.device_name_var = tk.StringVar(value="principal")
+        ttk.Entry(wifi_frame, textvariable=self.device_name_var, width=12).grid(row=0, column=5, padx=5, pady=5)
+        
+        ttk.Button(wifi_frame, text="Conectar", command=self.connect_to_esp32).grid(row=0, column=6, padx=5, pady=5)
+        ttk.Button(wifi_frame, text="🔍 Buscar", command=self.search_devices).grid(row=0, column=7, padx=5, pady=5)
+        
+        # Destino de los comandos: todas las placas, un grupo o una placa
+        ttk.Label(wifi_frame, text="Destino:").grid(row=1, column=0, sticky=tk.W, pady=5)
+        self.target_var = tk.StringVar(value=ALL)
+        # Copia para los hilos del motor (un StringVar solo se lee desde el hilo de Tk)
+        self.target = ALL
+        self.target_var.trace_add("write", self._on_target_changed)
+        self.target_combo = ttk.Combobox(wifi_frame, textvariable=self.target_var, state="readonly",
+                                         width=15, values=self.devices.targets())
+        self.target_combo.grid(row=1, column=1, padx=5, pady=5)
         
         self.wifi_status = ttk.Label(wifi_frame, text="Desconectado", foreground="red")
-        self.wifi_status.grid(row=1, column=0, columnspan=5, sticky=tk.W, pady=5)
+        self.wifi_status.grid(row=2, column=0, columnspan=8, sticky=tk.W, pady=5)
         
         # Configuración de micrófono
         mic_frame = ttk.LabelFrame(main_frame, text="Configuración de Micrófono", padding="10")
@@ -94,114 +241,231 @@ class VoiceRecognitionApp:
         self.result_text.pack(fill=tk.BOTH, expand=True)
         
     def log_diagnostic(self, message):
-        """Añadir mensaje al área de diagnóstico"""
-        timestamp = time.strftime("%H:%M:%S")
-        self.diag_text.insert(tk.END, f"[{timestamp}] {message}\n")
-        self.diag_text.see(tk.END)
+        """Añadir mensaje al área de diagnóstico (seguro desde cualquier hilo, no bloquea)"""
         logger.info(message)
         
+    def add_result(self, line):
+        """Añadir una línea al área de resultados (seguro desde cualquier hilo)"""
+        self.ui.append("result", line + "\n")
+        
+    def add_diagnostic_rows(self, rows):
+        """Insertar de una vez las líneas de diagnóstico del último cuadro"""
+        self.diag_text.insert(tk.END, "".join(rows))
+        # Recortar por lotes: un solo delete cada DIAG_TRIM_BATCH líneas
+        lines = int(self.diag_text.index("end-1c").split(".")[0])
+        if lines > DIAG_MAX_LINES + DIAG_TRIM_BATCH:
+            self.diag_text.delete("1.0", f"{lines - DIAG_MAX_LINES + 1}.0")
+        self.diag_text.see(tk.END)
+        
+    def refresh_metrics(self):
+        """Actualizar el panel de métricas (hilo de Tk, una vez por segundo)"""
+        self.metrics_var.set(self.format_metrics(METRICS.snapshot()))
+        self.root.after(METRICS_REFRESH_MS, self.refresh_metrics)
+        
+    @staticmethod
+    def format_metrics(snapshot):
+        """Tabla compacta de etapas y una línea de contadores"""
+        lines = [f"{'etapa':<16}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"]
+        for stage, stats in snapshot["stages"].items():
+            lines.append(f"{STAGE_LABELS.get(stage, stage):<16}{stats['count']:>6}"
+                         f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+        counters = snapshot["counters"]
+        lines.append(f"frases {counters.get('utterances', 0)} · "
+                     f"no entendidas {counters.get('unrecognized', 0)} · "
+                     f"comandos {counters.get('commands', 0)} · "
+                     f"timeouts {counters.get('esp32_timeouts', 0)} · "
+                     f"reconexiones {counters.get('esp32_reconnects', 0)} · "
+                     f"en cola {snapshot['gauges'].get('queue_depth', 0)}")
+        return "\n".join(lines)
+        
+    def add_result_rows(self, rows):
+        """Insertar de una vez las líneas de resultados del último cuadro"""
+        self.result_text.insert(tk.END, "".join(rows))
+        self.result_text.see(tk.END)
+        
     def update_microphone_list(self):
-        """Actualizar lista de micrófonos"""
-        try:
-            mics = sr.Microphone.list_microphone_names()
-            self.mic_combo['values'] = mics
-            if mics:
-                self.mic_combo.current(0)
-                self.log_diagnostic(f"Micrófonos detectados: {len(mics)}")
-            else:
-                self.log_diagnostic("No se encontraron micrófonos")
-        except Exception as e:
-            self.log_diagnostic(f"Error cargando micrófonos: {e}")
+        """Actualizar lista de micrófonos (en segundo plano)"""
+        self.microphones.refresh_async()
+        
+    def show_microphones(self, mics, error=None):
+        """Mostrar la lista de micrófonos conservando el elegido"""
+        if error is not None:
+            self.log_diagnostic(f"Error cargando micrófonos: {error}")
+            return
+        selected = self.mic_combo.get()
+        self.mic_combo['values'] = mics
+        if mics:
+            self.mic_combo.current(mics.index(selected) if selected in mics else 0)
+            self.log_diagnostic(f"Micrófonos detectados: {len(mics)}")
+        else:
+            self.log_diagnostic("No se encontraron micrófonos")
             
     def connect_to_esp32(self):
-        """Conectar al ESP32"""
+        """Registrar la placa y conectar (en segundo plano, sin bloquear la interfaz)"""
+        name = self.device_name_var.get().strip() or "principal"
+        self.log_diagnostic(f"Intentando conectar {name} en {self.ip_var.get()}:{self.port_var.get()}")
+        
         try:
-            self.log_diagnostic(f"Intentando conectar a {self.ip_var.get()}:{self.port_var.get()}")
-            
-            # Cerrar conexión anterior si existe
-            if self.socket:
-                self.socket.close()
-                
-            # Crear nuevo socket
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(5)
+            port = int(self.port_var.get())
+        except ValueError as e:
+            self.on_connection_state(name, False, e)
+            return
             
-            # Intentar conexión
-            self.socket.connect((self.ip_var.get(), int(self.port_var.get())))
-            
-            self.wifi_connected = True
-            self.wifi_status.config(text="Conectado", foreground="green")
+        # Si la dirección cambió, el grupo reemplaza el cliente de esa placa;
+        # cada cliente reconecta solo con espera exponencial
+        host = self.ip_var.get().strip()
+        board = next((board for board in self.address_book.fresh() if board.address == (host, port)),
+                     None)
+        self.devices.add(name, host, port, device_id=board.device_id if board else None)
+        try:
+            self.devices.save()
+        except OSError as e:
+            self.log_diagnostic(f"No se pudo guardar {self.devices.path}: {e}")
+        self.bind_device(name)
+        self.target_combo['values'] = self.devices.targets()
+        self.pool.connect(name)
+        
+    def search_devices(self):
+        """Buscar placas en la red local (en segundo plano)"""
+        if self.locator.start_search():
+            self.log_diagnostic("🔍 Buscando placas ESP32 en la red local...")
+        
+    def on_discovered(self, boards):
+        """Resultado de una búsqueda: la primera placa encontrada rellena la IP"""
+        if not boards:
+            self.log_diagnostic("🔍 No se encontró ninguna placa ESP32")
+            return
+        for board in boards:
+            self.log_diagnostic(f"🔍 ESP32 en {board.host}:{board.port}"
+                                + (f" ({board.device_id})" if board.device_id else ""))
+        if not self.devices.devices:
+            # Sin placas registradas la primera encontrada se conecta sola
+            self.ip_var.set(boards[0].host)
+            self.port_var.set(str(boards[0].port))
+            self.connect_to_esp32()
+        
+    def on_device_moved(self, name, board):
+        self.log_diagnostic(f"📍 {name} cambió de dirección: {board.host}:{board.port}")
+        if name == self.device_name_var.get().strip():
+            self.ip_var.set(board.host)
+            self.port_var.set(str(board.port))
+        
+    def on_pool_state(self, name, connected, error):
+        """Estado de una placa (hilo del grupo): a la interfaz y al localizador"""
+        self.ui.publish(f"connection:{name}", (name, connected, error))
+        self.locator.on_state(name, connected, error)
+        
+    def bind_device(self, name):
+        """Estado de conexión de una placa: una clave del canal por placa"""
+        self.ui.bind(f"connection:{name}", lambda value: self.on_connection_state(*value))
+        
+    def on_connection_state(self, name, connected, error=None):
+        """Actualizar la interfaz cuando cambia el estado de la conexión de una placa"""
+        if connected and name in self.connected_devices:
+            return
+        if connected:
+            self.connected_devices.add(name)
+            self.log_diagnostic(f"✅ Conexión WiFi establecida con {name}")
+        else:
+            self.connected_devices.discard(name)
+            self.log_diagnostic(f"❌ Error de conexión con {name}: {error}")
+        self.wifi_connected = bool(self.connected_devices)
+        if self.wifi_connected:
+            self.wifi_status.config(text="Conectado: " + ", ".join(sorted(self.connected_devices)),
+                                    foreground="green")
             self.toggle_btn.config(state="normal")
-            self.log_diagnostic("✅ Conexión WiFi establecida con ESP32")
-            
-        except Exception as e:
-            self.wifi_connected = False
-            self.wifi_status.config(text=f"Error: {str(e)}", foreground="red")
-            self.log_diagnostic(f"❌ Error de conexión: {e}")
+        else:
+            self.wifi_status.config(text=f"Error ({name}): {error}", foreground="red")
             
-    def send_to_esp32(self, command):
-        """Enviar comando al ESP32"""
-        if not self.wifi_connected:
+    def _on_target_changed(self, *args):
+        self.target = self.target_var.get()
+
+    def send_to_esp32(self, command, on_done=None, deadline=None, priority=False):
+        """Enviar el comando a las placas del destino elegido; las respuestas llegan por callback.
+        
+        Las placas reciben el comando a la vez. on_done(respuesta, ms), si se
+        da, se llama cuando respondieron todas, con las respuestas (o errores)
+        y el tiempo de la más lenta en milisegundos. deadline y priority
+        pasan a DevicePool.send.
+        """
+        target = self.target
+        try:
+            names = self.devices.resolve(target)
+        except KeyError:
+            names = []
+        if not names:
             self.log_diagnostic("No hay conexión WiFi activa")
+            if on_done:
+                on_done("Sin conexión", None)
             return False
             
-        try:
-            # Crear mensaje
-            message = json.dumps({
-                "command": command,
-                "timestamp": time.time(),
-                "type": "control"
-            })
-            
-            self.log_diagnostic(f"Enviando: {message}")
-            
-            # Enviar comando
-            self.socket.sendall(message.encode() + b'\n')
-            
-            # Intentar recibir respuesta
-            try:
-                response = self.socket.recv(1024).decode().strip()
-                if response:
-                    self.log_diagnostic(f"Respuesta del ESP32: {response}")
-                    self.result_text.insert(tk.END, f"ESP32: {response}\n")
-            except socket.timeout:
-                self.log_diagnostic("El ESP32 no respondió (timeout)")
-            except Exception as e:
-                self.log_diagnostic(f"Error recibiendo respuesta: {e}")
+        self.log_diagnostic(f"Enviando a {target}: {command}")
+        results = []
+        
+        def collect(result):
+            # Hilo del bucle de las placas: un resultado por placa
+            self.on_device_result(command, result)
+            results.append(result)
+            if on_done and len(results) == len(names):
+                on_done(self.summarize_results(results), max(r.elapsed_ms for r in results))
                 
-            return True
+        self.pool.send(target, command, callback=collect, deadline=deadline, priority=priority)
+        return True
+        
+    def on_device_result(self, command, result):
+        """Mostrar la respuesta (o el error) de una placa"""
+        if result.ok:
+            self.log_diagnostic(f"Respuesta de {result.device}: {result.response}")
+            self.add_result(f"{result.device}: {result.response}")
+        elif result.status == TIMEOUT:
+            self.log_diagnostic(f"{result.device} no respondió (timeout): {command}")
+        elif result.status == EXPIRED:
+            self.log_diagnostic(f"{command} no se envió a {result.device}: venció su plazo")
+        elif result.status == CANCELLED:
+            self.log_diagnostic(f"{command} no se envió a {result.device}: lo anuló un comando de seguridad")
+        else:
+            self.log_diagnostic(f"Error enviando {command} a {result.device}: {result.error}")
             
-        except Exception as e:
-            self.log_diagnostic(f"Error enviando comando: {e}")
-            self.wifi_connected = False
-            return False
+    @staticmethod
+    def summarize_results(results):
+        """Texto de las respuestas para el historial (sin nombre si es una sola placa)"""
+        def text(result):
+            if result.ok:
+                return result.response
+            labels = {TIMEOUT: "Timeout", EXPIRED: "Vencido", CANCELLED: "Anulado"}
+            return labels.get(result.status) or f"Error: {result.error}"
+        if len(results) == 1:
+            return text(results[0])
+        return "; ".join(f"{r.device}: {text(r)}" for r in sorted(results, key=lambda r: r.device))
             
     def test_connection_manual(self):
         """Test manual de conexión"""
         self.log_diagnostic("Iniciando test manual de conexión...")
         self.connect_to_esp32()
         
-        if self.wifi_connected:
-            # Test de comandos manuales
-            test_commands = ["LED_ON", "LED_OFF", "FREQ:1", "FREQ:2"]
-            for cmd in test_commands:
-                self.log_diagnostic(f"Enviando comando de test: {cmd}")
-                self.send_to_esp32(cmd)
-                time.sleep(1)
+        # Test de comandos manuales (se envían en cuanto haya conexión)
+        test_commands = ["LED_ON", "LED_OFF", "FREQ:1", "FREQ:2"]
+        for cmd in test_commands:
+            self.log_diagnostic(f"Enviando comando de test: {cmd}")
+            self.send_to_esp32(cmd)
                 
     def test_voice(self):
         """Test de reconocimiento de voz"""
         self.log_diagnostic("Iniciando test de voz...")
         try:
             with sr.Microphone() as source:
-                self.recognizer.adjust_for_ambient_noise(source, duration=1)
+                cached = self.calibration.get("default")
+                if cached:
+                    self.recognizer.energy_threshold = cached["energy_threshold"]
+                else:
+                    self.recognizer.adjust_for_ambient_noise(source, duration=1)
                 self.log_diagnostic("Escuchando... Habla ahora")
                 
                 audio = self.recognizer.listen(source, timeout=5)
-                text = self.recognizer.recognize_google(audio, language='es-ES')
+                text = self.backend(audio)
                 
                 self.log_diagnostic(f"Voz reconocida: {text}")
-                self.result_text.insert(tk.END, f"Voz: {text}\n")
+                self.add_result(f"Voz: {text}")
                 self.process_voice_command(text)
                 
         except Exception as e:
@@ -225,81 +489,72 @@ class VoiceRecognitionApp:
         self.toggle_btn.config(text="⏹️ Detener Escucha")
         self.log_diagnostic("Modo escucha activado")
         
-        # Hilo para escucha continua
-        thread = threading.Thread(target=self.listen_loop, daemon=True)
-        thread.start()
+        # El motor escucha en su propio hilo; mientras tanto no se enumeran micrófonos
+        self.microphones.pause()
+        self.engine.start(VADMicrophoneSource(calibration_duration=1, calibration=self.calibration))
         
     def stop_listening(self):
         """Detener escucha"""
         self.listening = False
+        self.engine.stop()
         self.toggle_btn.config(text="🎤 Iniciar Escucha")
         self.log_diagnostic("Modo escucha desactivado")
+        report = self.preprocess.report()
+        if report["utterances"]:
+            self.log_diagnostic(f"Audio enviado: {report['bytes_out'] // 1024} KB de {report['bytes_in'] // 1024} KB, "
+                                f"{report['seconds_saved']:.1f} s de silencio recortados")
         
-    def listen_loop(self):
-        """Bucle de escucha"""
-        with sr.Microphone() as source:
-            self.recognizer.adjust_for_ambient_noise(source)
-            
-            while self.listening:
-                try:
-                    self.log_diagnostic("Escuchando...")
-                    audio = self.recognizer.listen(source, timeout=3, phrase_time_limit=5)
-                    
-                    text = self.recognizer.recognize_google(audio, language='es-ES')
-                    self.log_diagnostic(f"Comando de voz: {text}")
-                    
-                    # Procesar en el hilo principal
-                    self.root.after(0, lambda t=text: self.process_voice_command(t))
-                    
-                except sr.WaitTimeoutError:
-                    continue
-                except sr.UnknownValueError:
-                    
-                    self.log_diagnostic("No se entendió el audio")
-                except Exception as e:
-                    self.log_diagnostic(f"Error en reconocimiento: {e}")
+    def on_engine_stopped(self, value=None):
+        """Sincronizar la interfaz si el motor terminó por su cuenta"""
+        if self.listening and not self.engine.listening:
+            self.stop_listening()
                     
     def process_voice_command(self, text):
         """Procesar comando de voz"""
-        self.result_text.insert(tk.END, f"Comando: {text}\n")
-        self.result_text.see(tk.END)
+        self.show_voice_text(text)
+        self.handle_command(text, ESP32_REGISTRY.match(text))
         
-        text_lower = text.lower()
-        command = None
-        
-        # Diccionario de comandos
-        commands = {
-            "encender led": "LED_ON",
-            "prender led": "LED_ON", 
-            "activar led": "LED_ON",
-            "apagar led": "LED_OFF",
-            "apaga led": "LED_OFF",
-            "desactivar led": "LED_OFF",
-            "aumentar frecuencia": "FREQ_UP",
-            "subir frecuencia": "FREQ_UP",
-            "reducir frecuencia": "FREQ_DOWN", 
-            "bajar frecuencia": "FREQ_DOWN",
-            "frecuencia rápida": "FREQ_FAST",
-            "frecuencia lenta": "FREQ_SLOWS"
-        }
-        
-        # Buscar comando coincidente
-        for voice_cmd, esp_cmd in commands.items():
-            if voice_cmd in text_lower:
-                command = esp_cmd
-                self.log_diagnostic(f"Comando reconocido: {voice_cmd} -> {esp_cmd}")
-                break
-                
-        if command:
-            self.send_to_esp32(command)
+    def show_voice_text(self, text):
+        """Mostrar el texto reconocido"""
+        self.log_diagnostic(f"Comando de voz: {text}")
+        self.add_result(f"Comando: {text}")
+        
+    def handle_command(self, text, match, latency=None, deadline=None):
+        """Enviar al ESP32 el comando encontrado en el texto y guardarlo en el historial"""
+        recognition_ms = latency * 1000 if latency is not None else None
+        if match:
+            self.log_diagnostic(f"Comando reconocido: {match.phrase} -> {match.command}")
+            # La fila se guarda cuando llega la respuesta, con su latencia
+            self.send_to_esp32(match.command, on_done=lambda response, response_ms: self.history.record(
+                text, match.command, backend=self.backend.name, recognition_ms=recognition_ms,
+                response_ms=response_ms, response=response),
+                deadline=deadline, priority=is_safety_command(match.command))
         else:
             self.log_diagnostic("Comando no reconocido")
-            self.result_text.insert(tk.END, "❌ Comando no reconocido\n")
+            self.add_result("❌ Comando no reconocido")
+            self.history.record(text, None, backend=self.backend.name, recognition_ms=recognition_ms)
+
+    def on_command_expired(self, event):
+        """El comando se reconoció demasiado tarde: se registra y no se envía"""
+        late = time.time() - event.deadline
+        self.log_diagnostic(f"Comando vencido, no se envía: {event.command} ({late:.1f} s tarde)")
+        self.history.record(event.text, event.command, backend=self.backend.name,
+                            recognition_ms=event.latency * 1000 if event.latency is not None else None,
+                            response="Vencido")
 
 def main():
     root = tk.Tk()
     app = VoiceRecognitionApp(root)
     root.mainloop()
+    app.microphones.stop()
+    app.engine.stop()
+    app.engine.join(timeout=2)
+    app.locator.close()
+    app.pool.close()
+    app.history.close()
+    if app.metrics_server:
+        app.metrics_server.stop()
+    app.log_pipeline.stop()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,136 @@
+"""Caché de resultados de reconocimiento indexada por huella del audio.
+
+Se coloca entre la segmentación y el reconocedor: la clave es un hash
+rápido (BLAKE2) del PCM normalizado a 16 kHz / 16 bits junto con el
+reconocedor y el idioma. Tiene un nivel en memoria (LRU con caducidad) y un
+nivel opcional en disco (SQLite) que sobrevive a reinicios, de modo que los
+clips repetidos de las pruebas no vuelven a llamar a recognize_google.
+"""
+import speech_recognition as sr
+import collections
+import hashlib
+import sqlite3
+import threading
+import time
+
+NORMALIZED_RATE = 16000
+NORMALIZED_WIDTH = 2
+
+_MISSING = object()
+
+
+def audio_fingerprint(audio, backend="google", language="es-ES"):
+    """Huella del audio normalizado y de los parámetros de reconocimiento"""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{backend}\0{language}\0".encode())
+    digest.update(audio.get_raw_data(convert_rate=NORMALIZED_RATE, convert_width=NORMALIZED_WIDTH))
+    return digest.hexdigest()
+
+
+class RecognitionCache:
+    """Caché LRU con caducidad y nivel opcional en SQLite.
+
+    Guarda tanto textos como "no se entendió" (valor None), porque repetir
+    un clip ininteligible también cuesta una llamada al reconocedor. Los
+    errores del servicio (sr.RequestError) no se guardan.
+    """
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.path = path
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+        self._memory = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS recognition_cache ("
+                             "key TEXT PRIMARY KEY, text TEXT, created REAL NOT NULL)")
+            self._db.commit()
+
+    def __len__(self):
+        return len(self._memory)
+
+    def get(self, key, default=None):
+        """Texto guardado (None = no se entendió) o default si no está"""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created, text = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return text
+                del self._memory[key]
+                self.stats["expired"] += 1
+
+            if self._db is not None:
+                row = self._db.execute("SELECT text, created FROM recognition_cache WHERE key = ?",
+                                       (key,)).fetchone()
+                if row is not None:
+                    text, created = row
+                    if now - created <= self.ttl:
+                        self._store_memory(key, created, text)
+                        self.stats["disk_hits"] += 1
+                        return text
+                    self._db.execute("DELETE FROM recognition_cache WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.stats["expired"] += 1
+
+            self.stats["misses"] += 1
+            return default
+
+    def put(self, key, text):
+        created = time.time()
+        with self._lock:
+            self._store_memory(key, created, text)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO recognition_cache (key, text, created) "
+                                 "VALUES (?, ?, ?)", (key, text, created))
+                self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM recognition_cache")
+                self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def hit_rate(self):
+        hits = self.stats["hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def wrap(self, recognize, backend="google", language="es-ES"):
+        """Devuelve recognize(audio) con la caché delante"""
+        def cached_recognize(audio):
+            key = audio_fingerprint(audio, backend, language)
+            text = self.get(key, _MISSING)
+            if text is _MISSING:
+                try:
+                    text = recognize(audio)
+                except sr.UnknownValueError:
+                    self.put(key, None)
+                    raise
+                self.put(key, text)
+            if text is None:
+                raise sr.UnknownValueError()
+            return text
+
+        cached_recognize.cache = self
+        return cached_recognize
+
+    def _store_memory(self, key, created, text):
+        self._memory[key] = (created, text)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evicted"] += 1
@@ -0,0 +1,443 @@
+"""Reconocedores intercambiables para el motor de voz.
+
+Cada reconocedor es un objeto invocable recognize(audio) -> texto que
+lanza sr.UnknownValueError / sr.RequestError como speech_recognition. Se
+registran por nombre y se eligen por configuración (argumento, o variables
+de entorno VOZ_BACKEND y VOZ_BACKEND_OPTIONS con opciones en JSON):
+
+    google  - Google Speech API (requiere internet, dictado abierto)
+    sphinx  - PocketSphinx local, restringido a las frases de commands.py
+    hedged  - envía cada frase a varios reconocedores a la vez y usa el
+              primer resultado confiable que corresponde a un comando
+    replay  - transcripciones grabadas por huella del audio (benchmarks)
+    pool    - otro reconocedor ejecutado en un grupo de procesos (varios
+              núcleos, sin el GIL), para escuchar varios micrófonos
+"""
+import speech_recognition as sr
+import collections
+import concurrent.futures
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from commands import ESP32_REGISTRY, NUMBER_WORDS, NUM, normalize
+from recognition_cache import audio_fingerprint
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = {}
+
+DEFAULT_BACKEND = "google"
+
+
+def register_backend(name):
+    """Decorador que registra una clase de reconocedor con un nombre"""
+    def decorator(cls):
+        cls.name = name
+        BACKENDS[name] = cls
+        return cls
+    return decorator
+
+
+def create_backend(name, **options):
+    """Crea el reconocedor registrado con ese nombre"""
+    try:
+        cls = BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Reconocedor desconocido: {name!r} (disponibles: {', '.join(sorted(BACKENDS))})")
+    return cls(**options)
+
+
+def backend_from_config(name=None, options=None, **defaults):
+    """Crea el reconocedor indicado o el configurado en el entorno.
+
+    defaults (recognizer, language, registry, ...) se combinan con las
+    opciones de VOZ_BACKEND_OPTIONS; las de la configuración tienen prioridad.
+    """
+    name = name or os.environ.get("VOZ_BACKEND", DEFAULT_BACKEND)
+    if options is None:
+        options = json.loads(os.environ.get("VOZ_BACKEND_OPTIONS", "{}"))
+    return create_backend(name, **dict(defaults, **options))
+
+
+class RecognitionResult:
+    """Texto reconocido con su confianza (0-1, None si no se conoce)"""
+
+    def __init__(self, text, confidence=None, backend=None, latency=None):
+        self.text = text
+        self.confidence = confidence
+        self.backend = backend
+        self.latency = latency
+
+    def __repr__(self):
+        return f"RecognitionResult({self.text!r}, confidence={self.confidence}, backend={self.backend!r})"
+
+
+class RecognizerBackend:
+    """Base de los reconocedores: subclases implementan recognize_result()"""
+
+    name = None
+    # Frecuencia de muestreo que el reconocedor usa internamente (None = cualquiera)
+    preferred_rate = None
+
+    def __init__(self, recognizer=None, language="es-ES", registry=None):
+        self.recognizer = recognizer or sr.Recognizer()
+        self.language = language
+        self.registry = registry
+
+    def recognize_result(self, audio):
+        raise NotImplementedError
+
+    def recognize(self, audio):
+        return self.recognize_result(audio).text
+
+    def __call__(self, audio):
+        return self.recognize(audio)
+
+    def _result(self, text, confidence, started):
+        return RecognitionResult(text, confidence, self.name, time.perf_counter() - started)
+
+
+@register_backend("google")
+class GoogleBackend(RecognizerBackend):
+    """Google Speech API (la que usaban las tres aplicaciones)"""
+
+    def recognize_result(self, audio):
+        started = time.perf_counter()
+        response = self.recognizer.recognize_google(audio, language=self.language, show_all=True)
+        alternatives = response.get("alternative") if isinstance(response, dict) else None
+        if not alternatives:
+            raise sr.UnknownValueError()
+        best = max(alternatives, key=lambda a: a.get("confidence", 0))
+        return self._result(best["transcript"], best.get("confidence"), started)
+
+
+def grammar_keywords(registry=None):
+    """Frases del registro listas para búsqueda de palabras clave.
+
+    Se quitan tildes (los diccionarios de pronunciación no las usan) y cada
+    {num} se expande con los números en palabras del 0 al 10.
+    """
+    registry = registry or ESP32_REGISTRY
+    keywords = []
+    for phrase in registry.phrases():
+        phrase = normalize(phrase)
+        if NUM in phrase:
+            keywords.extend(phrase.replace(NUM, word) for word in NUMBER_WORDS)
+        else:
+            keywords.append(phrase)
+    return sorted(set(keywords))
+
+
+@register_backend("sphinx")
+class SphinxBackend(RecognizerBackend):
+    """PocketSphinx local, restringido al vocabulario de comandos.
+
+    Con un vocabulario cerrado la búsqueda es de palabras clave, mucho más
+    rápida y predecible que el dictado abierto, y no necesita red. Para
+    es-ES hay que instalar el modelo de idioma en speech_recognition
+    (pocketsphinx-data/es-ES); si falta se lanza sr.RequestError.
+
+    En la búsqueda de palabras clave una detección ya superó el umbral
+    sensitivity: si corresponde a un único comando del registro su
+    confianza es sensitivity (así puede ganar una carrera en "hedged" sin
+    esperar a la nube); si no, es desconocida.
+    """
+
+    preferred_rate = 16000
+
+    def __init__(self, recognizer=None, language="es-ES", registry=None, sensitivity=0.8,
+                 grammar=None):
+        super().__init__(recognizer, language, registry or ESP32_REGISTRY)
+        self.grammar = grammar
+        self.sensitivity = sensitivity
+        self.keyword_entries = None
+        if grammar is None:
+            self.keyword_entries = [(keyword, sensitivity) for keyword in grammar_keywords(registry)]
+
+    def recognize_result(self, audio):
+        started = time.perf_counter()
+        decoder = self.recognizer.recognize_sphinx(audio, language=self.language,
+                                                   keyword_entries=self.keyword_entries,
+                                                   grammar=self.grammar, show_all=True)
+        hypothesis = decoder.hyp()
+        text = hypothesis.hypstr.strip() if hypothesis is not None else ""
+        if not text:
+            raise sr.UnknownValueError()
+        confidence = self._confidence(decoder, hypothesis)
+        if confidence is None and self.keyword_entries is not None:
+            confidence = self._keyword_confidence(text)
+        return self._result(text, confidence, started)
+
+    def _keyword_confidence(self, text):
+        """Confianza de una detección de palabras clave (None si es ambigua)"""
+        commands = {match.command for match in self.registry.match_all(text)}
+        return self.sensitivity if len(commands) == 1 else None
+
+    @staticmethod
+    def _confidence(decoder, hypothesis):
+        """Probabilidad a posteriori de la hipótesis (None si el decodificador no la calcula).
+
+        pocketsphinx da la posterior como logaritmo en su base (logmath) o,
+        en versiones recientes, ya como probabilidad. La búsqueda de
+        palabras clave no la calcula y deja 0 (log 1) o 1.0: ahí la
+        confianza es desconocida, no total.
+        """
+        prob = getattr(hypothesis, "prob", 0)
+        if prob in (0, 1):
+            return None
+        if 0 < prob < 1:
+            return prob
+        try:
+            return min(1.0, decoder.get_logmath().exp(prob))
+        except AttributeError:
+            return None
+
+
+@register_backend("replay")
+class ReplayBackend(RecognizerBackend):
+    """Reconocedor simulado: devuelve la transcripción grabada para cada audio.
+
+    Sustituye a la red en benchmarks y pruebas repetibles. Las frases se
+    registran con add(audio, texto) o desde un manifiesto JSON (lista de
+    {"file": ..., "text": ...}, rutas relativas al manifiesto). latency y
+    jitter simulan el tiempo de reconocimiento; con error_rate una
+    fracción de las frases no se entiende. Un audio desconocido lanza
+    sr.UnknownValueError.
+    """
+
+    def __init__(self, recognizer=None, language="es-ES", registry=None, manifest=None,
+                 latency=0.0, jitter=0.0, error_rate=0.0, seed=None):
+        super().__init__(recognizer, language, registry)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.transcripts = {}
+        if manifest:
+            self.load_manifest(manifest)
+
+    def add(self, audio, text):
+        self.transcripts[self._key(audio)] = text
+
+    def load_manifest(self, path):
+        base = os.path.dirname(os.path.abspath(path))
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in entries:
+            with sr.AudioFile(os.path.join(base, entry["file"])) as source:
+                self.add(self.recognizer.record(source), entry["text"])
+        return len(entries)
+
+    def recognize_result(self, audio):
+        started = time.perf_counter()
+        text = self.transcripts.get(self._key(audio))
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay:
+            time.sleep(delay)
+        if not text or (self.error_rate and self.random.random() < self.error_rate):
+            raise sr.UnknownValueError()
+        return self._result(text, 1.0, started)
+
+    def _key(self, audio):
+        return audio_fingerprint(audio, "replay", self.language)
+
+
+# Reconocedor de cada proceso del grupo de "pool" (creado por el inicializador)
+_process_backend = None
+
+
+def _init_process_backend(name, language, registry, options):
+    global _process_backend
+    _process_backend = create_backend(name, language=language, registry=registry, **options)
+
+
+def _recognize_in_process(audio):
+    return _process_backend.recognize_result(audio)
+
+
+@register_backend("pool")
+class ProcessPoolBackend(RecognizerBackend):
+    """Reparte el reconocimiento de otro reconocedor entre varios procesos.
+
+    Cada proceso crea su propio reconocedor backend (con options) al
+    arrancar; las frases (sr.AudioData) viajan serializadas y vuelve el
+    RecognitionResult. Los hilos del motor solo esperan, así que el
+    reconocimiento local (sphinx) escala con los núcleos en lugar de
+    turnarse el GIL. Conviene que el motor tenga al menos tantos hilos
+    como procesos.
+    """
+
+    def __init__(self, recognizer=None, language="es-ES", registry=None, backend="sphinx",
+                 processes=None, options=None):
+        super().__init__(recognizer, language, registry or ESP32_REGISTRY)
+        if backend not in BACKENDS or backend == "pool":
+            raise ValueError(f"Reconocedor no válido para el grupo de procesos: {backend!r}")
+        self.backend = backend
+        self.preferred_rate = BACKENDS[backend].preferred_rate
+        self.processes = processes or os.cpu_count() or 1
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.processes, initializer=_init_process_backend,
+            initargs=(backend, language, self.registry, options or {}))
+
+    def recognize_result(self, audio):
+        # Un AudioData derivado (multi_mic.DeviceAudio) se envía como AudioData simple
+        audio = sr.AudioData(audio.frame_data, audio.sample_rate, audio.sample_width)
+        return self._executor.submit(_recognize_in_process, audio).result()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def percentile(values, fraction):
+    """Percentil por el método del rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+@register_backend("hedged")
+class HedgedBackend(RecognizerBackend):
+    """Carrera entre reconocedores: gana el primer resultado confiable.
+
+    Cada frase se envía a la vez a todos los reconocedores de backends
+    (nombres o instancias), por ejemplo ["sphinx", "google"]. Gana el
+    primero cuya confianza sea >= threshold y cuyo texto corresponda a un
+    comando del registro, o el primero que da el mismo comando que otro
+    reconocedor que ya respondió (un resultado sin confianza conocida solo
+    gana así); con Sphinx por palabras clave, una detección de un único
+    comando vale sensitivity y gana sola si es >= threshold; las peticiones
+    perdedoras que aún no empezaron se cancelan y las que ya corren se
+    ignoran. Si ninguno gana se espera a
+    todos y se usa el resultado del último reconocedor de la lista (el más
+    preciso, normalmente el de la nube) o, si falló, el de mayor confianza.
+    """
+
+    def __init__(self, recognizer=None, language="es-ES", registry=None,
+                 backends=("sphinx", "google"), threshold=0.7, timeout=10.0, history=500):
+        super().__init__(recognizer, language, registry or ESP32_REGISTRY)
+        self.backends = [create_backend(b, recognizer=self.recognizer, language=language,
+                                        registry=self.registry) if isinstance(b, str) else b
+                         for b in backends]
+        self.threshold = threshold
+        self.timeout = timeout
+        # Varias frases pueden estar en carrera a la vez (hilos del motor)
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=4 * len(self.backends), thread_name_prefix="hedged")
+        self.stats = {b.name: {"calls": 0, "wins": 0, "errors": 0, "cancelled": 0,
+                               "latencies": collections.deque(maxlen=history)}
+                      for b in self.backends}
+        self.races = 0
+        self.fallbacks = 0
+        # Los contadores se actualizan desde los hilos del motor y del ejecutor
+        self._lock = threading.Lock()
+
+    def recognize_result(self, audio):
+        started = time.perf_counter()
+        futures = {}
+        for backend in self.backends:
+            self._count(backend.name, "calls")
+            futures[self._executor.submit(self._timed, backend, audio)] = backend
+        with self._lock:
+            self.races += 1
+
+        results, errors = {}, []
+        winner = None
+        try:
+            for future in concurrent.futures.as_completed(futures, timeout=self.timeout):
+                backend = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self._count(backend.name, "errors")
+                    errors.append(e)
+                    continue
+                if self._confident(result) or self._agrees(result, results):
+                    winner = result
+                    break
+                results[backend.name] = result
+        except concurrent.futures.TimeoutError:
+            errors.append(sr.RequestError("Ningún reconocedor respondió a tiempo"))
+
+        for future in futures:
+            if not future.done() and future.cancel():
+                self._count(futures[future].name, "cancelled")
+
+        if winner is None:
+            winner = self._fallback(results, errors)
+            with self._lock:
+                self.fallbacks += 1
+        self._count(winner.backend, "wins")
+        logger.debug("Reconocimiento en carrera: gana %s (%.0f ms) con %r",
+                     winner.backend, (time.perf_counter() - started) * 1000, winner.text)
+        return winner
+
+    def report(self):
+        """Tasa de victorias y latencias (p50/p95/p99) por reconocedor"""
+        with self._lock:
+            races = self.races
+            snapshot = {name: dict(stats, latencies=list(stats["latencies"]))
+                        for name, stats in self.stats.items()}
+        report = {}
+        for name, stats in snapshot.items():
+            latencies = stats["latencies"]
+            report[name] = {
+                "calls": stats["calls"], "wins": stats["wins"], "errors": stats["errors"],
+                "cancelled": stats["cancelled"],
+                "win_rate": stats["wins"] / races if races else 0.0,
+                "p50_ms": percentile(latencies, 0.50) * 1000,
+                "p95_ms": percentile(latencies, 0.95) * 1000,
+                "p99_ms": percentile(latencies, 0.99) * 1000,
+            }
+        return report
+
+    def log_stats(self):
+        for name, stats in self.report().items():
+            logger.info("%s: gana %.0f%% de %d, p50 %.0f ms, p95 %.0f ms, p99 %.0f ms, errores %d",
+                        name, stats["win_rate"] * 100, stats["calls"], stats["p50_ms"],
+                        stats["p95_ms"], stats["p99_ms"], stats["errors"])
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _count(self, name, key):
+        with self._lock:
+            self.stats[name][key] += 1
+
+    def _timed(self, backend, audio):
+        result = backend.recognize_result(audio)
+        with self._lock:
+            self.stats[backend.name]["latencies"].append(result.latency)
+        return result
+
+    def _confident(self, result):
+        if result.confidence is None or result.confidence < self.threshold:
+            return False
+        return self.registry.match(result.text) is not None
+
+    def _agrees(self, result, results):
+        """True si otro reconocedor ya dio el mismo comando"""
+        match = self.registry.match(result.text)
+        if match is None:
+            return False
+        for other in results.values():
+            other_match = self.registry.match(other.text)
+            if other_match is not None and other_match.command == match.command:
+                return True
+        return False
+
+    def _fallback(self, results, errors):
+        preferred = self.backends[-1].name
+        if preferred in results:
+            return results[preferred]
+        if results:
+            return max(results.values(), key=lambda r: r.confidence or 0.0)
+        for error in errors:
+            if not isinstance(error, sr.UnknownValueError):
+                raise error
+        raise sr.UnknownValueError()
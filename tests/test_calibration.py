@@ -0,0 +1,39 @@
+"""Seguimiento del ruido de fondo (calibration.NoiseFloorTracker)"""
+from calibration import NoiseFloorTracker
+
+
+def run(tracker, energies, speech, threshold):
+    """Pasa las tramas por el tracker aplicando los cambios de umbral como el VAD"""
+    for energy in energies:
+        new = tracker.update(energy, speech, threshold)
+        if new is not None:
+            threshold = new
+    return threshold
+
+
+def test_voz_continua_no_sube_el_umbral():
+    tracker = NoiseFloorTracker(200, window_frames=10, confirm_windows=3)
+    threshold = run(tracker, [2000] * 25, True, 300)
+    assert threshold == 300
+    assert tracker.noise_floor == 200
+    # Una pausa entre frases reinicia la cuenta de ventanas
+    threshold = run(tracker, [200] * 10, False, threshold)
+    threshold = run(tracker, [2000] * 25, True, threshold)
+    assert threshold == 300
+    assert tracker.recalibrations == 0
+
+
+def test_ruido_sostenido_sube_el_umbral():
+    tracker = NoiseFloorTracker(200, window_frames=10, confirm_windows=3)
+    threshold = run(tracker, [900 + n % 50 for n in range(30)], True, 300)
+    assert tracker.noise_floor == 900
+    assert threshold == 900 * 1.5
+    assert tracker.recalibrations == 1
+
+
+def test_dispersion_del_ruido_amplia_la_tolerancia():
+    # Mismo ruido (umbral 360 frente a 300 en uso): solo se recalibra si el ruido es estable
+    estable = NoiseFloorTracker(240, noise_std=0.0, alpha=0.5, drift=0.1)
+    assert estable.update(240, False, 300) == 360
+    variable = NoiseFloorTracker(240, noise_std=40.0, alpha=0.5, drift=0.1)
+    assert variable.update(240, False, 300) is None
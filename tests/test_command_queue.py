@@ -0,0 +1,125 @@
+"""Descarte y fusión de comandos en OutboundQueue (command_queue.py)"""
+import asyncio
+import concurrent.futures
+
+from command_queue import DeviceStateMirror, OutboundQueue, is_rejected
+from esp32_emulator import DeviceState
+
+
+class FakeBoard:
+    """Hace de ESP32Client.send: responde como el firmware en la siguiente vuelta del bucle"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.state = DeviceState()
+        self.sent = []
+
+    def send(self, command, callback=None, deadline=None, priority=False):
+        self.sent.append(command)
+        future = concurrent.futures.Future()
+        future.add_done_callback(callback)
+        self.loop.call_soon(future.set_result, self.state.apply(command))
+        return future
+
+
+def run(scenario):
+    async def main():
+        loop = asyncio.get_running_loop()
+        board = FakeBoard(loop)
+        queue = OutboundQueue(board.send, loop, min_interval=0.01)
+        replies = []
+
+        def submit(command):
+            done = loop.create_future()
+            queue.submit(command, lambda future, skipped: done.set_result((future.result(), skipped)))
+            replies.append(done)
+            return done
+
+        await scenario(submit)
+        await asyncio.gather(*replies)
+        return board, queue, [reply.result() for reply in replies]
+    return asyncio.run(main())
+
+
+def test_omite_lo_que_no_cambia_nada():
+    async def scenario(submit):
+        await submit("FREQ:0")
+        await submit("LED_ON")
+        await submit("LED_ON")
+        await submit("FREQ:0")
+
+    board, queue, replies = run(scenario)
+    assert board.sent == ["FREQ:0", "LED_ON"]
+    assert replies[2] == ("Sin cambios: LED encendido, frecuencia 0.00 Hz", True)
+    assert replies[3][1] is True
+    assert queue.stats["skipped"] == 2
+
+
+def test_led_desconocido_mientras_parpadea():
+    async def scenario(submit):
+        # Sin frecuencia confirmada o con el LED parpadeando, LED_ON repetido sí se envía
+        await submit("LED_ON")
+        await submit("LED_ON")
+        await submit("FREQ:1.5")
+        await submit("LED_ON")
+        await submit("FREQ:1.5")
+
+    board, queue, replies = run(scenario)
+    assert board.sent == ["LED_ON", "LED_ON", "FREQ:1.5", "LED_ON"]
+    assert replies[4] == ("Sin cambios: LED parpadeando, frecuencia 1.50 Hz", True)
+    assert queue.stats["skipped"] == 1
+
+
+def test_junta_los_ajustes_de_frecuencia_pendientes():
+    async def scenario(submit):
+        await submit("FREQ:2")
+        # Dentro de min_interval desde el envío anterior: esperan turno y se juntan
+        for command in ["FREQ_UP", "FREQ_UP", "FREQ_UP", "FREQ_DOWN"]:
+            submit(command)
+
+    board, queue, replies = run(scenario)
+    assert board.sent == ["FREQ:2", "FREQ:3.00"]
+    assert replies[1:] == [("OK: Frecuencia 3.00 Hz", False)] * 4
+    assert board.state.current_frequency == 3.0
+    assert queue.stats["coalesced"] == 3
+
+
+def test_ajustes_que_se_anulan_no_se_envian():
+    async def scenario(submit):
+        await submit("FREQ:2")
+        submit("LED_ON")
+        submit("FREQ_UP")
+        submit("FREQ_DOWN")
+
+    board, queue, replies = run(scenario)
+    assert board.sent == ["FREQ:2", "LED_ON"]
+    assert replies[2][1] is True and replies[3][1] is True
+
+
+def test_frecuencia_fuera_de_rango_llega_a_la_placa():
+    async def scenario(submit):
+        await submit("FREQ:2")
+        await submit("FREQ:12")
+        submit("FREQ_UP")
+        submit("FREQ:-1")
+        submit("FREQ_UP")
+
+    board, queue, replies = run(scenario)
+    # Ni se omite ni se junta: el error del firmware debe llegar al usuario
+    assert board.sent == ["FREQ:2", "FREQ:12", "FREQ_UP", "FREQ:-1", "FREQ_UP"]
+    assert replies[1] == ("ERROR: Frecuencia debe ser 0-10 Hz", False)
+    assert replies[3] == ("ERROR: Frecuencia debe ser 0-10 Hz", False)
+    assert board.state.current_frequency == 3.0
+
+
+def test_espejo_del_estado():
+    mirror = DeviceStateMirror()
+    assert not mirror.is_noop("LED_OFF")
+    mirror.confirm("STATUS", "ESTADO: LED=ON, FRECUENCIA=10.00 Hz")
+    mirror.settle()
+    assert mirror.is_noop("FREQ_UP")
+    assert mirror.is_noop("FREQ:10")
+    assert not mirror.is_noop("FREQ:11")
+    assert is_rejected("FREQ:11") and not is_rejected("FREQ:0")
+    mirror.invalidate()
+    assert not mirror.is_noop("FREQ_UP")
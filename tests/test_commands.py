@@ -0,0 +1,47 @@
+"""Búsqueda de comandos en el texto reconocido (commands.py)"""
+import pytest
+
+from commands import ESP32_REGISTRY, CommandRegistry, normalize
+
+
+def test_normaliza_mayusculas_tildes_y_articulos():
+    assert ESP32_REGISTRY.match("Encender el LED").command == "LED_ON"
+    assert ESP32_REGISTRY.match("apaga la led por favor").command == "LED_OFF"
+    assert ESP32_REGISTRY.match("frecuencia rapida").command == "FREQ_FAST"
+    assert normalize("Adiós") == normalize("adios")
+
+
+def test_sin_comando():
+    assert ESP32_REGISTRY.match("hola qué tal") is None
+    assert ESP32_REGISTRY.match("") is None
+
+
+@pytest.mark.parametrize("text, command", [
+    ("frecuencia a 3", "FREQ:3"),
+    ("frecuencia a 3,5", "FREQ:3.5"),
+    ("frecuencia a 7.25", "FREQ:7.25"),
+    ("frecuencia a tres", "FREQ:3"),
+    ("pon la frecuencia 2 hercios", "FREQ:2"),
+])
+def test_parametros_numericos(text, command):
+    match = ESP32_REGISTRY.match(text)
+    assert match.command == command
+    assert match.params == [float(command[5:])]
+
+
+def test_gana_la_primera_y_mas_larga():
+    registry = CommandRegistry([("led", "A"), ("encender led", "B"), ("encender", "C")])
+    assert registry.match("encender led").command == "B"
+    assert [m.command for m in registry.match_all("led y encender led")] == ["A", "B"]
+
+
+def test_frase_vacia():
+    with pytest.raises(ValueError):
+        CommandRegistry().add("el la", "X")
+
+
+def test_se_recompila_al_agregar():
+    registry = CommandRegistry([("hola", "SALUDO")])
+    assert registry.match("adiós") is None
+    registry.add("adiós", "DESPEDIDA")
+    assert registry.match("adiós").command == "DESPEDIDA"
@@ -0,0 +1,22 @@
+"""Carga del registro de placas (devices.DeviceRegistry)"""
+import json
+
+from devices import DeviceRegistry
+
+
+def test_entrada_mal_definida_no_impide_cargar_las_demas(tmp_path, caplog):
+    path = tmp_path / "dispositivos.json"
+    path.write_text(json.dumps({
+        "devices": {
+            "salon": {"host": "192.168.1.20", "id": "aa:bb:cc:dd:ee:01"},
+            "rota": {"port": 1234},
+            "texto": "192.168.1.30",
+            "cocina": {"host": "192.168.1.21", "port": 4321},
+        },
+        "groups": {"planta baja": ["salon", "cocina"], "malo": "salon"},
+    }), encoding="utf-8")
+    registry = DeviceRegistry(str(path))
+    assert registry.devices == {"salon": ("192.168.1.20", 1234), "cocina": ("192.168.1.21", 4321)}
+    assert registry.ids == {"salon": "aa:bb:cc:dd:ee:01"}
+    assert registry.groups == {"planta baja": ["salon", "cocina"]}
+    assert sum("mal definid" in record.getMessage() for record in caplog.records) == 3
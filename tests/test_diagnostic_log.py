@@ -0,0 +1,34 @@
+"""Agrupación de repetidos en DiagnosticHandler (diagnostic_log.py)"""
+import logging
+
+from diagnostic_log import DiagnosticHandler
+
+
+def record(message, created):
+    entry = logging.makeLogRecord({"msg": message, "levelno": logging.INFO, "levelname": "INFO"})
+    entry.created = created
+    return entry
+
+
+def test_rafaga_seguida_de_silencio_se_informa():
+    lines = []
+    handler = DiagnosticHandler(sink=lines.append, repeat_window=5.0)
+    for offset in range(4):
+        handler.handle(record("Escuchando...", 100.0 + offset))
+    assert len(lines) == 1
+    handler.flush_expired(now=104.0)
+    assert len(lines) == 1
+    handler.flush_expired(now=105.5)
+    assert lines[-1] == "    (repetido 3 veces más)"
+    handler.flush_expired(now=110.0)
+    assert len(lines) == 2
+
+
+def test_otro_mensaje_informa_las_repeticiones():
+    lines = []
+    handler = DiagnosticHandler(sink=lines.append)
+    handler.handle(record("A", 100.0))
+    handler.handle(record("A", 101.0))
+    handler.handle(record("B", 102.0))
+    assert lines[1] == "    (repetido 1 veces más)"
+    assert lines[2].endswith("B")
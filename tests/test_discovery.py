@@ -0,0 +1,49 @@
+"""Búsqueda y localización de placas (discovery.py)"""
+import asyncio
+import socket
+
+from devices import DeviceRegistry
+from discovery import BEACON_INTERVAL, AddressBook, DeviceLocator, discover_async
+from esp32_emulator import ESP32Emulator
+
+
+class FakePool:
+    def __init__(self, connected):
+        self._connected = connected
+
+    def connected(self):
+        return list(self._connected)
+
+    def connect(self, target=None):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def test_placa_conectada_no_se_prueba(tmp_path):
+    # Nadie escucha en el puerto: una prueba TCP fallaría, como con el firmware ocupado
+    port = free_port()
+    registry = DeviceRegistry(str(tmp_path / "dispositivos.json"))
+    registry.add("placa", "127.0.0.1", port, device_id="02:00:00:00:00:01")
+    locator = DeviceLocator(registry, FakePool(["placa"]), AddressBook(str(tmp_path / "libreta.json")),
+                            port=port, beacon_port=None)
+    assert locator.revalidate() == {}
+    assert locator.stats["scans"] == 0
+    assert locator.book.find("02:00:00:00:00:01").address == ("127.0.0.1", port)
+
+
+def test_la_busqueda_espera_un_anuncio(tmp_path):
+    beacon_port = free_port()
+    emulator = ESP32Emulator(port=0, device_id="02:00:00:00:00:02", beacon=("127.0.0.1", beacon_port),
+                             beacon_interval=BEACON_INTERVAL)
+    emulator.start_in_thread()
+    try:
+        # El primer anuncio sale antes de empezar a escuchar: hay que esperar al siguiente
+        boards = asyncio.run(discover_async([], beacon_port=beacon_port))
+    finally:
+        emulator.stop()
+    assert [board.device_id for board in boards] == ["02:00:00:00:00:02"]
@@ -0,0 +1,58 @@
+"""ESP32Client contra el emulador del firmware"""
+import time
+
+import pytest
+
+from esp32_client import CommandExpired, ESP32Client
+from esp32_emulator import ESP32Emulator
+
+
+@pytest.fixture
+def emulator(request):
+    options = getattr(request, "param", {})
+    emulator = ESP32Emulator(port=0, seed=1, **options)
+    emulator.start_in_thread()
+    yield emulator
+    emulator.stop()
+
+
+def results(client, commands):
+    return [client.send(command).result(timeout=5) for command in commands]
+
+
+@pytest.mark.parametrize("emulator, binary", [({}, True), ({"binary": False}, False)],
+                         indirect=["emulator"])
+def test_respuestas_del_firmware(emulator, binary):
+    client = ESP32Client(emulator.host, emulator.port, timeout=2)
+    try:
+        assert results(client, ["LED_ON", "FREQ:2.5", "FREQ_UP", "FREQ:12", "BAILAR"]) == [
+            "OK: LED encendido",
+            "OK: Frecuencia 2.50 Hz",
+            "OK: Frecuencia 3.00 Hz",
+            "ERROR: Frecuencia debe ser 0-10 Hz",
+            "ERROR: Comando desconocido",
+        ]
+        assert client.binary is binary
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("emulator", [{"drop_rate": 1.0}], indirect=True)
+def test_respuesta_perdida(emulator):
+    client = ESP32Client(emulator.host, emulator.port, timeout=0.3)
+    try:
+        with pytest.raises(TimeoutError):
+            client.send("LED_ON").result(timeout=5)
+    finally:
+        client.close()
+
+
+def test_comando_vencido_no_se_envia(emulator):
+    client = ESP32Client(emulator.host, emulator.port, timeout=2)
+    try:
+        with pytest.raises(CommandExpired):
+            client.send("LED_ON", deadline=time.time() - 1).result(timeout=5)
+        assert client.send("STATUS").result(timeout=5).startswith("ESTADO: LED=")
+        assert emulator.state.led_on is False
+    finally:
+        client.close()
@@ -0,0 +1,51 @@
+"""Codificación del protocolo binario (esp32_protocol.py)"""
+import pytest
+
+import esp32_protocol as protocol
+
+
+def test_peticiones_ida_y_vuelta():
+    frame = protocol.encode_requests([(1, "LED_ON"), (2, "FREQ:2.5"), (0x1FFFF, "STATUS"), (4, "BAILAR")])
+    length = protocol.decode_header(frame[:protocol.HEADER.size])
+    payload = frame[protocol.HEADER.size:]
+    assert length == len(payload) == 4 * protocol.REQUEST.size
+    assert protocol.decode_requests(payload) == [
+        (protocol.OP_LED_ON, 1, 0.0),
+        (protocol.OP_FREQ, 2, 2.5),
+        (protocol.OP_STATUS, 0xFFFF, 0.0),
+        (protocol.OP_UNKNOWN, 4, 0.0),
+    ]
+
+
+def test_respuestas_ida_y_vuelta():
+    records = [(protocol.STATUS_OK, 7, protocol.FLAG_LED, 1.5), (protocol.STATUS_RANGE, 8, 0, 1.5)]
+    frame = protocol.encode_responses(records)
+    assert protocol.decode_header(frame[:protocol.HEADER.size]) == len(frame) - protocol.HEADER.size
+    assert protocol.decode_responses(frame[protocol.HEADER.size:]) == records
+
+
+def test_tramas_invalidas():
+    with pytest.raises(ValueError):
+        protocol.decode_header(bytes([0x00, 0, 0]))
+    with pytest.raises(ValueError):
+        protocol.decode_requests(b"\x00" * (protocol.REQUEST.size + 1))
+    with pytest.raises(ValueError):
+        protocol.decode_requests(protocol.request_payload([(n, "STATUS")
+                                                           for n in range(protocol.MAX_BATCH + 1)]))
+    with pytest.raises(ValueError):
+        protocol.decode_responses(b"\x00" * 3)
+
+
+def test_parse_command_como_atof():
+    assert protocol.parse_command("FREQ:3.5") == (protocol.OP_FREQ, 3.5)
+    assert protocol.parse_command("FREQ:abc") == (protocol.OP_FREQ, 0.0)
+    assert protocol.parse_command("FREQ: 2x") == (protocol.OP_FREQ, 2.0)
+    assert protocol.parse_command(None) == (protocol.OP_UNKNOWN, 0.0)
+
+
+def test_texto_de_las_respuestas():
+    assert protocol.response_text(protocol.OP_FREQ, protocol.STATUS_OK, 0, 2.5) == "OK: Frecuencia 2.50 Hz"
+    assert protocol.response_text(protocol.OP_FREQ, protocol.STATUS_RANGE, 0, 1.0) == \
+        "ERROR: Frecuencia debe ser 0-10 Hz"
+    assert protocol.response_text(protocol.OP_STATUS, protocol.STATUS_OK, protocol.FLAG_LED, 1.0) == \
+        "ESTADO: LED=ON, FRECUENCIA=1.00 Hz"
@@ -0,0 +1,77 @@
+"""Canal UDP: datagramas, secuencias, UDPClient y UDPSession del emulador"""
+import pytest
+
+import esp32_protocol as protocol
+from esp32_emulator import DeviceState, ESP32Emulator, UDPSession
+from esp32_udp import UDPClient
+
+
+@pytest.fixture
+def emulator(request):
+    emulator = ESP32Emulator(port=0, seed=1, udp=True, **getattr(request, "param", {}))
+    emulator.start_in_thread()
+    yield emulator
+    emulator.stop()
+
+
+def results(client, commands):
+    return [client.send(command).result(timeout=5) for command in commands]
+
+
+def test_datagrama_ida_y_vuelta():
+    payload = protocol.request_payload([(9, "FREQ_UP")])
+    session, data = protocol.decode_datagram(protocol.encode_datagram(0x12345, payload))
+    assert session == 0x2345
+    assert protocol.decode_requests(data) == [(protocol.OP_FREQ_UP, 9, 0.0)]
+
+
+def test_datagramas_invalidos():
+    with pytest.raises(ValueError):
+        protocol.decode_datagram(b"\xa6")
+    with pytest.raises(ValueError):
+        protocol.decode_datagram(protocol.encode_datagram(1).replace(b"\xa6", b"\xa5", 1))
+
+
+def test_secuencias_modulo_16_bits():
+    assert protocol.seq_newer(6, 5)
+    assert not protocol.seq_newer(5, 6)
+    assert not protocol.seq_newer(5, 5)
+    assert protocol.seq_newer(0, 0xFFFF)
+
+
+def test_udp(emulator):
+    client = UDPClient(emulator.host, emulator.port, timeout=2)
+    try:
+        assert results(client, ["LED_ON", "FREQ_UP", "FREQ:12"]) == [
+            "OK: LED encendido", "OK: Frecuencia 1.50 Hz", "ERROR: Frecuencia debe ser 0-10 Hz"]
+    finally:
+        client.close()
+
+
+@pytest.mark.parametrize("emulator", [{"loss": 0.3}], indirect=True)
+def test_udp_con_perdidas_no_repite_comandos(emulator):
+    client = UDPClient(emulator.host, emulator.port, timeout=5)
+    try:
+        # De a uno: cada comando y su ack viajan en su propio datagrama
+        results(client, ["FREQ_UP"] * 10)
+        # Cada reenvío se confirma con la respuesta guardada, sin volver a subir
+        assert emulator.state.current_frequency == 6.0
+        assert client.stats["retransmits"] > 0
+    finally:
+        client.close()
+
+
+def test_sesion_udp_reordenada_y_reenviada():
+    session = UDPSession(1, DeviceState())
+    record, outcome = session.handle(protocol.OP_FREQ, 6, 4.0)
+    assert outcome == "applied"
+    # Un FREQ:X más viejo que llega tarde no pisa al más nuevo
+    assert session.handle(protocol.OP_FREQ, 5, 2.0)[1] == "superseded"
+    assert session.state.current_frequency == 4.0
+    # Los relativos sí se aplican aunque lleguen desordenados, pero una sola vez
+    assert session.handle(protocol.OP_FREQ_UP, 8, 0.0)[1] == "applied"
+    assert session.handle(protocol.OP_FREQ_UP, 7, 0.0)[1] == "applied"
+    assert session.handle(protocol.OP_FREQ_UP, 7, 0.0) == ((protocol.STATUS_OK, 7, 0, 5.0), "duplicate")
+    assert session.state.current_frequency == 5.0
+    # Un reenvío devuelve la misma respuesta que el original
+    assert session.handle(protocol.OP_FREQ, 6, 4.0) == (record, "duplicate")
@@ -0,0 +1,82 @@
+"""Escritura por lotes del historial (history_store.py)"""
+import sqlite3
+import time
+
+from history_store import HistoryStore
+
+
+def test_escritura_por_lotes(tmp_path):
+    path = str(tmp_path / "historial.db")
+    store = HistoryStore(path, batch_size=100)
+    try:
+        # Con la base bloqueada el escritor se detiene en la primera fila y el resto se acumula
+        blocker = sqlite3.connect(path)
+        blocker.execute("BEGIN EXCLUSIVE")
+        store.record("primera", timestamp=1.0)
+        time.sleep(0.2)
+        for n in range(1000):
+            store.record(f"frase {n}", command="LED_ON" if n % 2 else None, timestamp=2.0 + n)
+        blocker.commit()
+        blocker.close()
+        store.flush()
+        assert store.stats["written"] == 1001
+        assert store.stats["errors"] == 0
+        assert store.stats["batches"] <= 11
+        assert store.count() == 1001
+    finally:
+        store.close()
+
+
+def test_consultas(tmp_path):
+    store = HistoryStore(str(tmp_path / "historial.db"))
+    try:
+        store.record("encender el led", command="LED_ON", backend="replay", timestamp=10.0)
+        store.record("hola qué tal", timestamp=20.0)
+        store.record("frecuencia a 3", command="FREQ:3", response="OK: Frecuencia 3.00 Hz",
+                     timestamp=30.0)
+        store.flush()
+        assert [entry.transcript for entry in store.query()] == [
+            "frecuencia a 3", "hola qué tal", "encender el led"]
+        assert [entry.command for entry in store.query(start=15.0, newest_first=False)] == [None, "FREQ:3"]
+        assert store.count(text="LED") == 1
+        assert store.query(command="LED_ON")[0].backend == "replay"
+        assert store.command_counts() == {"LED_ON": 1, "FREQ:3": 1, None: 1}
+    finally:
+        store.close()
+
+
+def test_filtro_por_indice_de_texto(tmp_path):
+    store = HistoryStore(str(tmp_path / "historial.db"))
+    try:
+        assert store.full_text
+        store.record("Encender el LED", command="LED_ON", timestamp=10.0)
+        store.record("frecuencia a tres", command="FREQ:3", timestamp=20.0)
+        store.record("hola qué tal", timestamp=30.0)
+        store.flush()
+        assert store.count(text="enc") == 1
+        assert store.count(text="que") == 1
+        assert [entry.command for entry in store.query(text="FREQ:3")] == ["FREQ:3"]
+        assert store.count(text="led", start=15.0) == 0
+        # Prefijo de palabra, no subcadena
+        assert store.count(text="cender") == 0
+    finally:
+        store.close()
+
+
+def test_indexa_bases_anteriores(tmp_path):
+    path = str(tmp_path / "historial.db")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE history (id INTEGER PRIMARY KEY, timestamp REAL NOT NULL, "
+               "transcript TEXT, command TEXT, backend TEXT, recognition_ms REAL, "
+               "response_ms REAL, response TEXT)")
+    db.execute("INSERT INTO history (timestamp, transcript, command) VALUES (1.0, 'apagar led', 'LED_OFF')")
+    db.commit()
+    db.close()
+    store = HistoryStore(path)
+    try:
+        store.record("encender led", command="LED_ON", timestamp=2.0)
+        store.flush()
+        assert store.count(text="led") == 2
+        assert store.count(text="apag") == 1
+    finally:
+        store.close()
@@ -0,0 +1,33 @@
+"""Enumeración de micrófonos en segundo plano (microphones.py)"""
+import threading
+
+from microphones import MicrophoneCatalog
+
+
+def test_no_enumera_con_el_microfono_abierto(tmp_path):
+    calls = []
+    updated = threading.Event()
+
+    def enumerate_devices():
+        calls.append(len(calls))
+        return [f"micrófono {len(calls)}"]
+
+    catalog = MicrophoneCatalog(str(tmp_path / "microfonos.json"), enumerate_devices=enumerate_devices,
+                                on_update=lambda names, error: updated.set())
+    assert catalog.pause()
+    # El vigilante y el botón piden enumerar durante la captura: se deja para después
+    assert not catalog.refresh_async(quiet=True)
+    assert not catalog.refresh_async()
+    assert calls == []
+    catalog.resume()
+    assert updated.wait(2)
+    assert calls == [0]
+    assert catalog.names == ["micrófono 1"]
+
+
+def test_la_sesion_anterior_no_reanuda_la_nueva(tmp_path):
+    catalog = MicrophoneCatalog(str(tmp_path / "microfonos.json"), enumerate_devices=lambda: [])
+    catalog.pause()
+    catalog.pause()
+    catalog.resume()
+    assert not catalog.refresh_async()
@@ -0,0 +1,83 @@
+"""Carrera de reconocedores (recognizers.HedgedBackend)"""
+import time
+
+import speech_recognition as sr
+
+from recognizers import HedgedBackend, RecognizerBackend, SphinxBackend
+
+
+class FakeHypothesis:
+    def __init__(self, hypstr):
+        self.hypstr = hypstr
+        # La búsqueda de palabras clave no calcula la posterior
+        self.prob = 0
+
+
+class FakeDecoder:
+    def __init__(self, hypstr):
+        self.hypothesis = FakeHypothesis(hypstr)
+
+    def hyp(self):
+        return self.hypothesis
+
+
+class FakeSpotter(sr.Recognizer):
+    """recognize_sphinx instantáneo que detecta siempre las mismas palabras clave"""
+
+    def __init__(self, hypstr):
+        super().__init__()
+        self.hypstr = hypstr
+
+    def recognize_sphinx(self, audio_data, **options):
+        return FakeDecoder(self.hypstr)
+
+
+class SlowCloud(RecognizerBackend):
+    name = "nube"
+
+    def __init__(self, text, delay):
+        super().__init__()
+        self.text = text
+        self.delay = delay
+
+    def recognize_result(self, audio):
+        started = time.perf_counter()
+        time.sleep(self.delay)
+        return self._result(self.text, 0.95, started)
+
+
+AUDIO = sr.AudioData(b"\x00\x00" * 1600, 16000, 2)
+
+
+def test_el_detector_local_gana_a_la_nube_lenta():
+    spotter = SphinxBackend(recognizer=FakeSpotter("encender led"))
+    hedged = HedgedBackend(backends=[spotter, SlowCloud("encender el led", delay=1.0)])
+    try:
+        started = time.perf_counter()
+        result = hedged.recognize_result(AUDIO)
+        assert time.perf_counter() - started < 0.5
+        assert result.backend == "sphinx"
+        assert result.confidence == spotter.sensitivity
+        assert hedged.report()["sphinx"]["wins"] == 1
+    finally:
+        hedged.close()
+
+
+def test_deteccion_ambigua_espera_a_la_nube():
+    spotter = SphinxBackend(recognizer=FakeSpotter("encender led apagar led"))
+    hedged = HedgedBackend(backends=[spotter, SlowCloud("apagar el led", delay=0.2)])
+    try:
+        result = hedged.recognize_result(AUDIO)
+        assert result.backend == "nube"
+        assert result.text == "apagar el led"
+    finally:
+        hedged.close()
+
+
+def test_sensibilidad_bajo_el_umbral_no_gana_sola():
+    spotter = SphinxBackend(recognizer=FakeSpotter("encender led"), sensitivity=0.5)
+    hedged = HedgedBackend(backends=[spotter, SlowCloud("hola", delay=0.2)])
+    try:
+        assert hedged.recognize_result(AUDIO).backend == "nube"
+    finally:
+        hedged.close()
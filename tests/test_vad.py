@@ -0,0 +1,73 @@
+"""Segmentación con StreamingVAD (vad.py)"""
+import numpy as np
+
+from vad import SILENCE, StreamingVAD
+
+# 10 muestras por trama; arranque 3 tramas, cola 5, preroll 2, frase máxima 20 (búfer de 22)
+OPTIONS = dict(sample_rate=1000, frame_ms=10, energy_threshold=300, onset_ms=30,
+               hangover_ms=50, preroll_ms=20, max_utterance_s=0.2)
+FRAME = 10
+
+
+def stream(speech, before, after=10):
+    """Tramas constantes con su número: silencio bajo el umbral y voz por encima"""
+    frames = [index % 100 for index in range(before)]
+    frames += [1000 + before + n for n in range(speech)]
+    frames += [(before + speech + n) % 100 for n in range(after)]
+    return np.repeat(np.array(frames, dtype=np.int16), FRAME)
+
+
+def feed(vad, samples, chunk=7):
+    pcm = samples.tobytes()
+    found = []
+    for offset in range(0, len(pcm), chunk * 2):
+        found.extend(vad.feed(pcm[offset:offset + chunk * 2]))
+    return found
+
+
+def frames_of(pcm):
+    samples = np.frombuffer(pcm, dtype="<i2")
+    assert len(samples) % FRAME == 0
+    return samples[::FRAME].tolist()
+
+
+def test_frase_con_preroll_y_cola():
+    samples = stream(speech=6, before=10)
+    found = feed(StreamingVAD(**OPTIONS), samples)
+    assert len(found) == 1
+    # Dos tramas de preroll, la voz y las cinco de silencio que la cerraron
+    assert frames_of(found[0]) == samples[FRAME * 8:FRAME * 21:FRAME].tolist()
+
+
+def test_preroll_al_principio_del_flujo():
+    samples = stream(speech=6, before=1)
+    found = feed(StreamingVAD(**OPTIONS), samples)
+    assert frames_of(found[0])[0] == 0
+
+
+def test_frase_que_da_la_vuelta_al_bufer():
+    vad = StreamingVAD(**OPTIONS)
+    # La frase ocupa las tramas 38-52: las ranuras 16-21 y luego 0-8 del búfer
+    samples = stream(speech=8, before=40)
+    found = feed(vad, samples)
+    assert len(found) == 1
+    assert frames_of(found[0]) == samples[FRAME * 38:FRAME * 53:FRAME].tolist()
+    assert vad.last_speech_end == 48
+    assert vad.state == SILENCE
+
+
+def test_frase_demasiado_larga_se_corta():
+    vad = StreamingVAD(**OPTIONS)
+    samples = stream(speech=40, before=5)
+    found = feed(vad, samples)
+    # Se corta al llenar el búfer sin pisar su inicio
+    assert len(found[0]) == vad.capacity * FRAME * 2
+    assert frames_of(found[0])[0] == samples[FRAME * 3]
+
+
+def test_flush_entrega_la_frase_en_curso():
+    vad = StreamingVAD(**OPTIONS)
+    assert feed(vad, stream(speech=6, before=10, after=0)) == []
+    pcm = vad.flush()
+    assert frames_of(pcm)[-1] == 1015
+    assert vad.flush() is None
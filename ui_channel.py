@@ -0,0 +1,101 @@
+"""Canal de estado entre los hilos de trabajo y el hilo de Tkinter.
+
+En lugar de encolar un root.after(0, lambda: ...) por cada cambio, los
+hilos publican el último valor de cada estado (color del indicador, texto
+de resultado, ...) o agregan filas (historial, diagnóstico) a un canal
+protegido por un candado. El hilo de Tk lo vacía una vez por cuadro, a
+frecuencia fija, y aplica solo los valores finales.
+"""
+import threading
+
+
+class UIStateChannel:
+    """Estado compartido que el hilo de Tk aplica a frecuencia fija.
+
+    publish(key, value): estado de último valor; si se publica varias
+    veces entre dos cuadros solo se aplica el último.
+    append(key, item): filas acumuladas; se aplican todas juntas, en orden.
+    every_frame(callback): callback() se ejecuta en el hilo de Tk al
+    principio de cada cuadro, antes de aplicar lo pendiente.
+    """
+
+    def __init__(self, root, fps=30):
+        self.root = root
+        self.interval = max(1, int(1000 / fps))
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._rows = {}
+        self._state_handlers = {}
+        self._row_handlers = {}
+        self._order = []
+        self._tickers = []
+        self._after_id = None
+        self.frames = 0
+        self.applied = 0
+        self.coalesced = 0
+
+    def bind(self, key, apply):
+        """apply(value) se ejecuta en el hilo de Tk con el último valor"""
+        self._state_handlers[key] = apply
+        self._remember(key)
+
+    def bind_rows(self, key, apply):
+        """apply(items) se ejecuta en el hilo de Tk con las filas nuevas"""
+        self._row_handlers[key] = apply
+        self._remember(key)
+
+    def every_frame(self, callback):
+        """callback() se ejecuta en cada vaciado del canal (hilo de Tk)"""
+        self._tickers.append(callback)
+
+    def publish(self, key, value=None):
+        """Publica el último valor de un estado (seguro desde cualquier hilo)"""
+        with self._lock:
+            if key in self._latest:
+                self.coalesced += 1
+            self._latest[key] = value
+
+    def append(self, key, item):
+        """Agrega una fila (seguro desde cualquier hilo)"""
+        with self._lock:
+            self._rows.setdefault(key, []).append(item)
+
+    def start(self):
+        """Empieza a vaciar el canal desde el hilo de Tk"""
+        if self._after_id is None:
+            self._after_id = self.root.after(self.interval, self._drain)
+
+    def stop(self):
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+            self._after_id = None
+
+    def flush(self):
+        """Aplica de inmediato lo pendiente (solo desde el hilo de Tk)"""
+        with self._lock:
+            latest, self._latest = self._latest, {}
+            rows, self._rows = self._rows, {}
+        if not latest and not rows:
+            return
+        self.frames += 1
+        # Se respeta el orden de registro de las claves para que, por
+        # ejemplo, el historial se actualice antes que el indicador
+        for key in self._order:
+            if key in rows and key in self._row_handlers:
+                self._row_handlers[key](rows[key])
+                self.applied += 1
+            if key in latest and key in self._state_handlers:
+                self._state_handlers[key](latest[key])
+                self.applied += 1
+
+    def _remember(self, key):
+        if key not in self._order:
+            self._order.append(key)
+
+    def _drain(self):
+        try:
+            for callback in self._tickers:
+                callback()
+            self.flush()
+        finally:
+            self._after_id = self.root.after(self.interval, self._drain)
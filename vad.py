@@ -0,0 +1,261 @@
+"""Detección de actividad de voz (VAD) por tramas sobre un búfer circular.
+
+Reemplaza a recognizer.listen(timeout=3, phrase_time_limit=5): el audio se
+escribe directamente en un búfer NumPy preasignado, la energía (y
+opcionalmente la tasa de cruces por cero) se calcula por trama con
+operaciones vectorizadas sobre búferes de trabajo reutilizados, y cada
+frase se entrega en cuanto se detecta el final de la voz.
+"""
+import time
+
+import speech_recognition as sr
+import numpy as np
+
+from calibration import DYNAMIC_ENERGY_RATIO, NoiseFloorTracker
+from metrics import METRICS
+
+SILENCE = 0
+SPEECH = 1
+
+_NO_UTTERANCES = ()
+
+
+class StreamingVAD:
+    """Detector de voz por tramas con búfer circular preasignado.
+
+    feed(chunk) recibe PCM de 16 bits (mono) de cualquier tamaño y devuelve
+    las frases terminadas en ese bloque como bytes. La memoria usada es
+    fija: preroll + duración máxima de frase. Con noise_tracker
+    (calibration.NoiseFloorTracker) el umbral de energía se ajusta cuando
+    el ruido de fondo se desvía.
+    """
+
+    def __init__(self, sample_rate=16000, frame_ms=20, energy_threshold=300,
+                 zcr_threshold=None, onset_ms=60, hangover_ms=300, preroll_ms=200,
+                 max_utterance_s=10, noise_tracker=None):
+        self.sample_rate = sample_rate
+        self.frame_samples = max(1, int(sample_rate * frame_ms / 1000))
+        self.energy_threshold = energy_threshold
+        self.zcr_threshold = zcr_threshold
+        self.noise_tracker = noise_tracker
+        self.onset_frames = max(1, round(onset_ms / frame_ms))
+        self.hangover_frames = max(1, round(hangover_ms / frame_ms))
+        self.preroll_frames = round(preroll_ms / frame_ms)
+        self.max_frames = max(self.onset_frames + 1, round(max_utterance_s * 1000 / frame_ms))
+
+        # Búfer circular y búferes de trabajo, reservados una sola vez
+        self.capacity = self.preroll_frames + self.max_frames
+        self._ring = np.zeros((self.capacity, self.frame_samples), dtype=np.int16)
+        self._squares = np.empty(self.frame_samples, dtype=np.float32)
+        self._signs = np.empty(self.frame_samples, dtype=bool)
+        self._crossings = np.empty(self.frame_samples - 1, dtype=bool)
+
+        self.reset()
+
+    def reset(self):
+        """Vuelve al estado de silencio descartando el audio acumulado"""
+        self.state = SILENCE
+        self._frame_index = 0      # tramas completas escritas desde el inicio
+        self._fill = 0             # muestras escritas en la trama actual
+        self._speech_run = 0
+        self._silence_run = 0
+        self._start_index = 0
+        self.last_speech_end = 0   # trama en que terminó la voz de la última frase
+        self.last_energy = 0.0
+        self.last_zcr = 0.0
+        self.frames_processed = 0
+        self.utterances = 0
+        self.recalibrations = 0
+
+    @property
+    def frame_bytes(self):
+        return self.frame_samples * 2
+
+    def feed(self, chunk):
+        """Agrega PCM y devuelve la lista de frases terminadas (bytes)"""
+        samples = np.frombuffer(chunk, dtype="<i2")
+        finished = _NO_UTTERANCES
+        offset = 0
+        total = len(samples)
+        while offset < total:
+            slot = self._ring[self._frame_index % self.capacity]
+            count = min(self.frame_samples - self._fill, total - offset)
+            slot[self._fill:self._fill + count] = samples[offset:offset + count]
+            self._fill += count
+            offset += count
+            if self._fill == self.frame_samples:
+                self._fill = 0
+                utterance = self._process_frame(slot)
+                if utterance is not None:
+                    if finished is _NO_UTTERANCES:
+                        finished = []
+                    finished.append(utterance)
+        return finished
+
+    def flush(self):
+        """Entrega la frase en curso al terminar el flujo de audio"""
+        pcm = None
+        if self.state == SPEECH:
+            pcm = self._finish(self._frame_index)
+        self._fill = 0
+        return pcm
+
+    def is_speech(self, frame):
+        """Clasifica una trama por energía RMS y, si se configuró, por ZCR"""
+        np.multiply(frame, frame, out=self._squares, dtype=np.float32)
+        self.last_energy = float(np.sqrt(self._squares.mean()))
+        if self.last_energy < self.energy_threshold:
+            return False
+        if self.zcr_threshold is not None:
+            np.signbit(frame, out=self._signs)
+            np.not_equal(self._signs[1:], self._signs[:-1], out=self._crossings)
+            self.last_zcr = np.count_nonzero(self._crossings) / len(self._crossings)
+            # Ruido de banda ancha (soplidos, siseos) cruza cero mucho más que la voz
+            if self.last_zcr > self.zcr_threshold:
+                return False
+        return True
+
+    def _process_frame(self, frame):
+        speech = self.is_speech(frame)
+        self._frame_index += 1
+        self.frames_processed += 1
+        if self.noise_tracker is not None:
+            threshold = self.noise_tracker.update(self.last_energy, speech or self.state == SPEECH,
+                                                  self.energy_threshold)
+            if threshold is not None:
+                self.energy_threshold = threshold
+                self.recalibrations += 1
+
+        if self.state == SILENCE:
+            self._speech_run = self._speech_run + 1 if speech else 0
+            if self._speech_run >= self.onset_frames:
+                self.state = SPEECH
+                self._silence_run = 0
+                start = self._frame_index - self._speech_run - self.preroll_frames
+                self._start_index = max(0, start)
+            return None
+
+        self._silence_run = 0 if speech else self._silence_run + 1
+        if self._silence_run >= self.hangover_frames:
+            return self._finish(self._frame_index)
+        if self._frame_index - self._start_index >= self.capacity:
+            # Frase demasiado larga: se corta antes de sobrescribir su inicio
+            return self._finish(self._frame_index)
+        return None
+
+    def _finish(self, end_index):
+        start_slot = self._start_index % self.capacity
+        end_slot = end_index % self.capacity
+        if end_index - self._start_index >= self.capacity or end_slot <= start_slot:
+            # La frase da la vuelta al búfer circular
+            pcm = self._ring[start_slot:].tobytes() + self._ring[:end_slot].tobytes()
+        else:
+            pcm = self._ring[start_slot:end_slot].tobytes()
+        # La frase incluye la cola de silencio (hangover) que confirmó el final
+        self.last_speech_end = end_index - self._silence_run
+        self.state = SILENCE
+        self._speech_run = 0
+        self._silence_run = 0
+        self.utterances += 1
+        return pcm
+
+
+class VADMicrophoneSource:
+    """Fuente de micrófono segmentada con StreamingVAD en lugar de listen().
+
+    Con calibration (calibration.CalibrationStore) y device_name, si ya hay
+    una calibración guardada para ese micrófono se empieza a escuchar de
+    inmediato con ella, sin adjust_for_ambient_noise. Con adapt=True el
+    umbral se sigue ajustando con las tramas sin voz y al terminar se guarda.
+    Registra en metrics las etapas mic_open, calibration y segmentation
+    (tiempo de CPU del VAD por frase).
+    """
+
+    live = True
+
+    def __init__(self, device_index=None, calibration_duration=1, frame_ms=20,
+                 onset_ms=60, hangover_ms=300, max_utterance_s=10, zcr_threshold=None,
+                 calibration=None, device_name=None, adapt=True, metrics=None):
+        self.device_index = device_index
+        self.calibration_duration = calibration_duration
+        self.calibration = calibration
+        self.device_name = device_name or (f"#{device_index}" if device_index is not None else "default")
+        self.adapt = adapt
+        self.metrics = metrics or METRICS
+        self.vad_options = dict(frame_ms=frame_ms, onset_ms=onset_ms, hangover_ms=hangover_ms,
+                                max_utterance_s=max_utterance_s, zcr_threshold=zcr_threshold)
+        self.vad = None
+        self.tracker = None
+        self.calibrated_from_cache = False
+
+    def utterances(self, recognizer, stop_event):
+        """Genera frases (sr.AudioData) mientras no se pida detener"""
+        metrics = self.metrics
+        started = time.perf_counter()
+        with sr.Microphone(device_index=self.device_index) as source:
+            metrics.observe("mic_open", time.perf_counter() - started)
+            cached = self.calibration.get(self.device_name) if self.calibration is not None else None
+            self.calibrated_from_cache = cached is not None
+            if cached is not None:
+                metrics.inc("calibration_cache_hits")
+                recognizer.energy_threshold = cached["energy_threshold"]
+                self.tracker = NoiseFloorTracker.from_calibration(cached)
+            else:
+                if self.calibration_duration:
+                    with metrics.span("calibration"):
+                        recognizer.adjust_for_ambient_noise(source, duration=self.calibration_duration)
+                self.tracker = NoiseFloorTracker(recognizer.energy_threshold / DYNAMIC_ENERGY_RATIO)
+
+            self.vad = StreamingVAD(sample_rate=source.SAMPLE_RATE,
+                                    energy_threshold=recognizer.energy_threshold,
+                                    noise_tracker=self.tracker if self.adapt else None,
+                                    **self.vad_options)
+            segmenting = 0.0
+            try:
+                while not stop_event.is_set():
+                    chunk = source.stream.read(source.CHUNK)
+                    started = time.perf_counter()
+                    finished = self.vad.feed(chunk)
+                    segmenting += time.perf_counter() - started
+                    for pcm in finished:
+                        metrics.observe("segmentation", segmenting)
+                        segmenting = 0.0
+                        yield sr.AudioData(pcm, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+            finally:
+                recognizer.energy_threshold = self.vad.energy_threshold
+                if self.calibration is not None:
+                    self.calibration.put(self.device_name, self.tracker.calibration(self.vad.energy_threshold))
+                    self.calibration.save()
+
+
+class VADStreamSource:
+    """Fuente PCM continua (archivo o bloques en memoria) segmentada con StreamingVAD"""
+
+    live = False
+
+    def __init__(self, stream, sample_rate=16000, chunk_size=4096, energy_threshold=300, **vad_options):
+        self.stream = stream
+        self.sample_rate = sample_rate
+        self.chunk_size = chunk_size
+        self.vad = StreamingVAD(sample_rate=sample_rate, energy_threshold=energy_threshold,
+                                **vad_options)
+
+    def _chunks(self):
+        if hasattr(self.stream, "read"):
+            while True:
+                chunk = self.stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        else:
+            yield from self.stream
+
+    def utterances(self, recognizer, stop_event):
+        for chunk in self._chunks():
+            if stop_event.is_set():
+                return
+            for pcm in self.vad.feed(chunk):
+                yield sr.AudioData(pcm, self.sample_rate, 2)
+        pcm = self.vad.flush()
+        if pcm:
+            yield sr.AudioData(pcm, self.sample_rate, 2)
@@ -0,0 +1,523 @@
+"""Motor de reconocimiento de voz sin interfaz gráfica.
+
+Separa la captura de audio, el reconocimiento y la búsqueda de comandos de
+las ventanas Tkinter. Las aplicaciones (prueba1.py, prueba2.py, prueba3.py)
+solo se suscriben a los eventos del motor, y el mismo motor se puede usar
+sin pantalla alimentándolo con archivos WAV o PCM en memoria.
+"""
+import speech_recognition as sr
+import argparse
+import os
+import queue
+import threading
+import time
+
+from commands import is_safety_command
+from metrics import METRICS
+from recognizers import GoogleBackend, backend_from_config, BACKENDS, DEFAULT_BACKEND
+
+# Tipos de evento emitidos por el motor
+EVENT_LISTENING = "listening"
+EVENT_PROCESSING = "processing"
+EVENT_TEXT = "text"
+EVENT_COMMAND = "command"
+EVENT_NO_COMMAND = "no_command"
+EVENT_NOT_UNDERSTOOD = "not_understood"
+EVENT_ERROR = "error"
+EVENT_DROPPED = "dropped"
+EVENT_DUPLICATE = "duplicate"
+EVENT_EXPIRED = "expired"
+EVENT_STOPPED = "stopped"
+
+# Nombre en metrics.py de cada contador de stats()
+METRIC_COUNTERS = {"captured": "utterances", "dropped": "utterances_dropped",
+                   "not_understood": "unrecognized", "errors": "recognition_errors",
+                   "duplicates": "utterances_duplicate", "expired": "commands_expired",
+                   "priority": "commands_priority"}
+
+
+class VoiceEvent:
+    """Evento emitido por el motor hacia los suscriptores"""
+
+    def __init__(self, kind, text=None, command=None, error=None, utterance_id=None, match=None,
+                 latency=None, device=None, captured_at=None, deadline=None, priority=False):
+        self.kind = kind
+        self.text = text
+        self.command = command
+        self.match = match
+        self.error = error
+        self.utterance_id = utterance_id
+        # Segundos que tardó el reconocimiento (eventos text/command/no_command)
+        self.latency = latency
+        # Micrófono de origen (solo con multi_mic.MultiMicrophoneSource)
+        self.device = device
+        # Hora de captura de la frase y hora límite para ejecutar el comando
+        # (time.time(); deadline None = no caduca)
+        self.captured_at = captured_at
+        self.deadline = deadline
+        # Comando de seguridad (pasa delante de los demás)
+        self.priority = priority
+        self.timestamp = time.time()
+
+    def __repr__(self):
+        return (f"VoiceEvent({self.kind!r}, text={self.text!r}, "
+                f"command={self.command!r}, error={self.error!r})")
+
+
+class MicrophoneSource:
+    """Fuente de audio en vivo desde un sr.Microphone"""
+
+    live = True
+
+    def __init__(self, device_index=None, calibration_duration=1,
+                 timeout=3, phrase_time_limit=5, metrics=None):
+        self.device_index = device_index
+        self.calibration_duration = calibration_duration
+        self.timeout = timeout
+        self.phrase_time_limit = phrase_time_limit
+        self.metrics = metrics or METRICS
+
+    def utterances(self, recognizer, stop_event):
+        """Genera frases (sr.AudioData) mientras no se pida detener"""
+        started = time.perf_counter()
+        with sr.Microphone(device_index=self.device_index) as source:
+            self.metrics.observe("mic_open", time.perf_counter() - started)
+            if self.calibration_duration:
+                with self.metrics.span("calibration"):
+                    recognizer.adjust_for_ambient_noise(source, duration=self.calibration_duration)
+
+            while not stop_event.is_set():
+                try:
+                    yield recognizer.listen(source, timeout=self.timeout,
+                                            phrase_time_limit=self.phrase_time_limit)
+                except sr.WaitTimeoutError:
+                    # Timeout es normal, continuar escuchando
+                    continue
+
+
+class WavFileSource:
+    """Fuente de audio a partir de archivos WAV/AIFF/FLAC (una frase por archivo)"""
+
+    live = False
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+
+    def utterances(self, recognizer, stop_event):
+        for path in self.paths:
+            if stop_event.is_set():
+                break
+            with sr.AudioFile(path) as source:
+                yield recognizer.record(source)
+
+
+class PCMStreamSource:
+    """Fuente de audio PCM en memoria (una frase por bloque de bytes)"""
+
+    live = False
+
+    def __init__(self, segments, sample_rate=16000, sample_width=2):
+        self.segments = segments
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+
+    def utterances(self, recognizer, stop_event):
+        for segment in self.segments:
+            if stop_event.is_set():
+                break
+            yield sr.AudioData(bytes(segment), self.sample_rate, self.sample_width)
+
+
+class VoiceEngine:
+    """Motor de captura y reconocimiento desacoplado de la interfaz.
+
+    Un hilo de captura segmenta frases continuamente y las deposita en una
+    cola acotada; un grupo de hilos de reconocimiento la vacía y los
+    resultados se entregan en el mismo orden en que se capturaron, así el
+    micrófono nunca queda sordo mientras se transcribe una frase.
+
+    Los suscriptores reciben un VoiceEvent desde los hilos del motor; las
+    interfaces Tkinter deben reenviarlo al hilo principal con root.after.
+    Si se pasa event_queue, cada evento también se deposita en esa cola.
+    Las etapas capture, queue, preprocess, recognition y match y los
+    contadores se registran en metrics (por defecto metrics.METRICS).
+    Con dedup (multi_mic.CrossMicDeduplicator) una frase que otro
+    micrófono ya entregó se emite como EVENT_DUPLICATE y no como comando.
+
+    Cada comando lleva la hora de captura de su frase y, con
+    command_deadline, una hora límite: si al entregarse ya pasó (la cola o
+    el reconocimiento tardaron demasiado) se emite EVENT_EXPIRED en lugar
+    de EVENT_COMMAND. Los comandos para los que priority(comando) es True
+    (por defecto commands.is_safety_command: apagar, detener, terminar) no
+    caducan y se entregan en cuanto se reconocen, sin esperar a las frases
+    anteriores que aún se están reconociendo.
+    """
+
+    def __init__(self, recognizer=None, language="es-ES", command_matcher=None,
+                 recognize=None, event_queue=None, workers=2, queue_size=8, cache=None,
+                 preprocess=None, metrics=None, dedup=None, command_deadline=None,
+                 priority=is_safety_command):
+        self.recognizer = recognizer or sr.Recognizer()
+        self.language = language
+        self.command_matcher = command_matcher
+        self.cache = cache
+        if recognize is None:
+            recognize = GoogleBackend(self.recognizer, language)
+        self.backend = recognize
+        if cache is not None:
+            # Caché (recognition_cache.RecognitionCache) delante del reconocedor
+            backend = getattr(recognize, "name", None) or getattr(recognize, "__name__", "custom")
+            recognize = cache.wrap(recognize, backend=backend, language=language)
+        self.recognize = recognize
+        # Etapa opcional audio -> audio antes de reconocer (audio_preprocess.AudioPreprocessor)
+        self.preprocess = preprocess
+        self.event_queue = event_queue
+        self.workers = max(1, workers)
+        self.queue_size = queue_size
+        self.metrics = metrics or METRICS
+        self.dedup = dedup
+        self.command_deadline = command_deadline
+        self.priority = priority
+
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._audio_queue = None
+
+        # Reordenamiento de resultados por número de frase
+        self._id_lock = threading.Lock()
+        self._order_lock = threading.Lock()
+        self._pending = {}
+        self._next_id = 0
+        self._next_to_emit = 0
+
+        self._stats_lock = threading.Lock()
+        self._stats = {"captured": 0, "dropped": 0, "processed": 0,
+                       "not_understood": 0, "errors": 0, "duplicates": 0, "expired": 0, "priority": 0,
+                       "max_queue_depth": 0}
+
+    @property
+    def utterance_count(self):
+        return self._next_id
+
+    @property
+    def queue_depth(self):
+        """Frases capturadas que esperan un hilo de reconocimiento"""
+        return self._audio_queue.qsize() if self._audio_queue is not None else 0
+
+    @property
+    def listening(self):
+        return self._thread is not None and self._thread.is_alive() and not self._stop_event.is_set()
+
+    def stats(self):
+        """Contadores del pipeline (capturadas, descartadas, procesadas, ...)"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self.queue_depth
+        stats["workers"] = self.workers
+        return stats
+
+    def subscribe(self, kind, callback):
+        """Registra callback(event) para un tipo de evento ("*" para todos)"""
+        with self._lock:
+            self._subscribers.setdefault(kind, []).append(callback)
+
+    def unsubscribe(self, kind, callback):
+        with self._lock:
+            callbacks = self._subscribers.get(kind, [])
+            if callback in callbacks:
+                callbacks.remove(callback)
+
+    def emit(self, event):
+        """Entrega un evento a los suscriptores y a la cola de eventos"""
+        with self._lock:
+            callbacks = self._subscribers.get(event.kind, []) + self._subscribers.get("*", [])
+        for callback in callbacks:
+            callback(event)
+        if self.event_queue is not None:
+            self.event_queue.put(event)
+
+    def start(self, source):
+        """Inicia el motor en un hilo en segundo plano"""
+        if self.listening:
+            return
+        # Evento nuevo por sesión: un hilo anterior que aún no termina sigue detenido
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self.run, args=(source,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Pide al motor que se detenga; las frases en cola se descartan"""
+        self._stop_event.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run(self, source):
+        """Captura frases en el hilo actual y las reconoce en el grupo de hilos.
+
+        Con una fuente en vivo, si la cola está llena la frase nueva se
+        descarta (y se cuenta) para no bloquear la captura; con archivos o
+        PCM en memoria la captura espera a que haya espacio.
+        """
+        stop_event = self._stop_event
+        audio_queue = self._audio_queue = queue.Queue(maxsize=self.queue_size)
+        live = getattr(source, "live", True)
+        workers = [threading.Thread(target=self._worker, args=(audio_queue, stop_event),
+                                    name=f"reconocimiento-{n}", daemon=True)
+                   for n in range(self.workers)]
+        for worker in workers:
+            worker.start()
+
+        utterances = None
+        try:
+            utterances = iter(source.utterances(self.recognizer, stop_event))
+            while not stop_event.is_set():
+                self.emit(VoiceEvent(EVENT_LISTENING))
+                started = time.perf_counter()
+                try:
+                    audio = next(utterances)
+                except StopIteration:
+                    break
+                self.metrics.observe("capture", time.perf_counter() - started)
+                self._enqueue(audio_queue, audio, live, stop_event)
+        except Exception as e:
+            self.emit(VoiceEvent(EVENT_ERROR, error=e))
+        finally:
+            # La fuente se cierra ya (y con ella el micrófono), no cuando la recoja el GC
+            close = getattr(utterances, "close", None)
+            if close is not None:
+                close()
+            # Al terminar la fuente se vacía la cola antes de detener el motor
+            for _ in workers:
+                audio_queue.put(None)
+            for worker in workers:
+                worker.join()
+            stop_event.set()
+            self.emit(VoiceEvent(EVENT_STOPPED))
+
+    def process_audio(self, audio):
+        """Reconoce una frase en el hilo actual y emite sus eventos"""
+        utterance_id = self._new_id()
+        return self._process(utterance_id, audio, getattr(audio, "captured_at", None) or time.time())
+
+    def dispatch_text(self, text, utterance_id=None):
+        """Busca un comando en el texto y emite el evento correspondiente"""
+        events = self._command_events(text, utterance_id)
+        for event in events:
+            self.emit(event)
+        return events[0].command if events else None
+
+    def _new_id(self):
+        with self._id_lock:
+            utterance_id = self._next_id
+            self._next_id += 1
+        return utterance_id
+
+    def _enqueue(self, audio_queue, audio, live, stop_event):
+        # Los plazos de los comandos cuentan desde aquí (o desde la hora del micrófono)
+        captured_at = getattr(audio, "captured_at", None) or time.time()
+        if live:
+            if audio_queue.full():
+                self._count("dropped")
+                self.emit(VoiceEvent(EVENT_DROPPED))
+                return
+            audio_queue.put_nowait((self._new_id(), audio, time.perf_counter(), captured_at))
+        else:
+            utterance_id = self._new_id()
+            while not stop_event.is_set():
+                try:
+                    audio_queue.put((utterance_id, audio, time.perf_counter(), captured_at), timeout=0.1)
+                    break
+                except queue.Full:
+                    continue
+            else:
+                # Detenido antes de encolar: liberar el turno de esta frase
+                self._deliver(utterance_id, [])
+                return
+        self._count("captured")
+        depth = audio_queue.qsize()
+        self.metrics.set("queue_depth", depth)
+        with self._stats_lock:
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], depth)
+
+    def _worker(self, audio_queue, stop_event):
+        while True:
+            item = audio_queue.get()
+            if item is None:
+                break
+            utterance_id, audio, enqueued, captured_at = item
+            self.metrics.observe("queue", time.perf_counter() - enqueued)
+            self.metrics.set("queue_depth", audio_queue.qsize())
+            if stop_event.is_set():
+                self._deliver(utterance_id, [])
+            else:
+                self._process(utterance_id, audio, captured_at)
+
+    def _process(self, utterance_id, audio, captured_at):
+        self.emit(VoiceEvent(EVENT_PROCESSING, utterance_id=utterance_id))
+        text = None
+        device = getattr(audio, "device", None)
+        started = time.perf_counter()
+        try:
+            if self.preprocess is not None:
+                with self.metrics.span("preprocess"):
+                    audio = self.preprocess(audio)
+            with self.metrics.span("recognition"):
+                text = self.recognize(audio)
+        except sr.UnknownValueError:
+            self._count("not_understood")
+            events = [VoiceEvent(EVENT_NOT_UNDERSTOOD, utterance_id=utterance_id)]
+        except Exception as e:
+            self._count("errors")
+            events = [VoiceEvent(EVENT_ERROR, error=e, utterance_id=utterance_id)]
+        else:
+            latency = time.perf_counter() - started
+            if self.dedup is not None and self.dedup.is_duplicate(text, device, captured_at):
+                self._count("duplicates")
+                events = [VoiceEvent(EVENT_DUPLICATE, text=text, utterance_id=utterance_id,
+                                     latency=latency, device=device)]
+            else:
+                events = [VoiceEvent(EVENT_TEXT, text=text, utterance_id=utterance_id, latency=latency,
+                                     device=device)]
+                events.extend(self._command_events(text, utterance_id, latency, device, captured_at))
+        self._count("processed")
+        self._deliver(utterance_id, events)
+        return text
+
+    def _command_events(self, text, utterance_id, latency=None, device=None, captured_at=None):
+        if self.command_matcher is None:
+            return []
+        # El buscador puede devolver el comando o un objeto con .command (CommandMatch)
+        with self.metrics.span("match"):
+            match = self.command_matcher(text)
+        command = getattr(match, "command", match)
+        if captured_at is None:
+            captured_at = time.time()
+        if command:
+            self.metrics.inc("commands")
+            priority = bool(self.priority and self.priority(command))
+            deadline = None
+            if self.command_deadline is not None and not priority:
+                deadline = captured_at + self.command_deadline
+            return [VoiceEvent(EVENT_COMMAND, text=text, command=command, utterance_id=utterance_id,
+                               match=match, latency=latency, device=device, captured_at=captured_at,
+                               deadline=deadline, priority=priority)]
+        return [VoiceEvent(EVENT_NO_COMMAND, text=text, utterance_id=utterance_id, latency=latency,
+                           device=device, captured_at=captured_at)]
+
+    def _deliver(self, utterance_id, events):
+        """Entrega los eventos de una frase respetando el orden de captura.
+
+        Los comandos prioritarios salen en el acto; los demás esperan su
+        turno y, si en ese momento ya vencieron, se emiten como EVENT_EXPIRED.
+        """
+        with self._order_lock:
+            urgent = [event for event in events if event.priority]
+            for event in urgent:
+                self._count("priority")
+                self.emit(event)
+            if urgent:
+                events = [event for event in events if not event.priority]
+            self._pending[utterance_id] = events
+            ready = []
+            while self._next_to_emit in self._pending:
+                ready.append(self._pending.pop(self._next_to_emit))
+                self._next_to_emit += 1
+            # Emitir dentro del candado evita que otro hilo adelante sus eventos
+            now = time.time()
+            for events in ready:
+                for event in events:
+                    if event.kind == EVENT_COMMAND and event.deadline is not None and now > event.deadline:
+                        self._count("expired")
+                        event.kind = EVENT_EXPIRED
+                    self.emit(event)
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+        if name in METRIC_COUNTERS:
+            self.metrics.inc(METRIC_COUNTERS[name])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconocimiento de voz sin interfaz gráfica")
+    parser.add_argument("wav", nargs="*", help="Archivos de audio a procesar (sin archivos: micrófono)")
+    parser.add_argument("--language", default="es-ES")
+    parser.add_argument("--device-index", type=int, default=None)
+    parser.add_argument("--devices", type=int, nargs="+", metavar="N",
+                        help="Escuchar a la vez en varios micrófonos (índices)")
+    parser.add_argument("--processes", type=int, default=None,
+                        help="Reconocer en un grupo de N procesos (reconocedor 'pool')")
+    parser.add_argument("--dedup-window", type=float, default=1.5,
+                        help="Segundos para considerar duplicada una frase de otro micrófono")
+    parser.add_argument("--workers", type=int, default=2, help="Hilos de reconocimiento")
+    parser.add_argument("--backend", choices=sorted(BACKENDS), default=None,
+                        help="Reconocedor (por defecto VOZ_BACKEND o google)")
+    parser.add_argument("--cache", metavar="ARCHIVO", default=None,
+                        help="Caché de resultados en disco (SQLite) para repeticiones")
+    parser.add_argument("--preprocess", action="store_true",
+                        help="Recortar silencios y remuestrear antes de reconocer")
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache:
+        from recognition_cache import RecognitionCache
+        cache = RecognitionCache(path=args.cache)
+
+    recognizer = sr.Recognizer()
+    if args.processes:
+        inner = args.backend or os.environ.get("VOZ_BACKEND", DEFAULT_BACKEND)
+        backend = backend_from_config("pool", options={"backend": inner, "processes": args.processes},
+                                      recognizer=recognizer, language=args.language)
+    else:
+        backend = backend_from_config(args.backend, recognizer=recognizer, language=args.language)
+    preprocess = None
+    if args.preprocess:
+        from audio_preprocess import AudioPreprocessor
+        preprocess = AudioPreprocessor.for_backend(backend)
+    dedup = None
+    if args.devices:
+        from multi_mic import CrossMicDeduplicator
+        dedup = CrossMicDeduplicator(window=args.dedup_window)
+    workers = max(args.workers, args.processes or 0)
+    engine = VoiceEngine(recognizer=recognizer, language=args.language, recognize=backend,
+                         workers=workers, cache=cache, preprocess=preprocess, dedup=dedup)
+    engine.subscribe("*", lambda event: print(f"[{time.strftime('%H:%M:%S')}] {event}"))
+
+    if args.wav:
+        source = WavFileSource(args.wav)
+    elif args.devices:
+        from multi_mic import MultiMicrophoneSource
+        names = sr.Microphone.list_microphone_names()
+        source = MultiMicrophoneSource({index: names[index] if index < len(names) else f"#{index}"
+                                        for index in args.devices}, queue_size=8 * len(args.devices))
+    else:
+        source = MicrophoneSource(device_index=args.device_index)
+
+    start = time.perf_counter()
+    try:
+        engine.run(source)
+    except KeyboardInterrupt:
+        engine.stop()
+    elapsed = time.perf_counter() - start
+    print(f"Frases procesadas: {engine.utterance_count} en {elapsed:.2f} s")
+    print(f"Estadísticas: {engine.stats()}")
+    if hasattr(backend, "report"):
+        for name, stats in backend.report().items():
+            print(f"Reconocedor {name}: {stats}")
+    if preprocess is not None:
+        report = preprocess.report()
+        print(f"Preprocesado: {report['bytes_saved']} bytes y {report['seconds_saved']:.2f} s ahorrados "
+              f"({report['ratio']:.0%} del tamaño original)")
+    if cache is not None:
+        print(f"Caché: {cache.stats} (aciertos {cache.hit_rate():.0%})")
+        cache.close()
+    if hasattr(backend, "close"):
+        backend.close()
+
+
+if __name__ == "__main__":
+    main()